@@ -1,51 +1,115 @@
+import asyncio
 import os
+from contextlib import contextmanager
 from pathlib import Path
-from openai import OpenAI
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+from openai import OpenAI, DefaultHttpxClient
+from typing import Optional, Dict, Any, BinaryIO, Callable, Iterable, Iterator, List, TypeVar, Union
 from uuid import uuid4
 from .utils.logger import setup_logger
 from .models.batch_entity import BatchResponse
+from .utils.metrics import instrumented_provider_call, count_http_request
+from .utils.jsonl_generator import CHAT_COMPLETIONS_ENDPOINT
+from .services.key_pool import KeyPool
+from .repositories.provider_resource_repository import ProviderResourceRepository
+
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+T = TypeVar("T")
 
 
 class BatchProcessor:
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         """
         初始化BatchProcessor
         
         Args:
-            api_key: API密钥，如果为None则从环境变量获取
-            base_url: API基础URL
-        """
-        load_dotenv()
-        self.client = OpenAI(
-            api_key=api_key or os.getenv("DASHSCOPE_API_KEY"),
-            base_url=base_url
-        )
+            api_key: API密钥，如果为None则从环境变量 DASHSCOPE_API_KEYS（逗号分隔，多个密钥组成密钥池）
+                     或 DASHSCOPE_API_KEY 获取
+            base_url: API基础URL，如果为None则从环境变量 DASHSCOPE_BASE_URL 获取，
+                      可指向本地模拟服务（app.mock.dashscope_server）
+        """
+        self.key_pool = KeyPool.from_env(api_key)
+        base_url = base_url or os.getenv("DASHSCOPE_BASE_URL") or DEFAULT_BASE_URL
+        self.clients: Dict[str, OpenAI] = {
+            key_id: OpenAI(
+                api_key=key,
+                base_url=base_url,
+                # 统计客户端内部重试次数
+                http_client=DefaultHttpxClient(event_hooks={"request": [count_http_request]})
+            )
+            for key_id, key in self.key_pool.keys.items()
+        }
+        # 主密钥的客户端，未绑定密钥的旧资源使用它
+        self.client = self.clients[self.key_pool.primary]
+        self.resource_repository = ProviderResourceRepository()
         self.logger = setup_logger(__name__)
 
-    async def upload_file(self, file_path: str) -> str:
+    def key_for(self, resource_id: str) -> str:
+        """文件或批处理所属的密钥，没有记录时为主密钥"""
+        key_id = self.resource_repository.key_for(resource_id) or self.key_pool.primary
+        if key_id not in self.clients:
+            raise ValueError(f"API key {key_id} owning {resource_id} is no longer configured")
+        return key_id
+
+    def client_for(self, resource_id: str) -> OpenAI:
+        return self.clients[self.key_for(resource_id)]
+
+    @contextmanager
+    def _using(self, key_id: str):
+        """使用指定密钥的客户端，调用失败时更新密钥的健康状态"""
+        try:
+            yield self.clients[key_id]
+        except Exception as e:
+            self.key_pool.report_error(key_id, e)
+            raise
+
+    def _known_key(self, key_id: Optional[str]) -> str:
+        key_id = key_id or self.key_pool.primary
+        if key_id not in self.clients:
+            raise ValueError(f"Unknown API key: {key_id}")
+        return key_id
+
+    @instrumented_provider_call
+    async def upload_file(self, file: Union[str, Path, BinaryIO], filename: Optional[str] = None) -> str:
         """
         异步上传文件
+
+        文件上传到在途批处理最少的健康密钥下，之后的批处理也创建在该密钥下。
         
         Args:
-            file_path: 要上传的文件路径
+            file: 要上传的文件路径，或已定位到开头的二进制文件对象（如内存缓冲区）
+            filename: 上传文件对象时使用的文件名
             
         Returns:
             str: 上传后的文件ID
         """
         try:
-            self.logger.info(f"Uploading file: {file_path}")
-            file_object = self.client.files.create(file=Path(file_path), purpose="batch")
-            self.logger.info(f"Upload response: {file_object}")
+            if len(self.key_pool.keys) > 1:
+                key_id = self.key_pool.select(self.resource_repository.active_usage_by_key())
+            else:
+                key_id = self.key_pool.primary
+            if isinstance(file, (str, Path)):
+                self.logger.info("Uploading file: %s (%s)", file, key_id)
+                upload = Path(file)
+            else:
+                self.logger.info("Uploading file from buffer: %s (%s)", filename, key_id)
+                upload = (filename or f"batch_input_{uuid4().hex}.jsonl", file)
+            with self._using(key_id) as client:
+                # 客户端是同步的，在线程中上传，避免阻塞事件循环
+                file_object = await asyncio.to_thread(client.files.create, file=upload, purpose="batch")
+            self.resource_repository.bind(file_object.id, "file", key_id)
+            self.logger.info("Uploaded file %s (%s bytes)", file_object.id, file_object.bytes)
+            self.logger.debug("Upload response: %s", file_object)
             return file_object.id
         except Exception as e:
             self.logger.error(f"Error uploading file: {str(e)}")
             raise
 
+    @instrumented_provider_call
     def create_batch(self, file_id: str) -> BatchResponse:
         """
-        创建批处理任务
+        创建批处理任务，使用输入文件所属的密钥
         
         Args:
             file_id: 文件ID
@@ -54,21 +118,68 @@ class BatchProcessor:
             BatchResponse: 批处理任务响应对象
         """
         try:
-            self.logger.info(f"Creating batch for file: {file_id}")
-            response = self.client.batches.create(
-                input_file_id=file_id,
-                completion_window="24h",
-                endpoint="/v1/chat/completions"
-            )
+            key_id = self.key_for(file_id)
+            self.logger.info("Creating batch for file: %s (%s)", file_id, key_id)
+            with self._using(key_id) as client:
+                response = client.batches.create(
+                    input_file_id=file_id,
+                    completion_window="24h",
+                    endpoint=CHAT_COMPLETIONS_ENDPOINT
+                )
+            self.resource_repository.bind(response.id, "batch", key_id)
             
             # 直接将响应转换为字典
             response_dict = response.model_dump()
-            self.logger.info(f"Batch creation response: {response_dict}")
+            self.logger.info("Created batch %s with status %s", response.id, response.status)
+            self.logger.debug("Batch creation response: %s", response_dict)
             return BatchResponse.from_json(response_dict)
         except Exception as e:
             self.logger.error(f"Error creating batch: {str(e)}")
             raise
     
+    @instrumented_provider_call
+    async def read_file(self, file_id: str) -> bytes:
+        """
+        读取文件内容到内存，不写入本地文件
+        
+        Args:
+            file_id: 文件ID
+            
+        Returns:
+            bytes: 文件内容
+        """
+        try:
+            self.logger.info("Reading file: %s", file_id)
+            with self._using(self.key_for(file_id)) as client:
+                response = await asyncio.to_thread(client.files.content, file_id)
+            return response.content
+        except Exception as e:
+            self.logger.error(f"Error reading file {file_id}: {str(e)}")
+            raise
+
+    @instrumented_provider_call
+    def stream_file(self, file_id: str, consume: Callable[[Iterator[bytes]], T], chunk_size: int = 1024 * 1024) -> T:
+        """
+        流式读取文件内容，不在内存中保存整个文件
+
+        Args:
+            file_id: 文件ID
+            consume: 接收内容分块迭代器的函数，在连接打开期间调用
+            chunk_size: 每块的字节数
+
+        Returns:
+            consume 的返回值
+        """
+        try:
+            self.logger.info("Streaming file: %s", file_id)
+            with self._using(self.key_for(file_id)) as client:
+                with client.files.with_streaming_response.content(file_id) as response:
+                    return consume(response.iter_bytes(chunk_size))
+        except Exception as e:
+            self.logger.error(f"Error streaming file {file_id}: {str(e)}")
+            raise
+
+    @instrumented_provider_call
     async def download_results(self, file_id: str, output_path: str) -> str:
         """
         下载文件
@@ -81,31 +192,30 @@ class BatchProcessor:
             str: 文件保存路径
         """
         try:
-            self.logger.info(f"Downloading file: {file_id}")
-            # 先获取文件信息
-            file_info = self.client.files.retrieve(file_id)
-            
-            # 获取文件内容
-            content = self.client.files.content(file_id)
-            
-            # 保存文件
-            content.write_to_file(output_path)
-            self.logger.info(f"Successfully downloaded file to: {output_path}")
+            self.logger.info("Downloading file: %s", file_id)
+            # 客户端是同步的，下载和写入文件都在线程中执行，避免阻塞事件循环
+            with self._using(self.key_for(file_id)) as client:
+                content = await asyncio.to_thread(client.files.content, file_id)
+            await asyncio.to_thread(content.write_to_file, output_path)
+            self.logger.info("Successfully downloaded file to: %s", output_path)
             return output_path
         except Exception as e:
             self.logger.error(f"Error downloading file {file_id}: {str(e)}")
             raise
 
+    @instrumented_provider_call
     async def download_errors(self, error_file_id, error_path="error.jsonl") -> str:
         """下载Batch任务失败结果"""
-        content = self.client.files.content(error_file_id)
+        with self._using(self.key_for(error_file_id)) as client:
+            content = await asyncio.to_thread(client.files.content, error_file_id)
         # 保存错误信息文件至本地
-        content.write_to_file(error_path)
+        await asyncio.to_thread(content.write_to_file, error_path)
         return error_path
 
+    @instrumented_provider_call
     def get_batch_status(self, batch_id: str) -> Dict[str, Any]:
         """
-        查询批处理任务状态
+        查询批处理任务状态，并记录结果文件和错误文件所属的密钥
         
         Args:
             batch_id: 批处理任务ID
@@ -113,21 +223,47 @@ class BatchProcessor:
         Returns:
             包含务状态信息的字典
         """
-        return self.client.batches.retrieve(batch_id)
+        key_id = self.key_for(batch_id)
+        with self._using(key_id) as client:
+            batch = client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                self.resource_repository.bind(file_id, "file", key_id)
+        return batch
 
-    def list_batches(self, after: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+    @instrumented_provider_call
+    def list_batches(self, after: Optional[str] = None, limit: int = 20,
+                     key_id: Optional[str] = None) -> Dict[str, Any]:
         """
         获取批处理任务列表
         
         Args:
             after: 上一页最后一个任务的ID
             limit: 每页返回的任务数量
+            key_id: 列出该密钥下的批处理，默认为主密钥
             
         Returns:
             包含任务列表的字典
         """
-        return self.client.batches.list(after=after, limit=limit)
+        key_id = self._known_key(key_id)
+        with self._using(key_id) as client:
+            return client.batches.list(after=after, limit=limit)
+
+    @instrumented_provider_call
+    def chat_completion(self, body: Dict[str, Any]):
+        """
+        实时调用 chat.completions 接口，在健康的密钥间轮询
+
+        Args:
+            body: 请求体，与批处理输入文件中每行的 body 相同
 
+        Returns:
+            ChatCompletion 对象
+        """
+        with self._using(self.key_pool.next_healthy()) as client:
+            return client.chat.completions.create(**body)
+
+    @instrumented_provider_call
     def cancel_batch(self, batch_id: str) -> Dict[str, Any]:
         """
         取消批处理任务
@@ -138,16 +274,32 @@ class BatchProcessor:
         Returns:
             包含取消任务信息的字典
         """
-        return self.client.batches.cancel(batch_id)
+        with self._using(self.key_for(batch_id)) as client:
+            return client.batches.cancel(batch_id)
     
+    @instrumented_provider_call
     def delete_file(self, file_id: str) -> Dict[str, Any]:
         """
         删除文件
         """
-        return self.client.files.delete(file_id)
+        with self._using(self.key_for(file_id)) as client:
+            return client.files.delete(file_id)
     
-    def file_list(self) -> Dict[str, Any]:
+    @instrumented_provider_call
+    def file_list(self, key_id: Optional[str] = None) -> Dict[str, Any]:
         """
-        获取文件列表
+        获取文件列表，默认为主密钥下的文件
         """
-        return self.client.files.list()
+        key_id = self._known_key(key_id)
+        with self._using(key_id) as client:
+            return client.files.list()
+
+    def forget(self, resource_ids: Iterable[Optional[str]]) -> None:
+        """删除文件和批处理的密钥绑定（任务删除后不再访问这些资源）"""
+        resource_ids = [resource_id for resource_id in resource_ids if resource_id]
+        if resource_ids:
+            self.resource_repository.delete_many(resource_ids)
+
+    def key_status(self) -> List[dict]:
+        """各密钥的健康状态和在途用量"""
+        return self.key_pool.status(self.resource_repository.active_usage_by_key())
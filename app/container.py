@@ -0,0 +1,60 @@
+"""
+应用依赖容器
+
+服务、服务商客户端和调度器在首次使用时才创建，进程内共享一份：所有控制器和调度器使用同一个
+TaskService 和 BatchProcessor（即同一组 OpenAI 客户端）。创建容器本身没有副作用，
+导入 app.main 或在测试中构造应用都不会连接数据库或服务商。
+
+路由通过 FastAPI 依赖（get_task_service 等）从 app.state.container 取得服务，
+测试可以替换容器或使用 app.dependency_overrides。
+"""
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+from fastapi import Request
+
+if TYPE_CHECKING:
+    from .api_batch import BatchProcessor
+    from .schedulers.batch_scheduler import BatchScheduler
+    from .services.stats_service import StatsService
+    from .services.task_service import TaskService
+
+
+class Container:
+    # 服务模块在属性中导入，导入 openai 等较重的依赖推迟到第一次使用时
+
+    @cached_property
+    def batch_processor(self) -> "BatchProcessor":
+        from .api_batch import BatchProcessor
+        return BatchProcessor()
+
+    @cached_property
+    def task_service(self) -> "TaskService":
+        from .services.task_service import TaskService
+        return TaskService(batch_processor=self.batch_processor)
+
+    @cached_property
+    def stats_service(self) -> "StatsService":
+        from .services.stats_service import StatsService
+        return StatsService()
+
+    @cached_property
+    def scheduler(self) -> "BatchScheduler":
+        from .schedulers.batch_scheduler import BatchScheduler
+        return BatchScheduler(task_service=self.task_service)
+
+
+def get_container(request: Request) -> Container:
+    return request.app.state.container
+
+
+def get_task_service(request: Request) -> "TaskService":
+    return get_container(request).task_service
+
+
+def get_batch_processor(request: Request) -> "BatchProcessor":
+    return get_container(request).batch_processor
+
+
+def get_stats_service(request: Request) -> "StatsService":
+    return get_container(request).stats_service
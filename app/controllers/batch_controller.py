@@ -1,6 +1,6 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, Optional
-from ..api_batch import BatchProcessor, BatchResponse
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Dict, Any, List, Optional
+from ..container import get_batch_processor
 from ..utils.logger import setup_logger
 import os
 from pathlib import Path
@@ -14,17 +14,27 @@ class BatchController:
             prefix="/api/batch",
             tags=["batch"]
         )
-        self.batch_processor = BatchProcessor()
         self.logger = setup_logger(__name__)
         self.register_routes()
 
     def register_routes(self):
+        @self.router.get("/keys")
+        async def list_keys(batch_processor=Depends(get_batch_processor)) -> List[Dict[str, Any]]:
+            """服务商密钥池中各密钥的健康状态和在途用量（只返回密钥指纹）"""
+            try:
+                return batch_processor.key_status()
+            except Exception as e:
+                self.logger.error(f"Error listing API keys: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
         @self.router.get("/list")
-        async def list_batches(after: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
-            """获取批处理任务列表"""
+        async def list_batches(after: Optional[str] = None, limit: int = 20,
+                               key_id: Optional[str] = None,
+                               batch_processor=Depends(get_batch_processor)) -> Dict[str, Any]:
+            """获取批处理任务列表，key_id 指定密钥池中的密钥，默认为主密钥"""
             try:
-                self.logger.info(f"Fetching batch list with after={after}, limit={limit}")
-                response = self.batch_processor.list_batches(after=after, limit=limit)
+                self.logger.info(f"Fetching batch list with after={after}, limit={limit}, key_id={key_id}")
+                response = batch_processor.list_batches(after=after, limit=limit, key_id=key_id)
                 
                 # 将 SyncCursorPage 对象转换为字典格式
                 result = {
@@ -37,16 +47,18 @@ class BatchController:
                 
                 self.logger.info(f"Successfully retrieved {len(result['data'])} batches")
                 return result
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
             except Exception as e:
                 self.logger.error(f"Error listing batches: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.delete("/batches/{batch_id}")
-        async def delete_batch(batch_id: str) -> Dict[str, Any]:
+        async def delete_batch(batch_id: str, batch_processor=Depends(get_batch_processor)) -> Dict[str, Any]:
             """删除批处理任务"""
             try:
                 self.logger.info(f"Deleting batch: {batch_id}")
-                response = self.batch_processor.cancel_batch(batch_id)
+                response = batch_processor.cancel_batch(batch_id)
                 # 将 Batch 对象转换为字典
                 result = response.model_dump()
                 self.logger.info(f"Successfully cancelled batch: {batch_id}")
@@ -56,11 +68,12 @@ class BatchController:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.get("/files")
-        async def list_files() -> Dict[str, Any]:
-            """获取文件列表"""
+        async def list_files(key_id: Optional[str] = None,
+                             batch_processor=Depends(get_batch_processor)) -> Dict[str, Any]:
+            """获取文件列表，key_id 指定密钥池中的密钥，默认为主密钥"""
             try:
-                self.logger.info("Fetching file list")
-                response = self.batch_processor.file_list()
+                self.logger.info(f"Fetching file list with key_id={key_id}")
+                response = batch_processor.file_list(key_id=key_id)
                 
                 # 将 SyncCursorPage[FileObject] 对象转换为字典格式
                 result = {
@@ -71,16 +84,18 @@ class BatchController:
                 
                 self.logger.info(f"Successfully retrieved {len(result['data'])} files")
                 return result
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
             except Exception as e:
                 self.logger.error(f"Error listing files: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.delete("/files/{file_id}")
-        async def delete_file(file_id: str):
+        async def delete_file(file_id: str, batch_processor=Depends(get_batch_processor)):
             """删除文件"""
             try:
                 self.logger.info(f"Deleting file: {file_id}")
-                response = self.batch_processor.delete_file(file_id)
+                response = batch_processor.delete_file(file_id)
                 self.logger.info(f"Successfully deleted file: {file_id}")
                 # 将 FileDeleted 对象转换为字典
                 return {
@@ -93,7 +108,7 @@ class BatchController:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.get("/files/{file_id}/download")
-        async def download_file(file_id: str) -> StreamingResponse:
+        async def download_file(file_id: str, batch_processor=Depends(get_batch_processor)) -> StreamingResponse:
             """下载文件"""
             try:
                 self.logger.info(f"Downloading file: {file_id}")
@@ -103,14 +118,14 @@ class BatchController:
                 downloads_dir.mkdir(exist_ok=True)
                 
                 # 先获取文件信息以确定文件名和类型
-                file_info = self.batch_processor.client.files.retrieve(file_id)
+                file_info = batch_processor.client_for(file_id).files.retrieve(file_id)
                 filename = file_info.filename or f"{file_id}.jsonl"
                 
                 output_path = downloads_dir / filename
                 
                 # 下载文件
                 try:
-                    file_path = await self.batch_processor.download_results(file_id, str(output_path))
+                    file_path = await batch_processor.download_results(file_id, str(output_path))
                 except Exception as e:
                     self.logger.error(f"Download failed: {str(e)}")
                     if "406" in str(e):
@@ -154,11 +169,11 @@ class BatchController:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.get("/batches/{batch_id}")
-        async def get_batch_status(batch_id: str) -> Dict[str, Any]:
+        async def get_batch_status(batch_id: str, batch_processor=Depends(get_batch_processor)) -> Dict[str, Any]:
             """获取批处理任务状态"""
             try:
                 self.logger.info(f"Fetching batch status: {batch_id}")
-                response = self.batch_processor.get_batch_status(batch_id)
+                response = batch_processor.get_batch_status(batch_id)
                 # 将 Batch 对象转换为字典
                 result = response.model_dump()
                 self.logger.info(f"Successfully retrieved status for batch: {batch_id}")
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse
+from typing import Any, Dict
+
+from ..utils.logger import setup_logger
+from ..utils.profiling import SamplingProfiler
+
+
+class DebugController:
+    """性能分析接口，只在 PROFILING_ENABLED 开启时注册"""
+
+    def __init__(self):
+        self.router = APIRouter(
+            prefix="/api/debug",
+            tags=["debug"]
+        )
+        self.logger = setup_logger(__name__)
+        self.register_routes()
+
+    def register_routes(self):
+        @self.router.post("/profile")
+        async def start_profile(
+            seconds: float = Query(30, gt=0, le=SamplingProfiler.max_seconds),
+            interval_ms: float = Query(10, ge=1, le=1000)
+        ) -> Dict[str, Any]:
+            """开始采样 seconds 秒，结束后生成 collapsed stack 文件"""
+            try:
+                return SamplingProfiler(seconds, interval_ms).start().status()
+            except RuntimeError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        @self.router.get("/profile")
+        async def list_profiles() -> Dict[str, Any]:
+            """当前进行中的分析和已生成的文件"""
+            current = SamplingProfiler.current()
+            return {
+                "running": current.status() if current else None,
+                "profiles": SamplingProfiler.list_profiles(),
+            }
+
+        @self.router.get("/profile/{name}")
+        async def download_profile(name: str) -> FileResponse:
+            """下载分析结果，可用 flamegraph.pl 或 speedscope 打开"""
+            try:
+                path = SamplingProfiler.profile_path(name)
+            except ValueError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            return FileResponse(path, media_type="text/plain; charset=utf-8", filename=name)
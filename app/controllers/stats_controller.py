@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import Any, Dict, Optional
+
+from ..container import get_stats_service
+from ..utils.logger import setup_logger
+
+
+class StatsController:
+    def __init__(self):
+        self.router = APIRouter(
+            prefix="/api/stats",
+            tags=["stats"]
+        )
+        self.logger = setup_logger(__name__)
+        self.register_routes()
+
+    def register_routes(self):
+        @self.router.get("/latency")
+        async def latency(hours: int = Query(24, ge=1, le=24 * 90),
+                          stats_service=Depends(get_stats_service)) -> Dict[str, Any]:
+            """各阶段耗时的 p50/p95，用于判断瓶颈在服务商排队还是本地流程"""
+            try:
+                return stats_service.latency_stats(hours)
+            except Exception as e:
+                self.logger.error(f"Error computing latency stats: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @self.router.get("/usage")
+        async def usage(days: int = Query(30, ge=1, le=366), model: Optional[str] = None,
+                        stats_service=Depends(get_stats_service)) -> Dict[str, Any]:
+            """最近 days 天按天和模型汇总的 token 用量和费用"""
+            try:
+                return stats_service.usage_stats(days, model)
+            except Exception as e:
+                self.logger.error(f"Error computing usage stats: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @self.router.get("/usage/{task_id}")
+        async def task_usage(task_id: str, stats_service=Depends(get_stats_service)) -> Dict[str, Any]:
+            """任务（含其重试任务）的 token 用量和费用"""
+            try:
+                return stats_service.task_usage(task_id)
+            except ValueError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            except Exception as e:
+                self.logger.error(f"Error getting task usage: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @self.router.get("/timeline/{task_id}")
+        async def task_timeline(task_id: str, stats_service=Depends(get_stats_service)) -> Dict[str, Any]:
+            """获取任务的时间线"""
+            try:
+                return stats_service.task_timeline(task_id)
+            except ValueError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            except Exception as e:
+                self.logger.error(f"Error getting timeline: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
@@ -1,13 +1,19 @@
-from fastapi import APIRouter, HTTPException, Body, UploadFile, File, Request, Form
-from typing import List, Optional
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Body, UploadFile, File, Request, Response, Form, Header, Query, Depends
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from pydantic import BaseModel, Field
 from pathlib import Path
 import aiofiles
+import asyncio
+from uuid import uuid4
 
-from ..api_batch import BatchProcessor
-from ..services.task_service import TaskService
+from ..container import get_task_service
 from ..models.task_entity import Task
 from ..utils.logger import setup_logger
+from ..utils.http_cache import make_etag, is_not_modified, not_modified, cache_headers
+from ..utils.variables_file import detect_format
+from ..utils.export_formats import EXPORT_FORMATS, check_format, encode_rows
 import os
 
 class ContentRequest(BaseModel):
@@ -16,12 +22,41 @@ class ContentRequest(BaseModel):
 class TaskCreateRequest(BaseModel):
     content: str
     system_prompt: Optional[str] = None
+    # 交互式任务直接调用实时接口，不走批处理
+    interactive: bool = False
+    # 提交队列按优先级（越大越先）和期望完成时间调度
+    priority: int = 0
+    deadline: Optional[datetime] = None
+    # 不指定时使用默认模型（DEFAULT_MODEL），生成参数不指定时由服务商决定
+    model: Optional[str] = None
+    max_tokens: Optional[int] = Field(default=None, gt=0)
+    temperature: Optional[float] = Field(default=None, ge=0, lt=2)
 
     class Config:
         json_schema_extra = {
             "example": {
                 "content": "Task content here",
-                "system_prompt": "You are a helpful assistant."
+                "system_prompt": "You are a helpful assistant.",
+                "interactive": False,
+                "priority": 0,
+                "deadline": None,
+                "model": "qwen-turbo",
+                "max_tokens": None,
+                "temperature": None
+            }
+        }
+
+class BulkTaskRequest(BaseModel):
+    task_ids: Optional[List[str]] = None
+    status: Optional[str] = None
+    older_than_days: Optional[float] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "task_ids": None,
+                "status": "completed",
+                "older_than_days": 30
             }
         }
 
@@ -31,80 +66,188 @@ class TaskController:
             prefix="/api/task",
             tags=["task"]
         )
-        self.task_service = TaskService()
         self.logger = setup_logger(__name__)
         self.register_routes()
 
     def register_routes(self):
         @self.router.get("/get")
-        async def list_tasks() -> List[Task]:
+        async def list_tasks(request: Request, response: Response,
+                             task_service=Depends(get_task_service)) -> List[Task]:
             """获取所有任务"""
             try:
-                tasks = self.task_service.list_tasks()
+                etag = make_etag("tasks", task_service.get_tasks_version())
+                if is_not_modified(request, etag):
+                    return not_modified(etag)
+                response.headers.update(cache_headers(etag))
+                tasks = task_service.list_tasks()
                 return tasks
             except Exception as e:
                 self.logger.error(f"Error listing tasks: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.router.get("/export")
+        async def export_tasks(
+            task_ids: Optional[List[str]] = Query(None),
+            status: Optional[str] = None,
+            created_after: Optional[datetime] = None,
+            created_before: Optional[datetime] = None,
+            export_format: str = Query("jsonl.gz", alias="format"),
+            task_service=Depends(get_task_service)
+        ) -> StreamingResponse:
+            """
+            导出任务的输入、结果、用量和错误，每个请求一行
+
+            可按任务ID（可重复或逗号分隔）、状态和创建时间范围过滤，
+            format 为 jsonl.gz、csv 或 parquet（需要安装 pyarrow）。结果边查询边编码，流式返回。
+            """
+            try:
+                check_format(export_format)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if task_ids is not None:
+                task_ids = [task_id.strip() for value in task_ids for task_id in value.split(",") if task_id.strip()]
+
+            rows = task_service.iter_export_rows(task_ids, status, created_after, created_before)
+            media_type, extension = EXPORT_FORMATS[export_format]
+            filename = f"tasks-export-{datetime.now().strftime('%Y%m%d%H%M%S')}.{extension}"
+            # 同步生成器由 Starlette 在线程池中迭代，不阻塞事件循环
+            return StreamingResponse(
+                encode_rows(rows, export_format),
+                media_type=media_type,
+                headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+            )
+
+        @self.router.get("/search")
+        async def search_tasks(
+            q: str = Query(..., min_length=1),
+            limit: int = Query(20, ge=1, le=100),
+            offset: int = Query(0, ge=0),
+            task_service=Depends(get_task_service)
+        ) -> Dict[str, Any]:
+            """
+            在任务输入和模型输出中全文检索，按相关度排序分页返回
+
+            多个词以空格分隔，需要全部命中；每条结果包含任务ID、custom_id、命中的字段和摘要。
+            """
+            try:
+                return await asyncio.to_thread(task_service.search, q, limit, offset)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except Exception as e:
+                self.logger.error(f"Error searching tasks: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
         @self.router.get("/{task_id}")
-        async def get_task(task_id: str) -> Task:
+        async def get_task(task_id: str, request: Request, response: Response,
+                           task_service=Depends(get_task_service)) -> Task:
             """获取任务信息"""
-            task = self.task_service.get_task(task_id)
+            etag = self._task_etag(task_service, task_id, "task")
+            if is_not_modified(request, etag):
+                return not_modified(etag)
+            response.headers.update(cache_headers(etag))
+            task = task_service.get_task(task_id)
             if not task:
                 raise HTTPException(status_code=404, detail="Task not found")
             return task
 
         @self.router.post("/create")
-        async def create_single_task(request: TaskCreateRequest = Body(...)) -> Task:
-            """创建单个任务"""
+        async def create_single_task(
+            request: TaskCreateRequest = Body(...),
+            idempotency_key: Optional[str] = Header(default=None),
+            x_tenant_id: Optional[str] = Header(default=None),
+            task_service=Depends(get_task_service)
+        ) -> Task:
+            """
+            创建单个任务，可通过 Idempotency-Key 请求头避免重试时重复提交
+
+            租户（X-Tenant-Id 请求头）超出在途配额时任务进入提交队列，返回的 submission_state 为 queued。
+            """
             try:
-                self.logger.info(f"Received task creation request: {request}")
-                task = self.task_service.create_task(
+                self.logger.debug("Received task creation request: %d characters", len(request.content))
+                processed_task = await task_service.create_and_process_task(
                     request.content,
-                    system_prompt=request.system_prompt
+                    system_prompt=request.system_prompt,
+                    idempotency_key=idempotency_key,
+                    interactive=request.interactive,
+                    priority=request.priority,
+                    deadline=request.deadline,
+                    tenant=x_tenant_id,
+                    model=request.model,
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature
                 )
-                processed_task = await self.task_service.process_task(task.id)
-                self.logger.info(f"Created and processed task: {processed_task}")
+                self.logger.info("Created and processed task %s (batch_id: %s)", processed_task.id, processed_task.batch_id)
                 return processed_task
             except Exception as e:
                 self.logger.error(f"Error creating task: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.router.post("/bulk/cancel")
+        async def bulk_cancel_tasks(request: BulkTaskRequest = Body(...),
+                                    task_service=Depends(get_task_service)) -> dict:
+            """按任务ID列表、状态或创建时间批量取消任务"""
+            try:
+                outcomes = await task_service.bulk_cancel_tasks(**self._bulk_filters(request))
+                return self._bulk_summary(outcomes)
+            except HTTPException:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error bulk cancelling tasks: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @self.router.post("/bulk/delete")
+        async def bulk_delete_tasks(request: BulkTaskRequest = Body(...),
+                                    task_service=Depends(get_task_service)) -> dict:
+            """按任务ID列表、状态或创建时间批量删除任务"""
+            try:
+                outcomes = await task_service.bulk_delete_tasks(**self._bulk_filters(request))
+                return self._bulk_summary(outcomes)
+            except HTTPException:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error bulk deleting tasks: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
         @self.router.post("/{task_id}/cancel")
-        async def cancel_task(task_id: str) -> Task:
+        async def cancel_task(task_id: str, task_service=Depends(get_task_service)) -> Task:
             """取消任务"""
             try:
-                return await self.task_service.cancel_task(task_id)
+                return await task_service.cancel_task(task_id)
             except ValueError as e:
                 raise HTTPException(status_code=404, detail=str(e))
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.delete("/{task_id}/file")
-        async def delete_file(task_id: str) -> Task:
+        async def delete_file(task_id: str, task_service=Depends(get_task_service)) -> Task:
             """删除任务文件"""
             try:
-                return await self.task_service.delete_file(task_id)
+                return await task_service.delete_file(task_id)
             except ValueError as e:
                 raise HTTPException(status_code=404, detail=str(e))
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.get("/{task_id}/status")
-        async def check_status(task_id: str) -> Task:
+        async def check_status(task_id: str, request: Request, response: Response,
+                               task_service=Depends(get_task_service)) -> Task:
             """检查任务状态"""
+            etag = self._task_etag(task_service, task_id, "status")
+            if is_not_modified(request, etag):
+                return not_modified(etag)
+            response.headers.update(cache_headers(etag))
             try:
-                return await self.task_service.check_task_status(task_id)
+                return await task_service.check_task_status(task_id)
             except ValueError as e:
                 raise HTTPException(status_code=404, detail=str(e))
             except Exception as e:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.delete("/{task_id}")
-        async def delete_task(task_id: str) -> dict:
+        async def delete_task(task_id: str, task_service=Depends(get_task_service)) -> dict:
             """删除任务"""
             try:
-                await self.task_service.delete_task(task_id)
+                await task_service.delete_task(task_id)
                 return {"message": f"Task {task_id} deleted successfully"}
             except ValueError as e:
                 raise HTTPException(status_code=404, detail=str(e))
@@ -113,10 +256,10 @@ class TaskController:
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.get("/batches/{batch_id}")
-        async def get_batch_status(batch_id: str):
+        async def get_batch_status(batch_id: str, task_service=Depends(get_task_service)):
             """获取批处理详情"""
             try:
-                batch_info = self.task_service.get_batch_status(batch_id)
+                batch_info = task_service.get_batch_status(batch_id)
                 return batch_info
             except Exception as e:
                 self.logger.error(f"Error getting batch status: {str(e)}")
@@ -125,17 +268,22 @@ class TaskController:
         
 
         @self.router.get("/{task_id}/result")
-        async def get_task_result(task_id: str):
+        async def get_task_result(task_id: str, request: Request, response: Response,
+                                  task_service=Depends(get_task_service)):
             """获取任务结果"""
+            etag = self._task_etag(task_service, task_id, "result")
+            if is_not_modified(request, etag):
+                return not_modified(etag)
+            response.headers.update(cache_headers(etag))
             try:
-                task = self.task_service.get_task(task_id)
+                task = task_service.get_task(task_id)
                 if not task:
                     raise HTTPException(status_code=404, detail="Task not found")
                 
                 if not task.result:
                     raise HTTPException(status_code=404, detail="Task result not found")
                 
-                result_content = await self.task_service.get_task_result_content(task_id)
+                result_content = await task_service.get_task_result_content(task_id)
                 return result_content
                 
             except ValueError as e:
@@ -144,11 +292,83 @@ class TaskController:
                 self.logger.error(f"Error getting task result: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.router.get("/{task_id}/result/merged")
+        async def get_merged_result(task_id: str, task_service=Depends(get_task_service)) -> dict:
+            """获取任务及其自动重试任务合并后的逐行结果"""
+            try:
+                return await asyncio.to_thread(task_service.get_merged_results, task_id)
+            except ValueError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            except Exception as e:
+                self.logger.error(f"Error merging task results: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @self.router.post("/template")
+        async def create_template_tasks(
+            template: str = Form(...),
+            variables: UploadFile = File(...),
+            system_prompt: str = Form(default=None),
+            shard_rows: Optional[int] = Form(default=None, ge=1),
+            priority: int = Form(default=0),
+            deadline: Optional[datetime] = Form(default=None),
+            model: Optional[str] = Form(default=None),
+            max_tokens: Optional[int] = Form(default=None, gt=0),
+            temperature: Optional[float] = Form(default=None, ge=0, lt=2),
+            x_tenant_id: Optional[str] = Header(default=None),
+            task_service=Depends(get_task_service)
+        ) -> List[Task]:
+            """
+            用模板和变量文件（CSV 或 JSONL）批量创建任务
+
+            模板中用 {{name}} 引用变量文件的列，每 shard_rows 行生成一个批处理任务。
+            """
+            try:
+                detect_format(variables.filename or "")
+                suffix = Path(variables.filename).suffix.lower()
+                variables_dir = Path("variables")
+                variables_dir.mkdir(exist_ok=True)
+                variables_path = variables_dir / f"{uuid4()}{suffix}"
+                # 分块写入磁盘，不把整个变量文件读入内存
+                async with aiofiles.open(variables_path, 'wb') as f:
+                    while chunk := await variables.read(1024 * 1024):
+                        await f.write(chunk)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            try:
+                tasks = await task_service.create_template_tasks(
+                    template,
+                    str(variables_path),
+                    system_prompt=system_prompt,
+                    shard_rows=shard_rows,
+                    priority=priority,
+                    deadline=deadline,
+                    tenant=x_tenant_id,
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+                self.logger.info("Created %d template tasks from %s", len(tasks), variables.filename)
+                return tasks
+            except ValueError as e:
+                variables_path.unlink(missing_ok=True)
+                raise HTTPException(status_code=400, detail=str(e))
+            except Exception as e:
+                self.logger.error(f"Error creating template tasks: {str(e)}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+
         @self.router.post("/upload")
         async def upload_tasks(
             request: Request,
             files: List[UploadFile] = File(...),
-            system_prompt: str = Form(default=None)
+            system_prompt: str = Form(default=None),
+            priority: int = Form(default=0),
+            deadline: Optional[datetime] = Form(default=None),
+            model: Optional[str] = Form(default=None),
+            max_tokens: Optional[int] = Form(default=None, gt=0),
+            temperature: Optional[float] = Form(default=None, ge=0, lt=2),
+            x_tenant_id: Optional[str] = Header(default=None),
+            task_service=Depends(get_task_service)
         ) -> List[Task]:
             """从文件批量创建任务"""
             try:
@@ -156,50 +376,76 @@ class TaskController:
                 MAX_FILE_SIZE = 1 * 1024 * 1024  # 1MB in bytes
                 
                 all_tasks = []
-                temp_dir = Path("temp")
-                temp_dir.mkdir(exist_ok=True)
 
-                self.logger.info("=== Upload Task Debug Info ===")
-                self.logger.info(f"Received system_prompt: {system_prompt!r}")
-                self.logger.info(f"Files count: {len(files)}")
+                self.logger.info("Uploading %d files", len(files))
+                self.logger.debug("System prompt length: %d characters", len(system_prompt or ""))
                 
                 for file in files:
-                    self.logger.info(f"\nProcessing file: {file.filename}")
+                    self.logger.debug("Processing file: %s", file.filename)
                     
-                    # 读取文件内容并检查大小
-                    content = await file.read()
+                    # 读取文件内容并检查大小，最多多读一个字节即可判断是否超限；内容直接在内存中解码，不写入temp目录
+                    content = await file.read(MAX_FILE_SIZE + 1)
                     if len(content) > MAX_FILE_SIZE:
                         raise HTTPException(
                             status_code=400,
                             detail=f"File {file.filename} exceeds maximum size of 1MB"
                         )
                     
-                    file_path = temp_dir / file.filename
-                    async with aiofiles.open(file_path, 'wb') as f:
-                        await f.write(content)
+                    self.logger.debug("File size: %d bytes", len(content))
                     
-                    self.logger.info(f"File size: {os.path.getsize(file_path)} bytes")
-                    self.logger.info(f"Using system_prompt: {system_prompt}")
+                    file_content = content.decode('utf-8')
+                    self.logger.debug("Content length: %d characters", len(file_content))
                     
-                    async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                        file_content = await f.read()
-                        self.logger.info(f"Content length: {len(file_content)} characters")
-                        
-                        task = self.task_service.create_task(
-                            file_content,
-                            system_prompt=system_prompt
-                        )
-                        self.logger.info(f"Created task with ID: {task.id}")
-                        self.logger.info(f"Task system_prompt: {task.system_prompt!r}")
-                        batch_task  = await self.task_service.process_task(task.id)
-                        self.logger.info(f"Batch task batch_id: {batch_task.batch_id}")
-                        all_tasks.append(batch_task)
-                    
-                    file_path.unlink()
+                    task = task_service.create_task(
+                        file_content,
+                        system_prompt=system_prompt,
+                        priority=priority,
+                        deadline=deadline,
+                        tenant=x_tenant_id,
+                        model=model,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                    batch_task  = await task_service.submit_or_enqueue(task)
+                    self.logger.info("Created task %s from %s (batch_id: %s)",
+                                     batch_task.id, file.filename, batch_task.batch_id)
+                    all_tasks.append(batch_task)
 
-                self.logger.info(f"\nCreated {len(all_tasks)} tasks in total")
-                self.logger.info("=== End Upload Task Debug Info ===")
+                self.logger.info("Created %d tasks in total", len(all_tasks))
                 return all_tasks
             except Exception as e:
                 self.logger.error(f"Error uploading tasks: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
+
+    @staticmethod
+    def _bulk_filters(request: BulkTaskRequest) -> dict:
+        """将批量请求转换为筛选条件，至少需要一个条件以防误删全部任务"""
+        if request.task_ids is None and request.status is None and request.older_than_days is None:
+            raise HTTPException(status_code=400, detail="At least one of task_ids, status or older_than_days is required")
+        created_before = None
+        if request.older_than_days is not None:
+            created_before = datetime.now() - timedelta(days=request.older_than_days)
+        return {
+            "task_ids": request.task_ids,
+            "status": request.status,
+            "created_before": created_before
+        }
+
+    @staticmethod
+    def _bulk_summary(outcomes: List[dict]) -> dict:
+        """汇总批量操作结果"""
+        succeeded = sum(1 for outcome in outcomes if outcome["success"])
+        return {
+            "total": len(outcomes),
+            "succeeded": succeeded,
+            "failed": len(outcomes) - succeeded,
+            "results": outcomes
+        }
+
+    @staticmethod
+    def _task_etag(task_service, task_id: str, kind: str) -> str:
+        """根据任务版本号生成 ETag，任务不存在时返回404"""
+        version = task_service.get_task_version(task_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return make_etag(kind, task_id, version)
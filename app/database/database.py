@@ -1,13 +1,15 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from pathlib import Path
+import os
+import sqlite3
 
 # 获取项目根目录
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
-# 创建数据库文件路径
-DATABASE_URL = f"sqlite:///{BASE_DIR}/database.db"
+# 创建数据库文件路径，可通过环境变量 DATABASE_URL 覆盖（如基准测试使用独立数据库）
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR}/database.db")
 
 # 创建数据库引擎
 engine = create_engine(DATABASE_URL)
@@ -28,6 +30,42 @@ def get_db():
 
 # 创建所有表
 def create_tables():
+    # 导入模型以注册到 Base.metadata（应用启动时服务尚未创建，模型模块可能还没有被导入）
+    from ..models import database_models  # noqa: F401
     # 删除所有现有表并重新创建
     # Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    create_search_index()
+
+# 全文索引的分词器：trigram 支持中文等不以空格分词的文本做子串匹配（SQLite 3.34+），旧版本退回 unicode61
+SEARCH_TOKENIZER = "trigram" if sqlite3.sqlite_version_info >= (3, 34, 0) else "unicode61"
+
+# 创建 FTS5 全文索引表，rowid 对应 search_documents.id（SQLAlchemy 无法声明虚拟表）
+def create_search_index():
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(content, tokenize='{SEARCH_TOKENIZER}')"
+        ))
+
+# 为已存在的表补齐模型中新增的列（create_all 不会修改已有表）
+def add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True) 
\ No newline at end of file
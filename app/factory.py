@@ -1,6 +1,7 @@
 from .controllers.task_controller import TaskController
 from .controllers.batch_controller import BatchController
-from .schedulers.batch_scheduler import BatchScheduler
+from .controllers.stats_controller import StatsController
+from .controllers.debug_controller import DebugController
 
 class ApplicationFactory:
     @staticmethod
@@ -10,7 +11,11 @@ class ApplicationFactory:
     @staticmethod
     def create_batch_controller():
         return BatchController()
-    
+
+    @staticmethod
+    def create_stats_controller():
+        return StatsController()
+
     @staticmethod
-    def create_batch_scheduler():
-        return BatchScheduler()
\ No newline at end of file
+    def create_debug_controller():
+        return DebugController()
\ No newline at end of file
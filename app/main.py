@@ -1,27 +1,44 @@
-from fastapi import FastAPI, HTTPException
+# 启动时加载一次 .env，需要在导入其它模块之前，模块级读取的配置（如 DATABASE_URL）也能生效
+from dotenv import load_dotenv
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 from pathlib import Path
-from .schedulers.batch_scheduler import BatchScheduler
-from .controllers.task_controller import TaskController
 from .database.database import create_tables
+from .container import Container
+import asyncio
 from contextlib import asynccontextmanager
 from .factory import ApplicationFactory
+from .utils.json_codec import FastJSONResponse
+from .utils.metrics import render_metrics
+from .utils.jsonl_generator import shutdown_encoding_pool
+from .utils.profiling import profiling_enabled, RequestTimingMiddleware, LoopLagMonitor
 
 
-# 创建数据库表
-create_tables()
+# 性能分析为可选功能，开启后记录路由耗时、监测事件循环阻塞并提供 /api/debug 接口
+loop_lag_monitor = LoopLagMonitor() if profiling_enabled() else None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup：创建数据库表，服务和调度器在这里（或第一个请求时）才创建
+    if loop_lag_monitor:
+        loop_lag_monitor.start()
+    await asyncio.to_thread(create_tables)
+    container: Container = app.state.container
+    scheduler = container.scheduler
+    await scheduler.recover_submissions()
     scheduler.start()
     yield
     # Shutdown (if needed)
     scheduler.shutdown()
+    if loop_lag_monitor:
+        loop_lag_monitor.stop()
+    shutdown_encoding_pool()
 
 
 app = FastAPI(
@@ -30,8 +47,11 @@ app = FastAPI(
     version="1.0.0",
     docs_url=None,  # 禁用默认的 docs URL
     redoc_url=None,  # 禁用默认的 redoc URL
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
+# 依赖容器，其中的服务在第一次使用时创建，路由通过 FastAPI 依赖获取
+app.state.container = Container()
 
 # 添加 CORS 中间件
 app.add_middleware(
@@ -41,6 +61,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if profiling_enabled():
+    app.add_middleware(RequestTimingMiddleware)
 
 
 # 自定义 OpenAPI 和 Swagger UI 路由
@@ -67,19 +89,28 @@ async def get_openapi_endpoint():
 async def root():
     return RedirectResponse(url="/static/html/index.html")
 
+# Prometheus 指标
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 # 挂载静态文件目录
 static_dir = Path(__file__).resolve().parent.parent / "static"
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
-# 使用 ApplicationFactory 创建控制器和调度器
+# 使用 ApplicationFactory 创建控制器（只注册路由，不创建服务）
 factory = ApplicationFactory()
 task_controller = factory.create_task_controller()
 batch_controller = factory.create_batch_controller()
-scheduler = factory.create_batch_scheduler()
+stats_controller = factory.create_stats_controller()
 
 # 注册路由
 app.include_router(task_controller.router)
 app.include_router(batch_controller.router)
+app.include_router(stats_controller.router)
+if profiling_enabled():
+    app.include_router(factory.create_debug_controller().router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,389 @@
+"""
+本地模拟的 DashScope OpenAI 兼容接口，用于离线的端到端测试和压测
+
+实现 files（create、retrieve、content、list、delete）和
+batches（create、retrieve、list、cancel）以及 chat/completions 接口，模拟批处理状态推进、
+接口延迟、429/5xx 错误注入，以及输出文件和错误文件的生成。
+
+启动:
+    python -m app.mock.dashscope_server --port 8200 --latency-ms 50 --rate-limit-rate 0.05
+
+然后让 BatchProcessor 指向模拟服务:
+    DASHSCOPE_BASE_URL=http://127.0.0.1:8200/compatible-mode/v1 python -m app.main
+"""
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+
+from ..utils.json_codec import codec
+
+API_PREFIX = "/compatible-mode/v1"
+
+
+@dataclass
+class MockConfig:
+    """模拟服务配置，默认值可通过 MOCK_* 环境变量覆盖"""
+    # 每个接口的基础延迟和随机抖动（毫秒）
+    latency_ms: float = float(os.getenv("MOCK_LATENCY_MS", "0"))
+    jitter_ms: float = float(os.getenv("MOCK_JITTER_MS", "0"))
+    # 接口返回 429 和 5xx 的概率
+    rate_limit_rate: float = float(os.getenv("MOCK_RATE_LIMIT_RATE", "0"))
+    server_error_rate: float = float(os.getenv("MOCK_SERVER_ERROR_RATE", "0"))
+    # 批处理各阶段持续时间（秒）
+    validating_seconds: float = float(os.getenv("MOCK_VALIDATING_SECONDS", "1"))
+    in_progress_seconds: float = float(os.getenv("MOCK_IN_PROGRESS_SECONDS", "5"))
+    finalizing_seconds: float = float(os.getenv("MOCK_FINALIZING_SECONDS", "1"))
+    cancelling_seconds: float = float(os.getenv("MOCK_CANCELLING_SECONDS", "1"))
+    # 单条请求失败的概率，失败的请求写入错误文件
+    request_error_rate: float = float(os.getenv("MOCK_REQUEST_ERROR_RATE", "0"))
+    # 批处理整体过期的概率
+    expire_rate: float = float(os.getenv("MOCK_EXPIRE_RATE", "0"))
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockFile:
+    id: str
+    filename: str
+    purpose: str
+    content: bytes
+    created_at: int = field(default_factory=lambda: int(time.time()))
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "object": "file",
+            "bytes": len(self.content),
+            "created_at": self.created_at,
+            "filename": self.filename,
+            "purpose": self.purpose,
+            "status": "processed",
+            "status_details": None,
+        }
+
+
+@dataclass
+class MockBatch:
+    id: str
+    input_file_id: str
+    endpoint: str
+    completion_window: str
+    metadata: Optional[dict]
+    created_at: float = field(default_factory=time.time)
+    cancel_requested_at: Optional[float] = None
+    will_expire: bool = False
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    request_counts: Dict[str, int] = field(default_factory=lambda: {"total": 0, "completed": 0, "failed": 0})
+    finished: bool = False
+
+
+class MockDashScope:
+    """模拟服务的内存状态"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.files: Dict[str, MockFile] = {}
+        self.batches: Dict[str, MockBatch] = {}
+        self.lock = threading.Lock()
+
+    # ---------- 文件 ----------
+
+    def create_file(self, filename: str, purpose: str, content: bytes) -> MockFile:
+        mock_file = MockFile(id=f"file-batch-{uuid4().hex}", filename=filename, purpose=purpose, content=content)
+        with self.lock:
+            self.files[mock_file.id] = mock_file
+        return mock_file
+
+    def get_file(self, file_id: str) -> MockFile:
+        mock_file = self.files.get(file_id)
+        if mock_file is None:
+            raise HTTPException(status_code=404, detail=error_body("invalid_request_error", f"No such file: {file_id}"))
+        return mock_file
+
+    # ---------- 批处理 ----------
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str,
+                     metadata: Optional[dict]) -> MockBatch:
+        self.get_file(input_file_id)
+        batch = MockBatch(
+            id=f"batch_{uuid4()}",
+            input_file_id=input_file_id,
+            endpoint=endpoint,
+            completion_window=completion_window,
+            metadata=metadata,
+            will_expire=self.random.random() < self.config.expire_rate,
+        )
+        with self.lock:
+            self.batches[batch.id] = batch
+        return batch
+
+    def get_batch(self, batch_id: str) -> MockBatch:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail=error_body("invalid_request_error", f"No such batch: {batch_id}"))
+        return batch
+
+    def batch_to_dict(self, batch: MockBatch) -> dict:
+        """根据创建后经过的时间推算批处理状态"""
+        config = self.config
+        created = batch.created_at
+        in_progress_at = created + config.validating_seconds
+        finalizing_at = in_progress_at + config.in_progress_seconds
+        completed_at = finalizing_at + config.finalizing_seconds
+        now = time.time()
+
+        timestamps = {
+            "in_progress_at": None, "finalizing_at": None, "completed_at": None, "failed_at": None,
+            "expired_at": None, "cancelling_at": None, "cancelled_at": None,
+        }
+        if batch.cancel_requested_at is not None:
+            timestamps["cancelling_at"] = batch.cancel_requested_at
+            if now >= batch.cancel_requested_at + config.cancelling_seconds:
+                status = "cancelled"
+                timestamps["cancelled_at"] = batch.cancel_requested_at + config.cancelling_seconds
+            else:
+                status = "cancelling"
+        elif now < in_progress_at:
+            status = "validating"
+        elif now < finalizing_at:
+            status = "in_progress"
+            timestamps["in_progress_at"] = in_progress_at
+        elif now < completed_at:
+            status = "finalizing"
+            timestamps.update(in_progress_at=in_progress_at, finalizing_at=finalizing_at)
+        elif batch.will_expire:
+            status = "expired"
+            timestamps.update(in_progress_at=in_progress_at, expired_at=completed_at)
+            self._finish(batch, expired=True)
+        else:
+            status = "completed"
+            timestamps.update(in_progress_at=in_progress_at, finalizing_at=finalizing_at, completed_at=completed_at)
+            self._finish(batch, expired=False)
+
+        return {
+            "id": batch.id,
+            "object": "batch",
+            "endpoint": batch.endpoint,
+            "errors": None,
+            "input_file_id": batch.input_file_id,
+            "completion_window": batch.completion_window,
+            "status": status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "created_at": int(created),
+            "expires_at": int(created + 24 * 3600),
+            **{key: int(value) if value is not None else None for key, value in timestamps.items()},
+            "request_counts": dict(batch.request_counts),
+            "metadata": batch.metadata,
+        }
+
+    def _finish(self, batch: MockBatch, expired: bool) -> None:
+        """批处理结束时生成输出文件和错误文件，只执行一次"""
+        with self.lock:
+            if batch.finished:
+                return
+            batch.finished = True
+
+        output_lines: List[bytes] = []
+        error_lines: List[bytes] = []
+        input_file = self.files.get(batch.input_file_id)
+        lines = input_file.content.splitlines() if input_file else []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = codec.loads(line)
+            if expired:
+                error_lines.append(self._error_line(request, "batch_expired", "Request expired before completion"))
+            elif self.random.random() < self.config.request_error_rate:
+                error_lines.append(self._error_line(request, "rate_limit_exceeded", "Requests rate limit exceeded"))
+            else:
+                output_lines.append(self._output_line(request))
+
+        batch.request_counts = {
+            "total": len(output_lines) + len(error_lines),
+            "completed": len(output_lines),
+            "failed": len(error_lines),
+        }
+        if output_lines:
+            output_file = self.create_file(f"{batch.id}_output.jsonl", "batch_output", b"".join(output_lines))
+            batch.output_file_id = output_file.id
+        if error_lines:
+            error_file = self.create_file(f"{batch.id}_error.jsonl", "batch_output", b"".join(error_lines))
+            batch.error_file_id = error_file.id
+
+    def _output_line(self, request: dict) -> bytes:
+        return codec.dumps_bytes({
+            "id": uuid4().hex,
+            "custom_id": request.get("custom_id"),
+            "response": {
+                "status_code": 200,
+                "request_id": str(uuid4()),
+                "body": self.completion(request.get("body", {})),
+            },
+            "error": None,
+        }) + b"\n"
+
+    @staticmethod
+    def completion(body: dict) -> dict:
+        """生成 chat.completion 响应，回显提示词末尾"""
+        messages = body.get("messages", [])
+        prompt = "".join(str(message.get("content", "")) for message in messages)
+        answer = f"[mock] {prompt[-200:]}"
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(answer) // 4)
+        return {
+            "created": int(time.time()),
+            "usage": {
+                "completion_tokens": completion_tokens,
+                "prompt_tokens": prompt_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            "model": body.get("model"),
+            "id": f"chatcmpl-{uuid4()}",
+            "choices": [{
+                "finish_reason": "stop",
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+            }],
+            "object": "chat.completion",
+        }
+
+    def _error_line(self, request: dict, code: str, message: str) -> bytes:
+        return codec.dumps_bytes({
+            "id": uuid4().hex,
+            "custom_id": request.get("custom_id"),
+            "response": {
+                "status_code": 429 if code == "rate_limit_exceeded" else 400,
+                "request_id": str(uuid4()),
+                "body": error_body(code, message),
+            },
+            "error": {"code": code, "message": message},
+        }) + b"\n"
+
+
+def error_body(code: str, message: str) -> dict:
+    return {"error": {"code": code, "message": message, "type": code}}
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    """创建模拟服务应用"""
+    config = config or MockConfig()
+    state = MockDashScope(config)
+    app = FastAPI(title="Mock DashScope", docs_url=None, redoc_url=None)
+    app.state.mock = state
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        """模拟接口延迟和错误注入"""
+        delay = config.latency_ms + state.random.uniform(0, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        roll = state.random.random()
+        if roll < config.rate_limit_rate:
+            return JSONResponse(status_code=429, content=error_body("rate_limit_exceeded", "Requests rate limit exceeded"))
+        if roll < config.rate_limit_rate + config.server_error_rate:
+            return JSONResponse(status_code=503, content=error_body("service_unavailable", "Service temporarily unavailable"))
+        return await call_next(request)
+
+    @app.exception_handler(HTTPException)
+    async def http_error(request: Request, exc: HTTPException):
+        return JSONResponse(status_code=exc.status_code, content=exc.detail)
+
+    @app.post(f"{API_PREFIX}/files")
+    async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        content = await file.read()
+        return state.create_file(file.filename or "upload.jsonl", purpose, content).to_dict()
+
+    @app.get(f"{API_PREFIX}/files")
+    async def list_files():
+        return {"object": "list", "data": [f.to_dict() for f in state.files.values()], "has_more": False}
+
+    @app.get(f"{API_PREFIX}/files/{{file_id}}")
+    async def retrieve_file(file_id: str):
+        return state.get_file(file_id).to_dict()
+
+    @app.get(f"{API_PREFIX}/files/{{file_id}}/content")
+    async def file_content(file_id: str):
+        return Response(content=state.get_file(file_id).content, media_type="application/octet-stream")
+
+    @app.delete(f"{API_PREFIX}/files/{{file_id}}")
+    async def delete_file(file_id: str):
+        state.get_file(file_id)
+        with state.lock:
+            state.files.pop(file_id, None)
+        return {"id": file_id, "object": "file", "deleted": True}
+
+    @app.post(f"{API_PREFIX}/batches")
+    async def create_batch(request: Request):
+        payload = await request.json()
+        batch = state.create_batch(
+            payload["input_file_id"],
+            payload.get("endpoint", "/v1/chat/completions"),
+            payload.get("completion_window", "24h"),
+            payload.get("metadata"),
+        )
+        return state.batch_to_dict(batch)
+
+    @app.get(f"{API_PREFIX}/batches")
+    async def list_batches(after: Optional[str] = None, limit: int = 20):
+        batches = sorted(state.batches.values(), key=lambda b: b.created_at, reverse=True)
+        if after:
+            ids = [b.id for b in batches]
+            batches = batches[ids.index(after) + 1:] if after in ids else []
+        page = [state.batch_to_dict(b) for b in batches[:limit]]
+        return {
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(batches) > limit,
+        }
+
+    @app.get(f"{API_PREFIX}/batches/{{batch_id}}")
+    async def retrieve_batch(batch_id: str):
+        return state.batch_to_dict(state.get_batch(batch_id))
+
+    @app.post(f"{API_PREFIX}/batches/{{batch_id}}/cancel")
+    async def cancel_batch(batch_id: str):
+        batch = state.get_batch(batch_id)
+        if state.batch_to_dict(batch)["status"] in ("validating", "in_progress", "finalizing"):
+            batch.cancel_requested_at = time.time()
+        return state.batch_to_dict(batch)
+
+    @app.post(f"{API_PREFIX}/chat/completions")
+    async def chat_completions(request: Request):
+        return state.completion(await request.json())
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock DashScope OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    defaults = MockConfig()
+    for name, value in vars(defaults).items():
+        if name == "seed":
+            parser.add_argument("--seed", type=int, default=None)
+        else:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    args = parser.parse_args()
+
+    config = MockConfig(**{name: getattr(args, name) for name in vars(defaults)})
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, JSON
+from sqlalchemy import Column, String, DateTime, Date, JSON, Integer, Float
 from ..database.database import Base
 
 class TaskORM(Base):
@@ -15,6 +15,141 @@ class TaskORM(Base):
     batch_id = Column(String, nullable=True)
     error_message = Column(String, nullable=True)
     result = Column(JSON, nullable=True)
-    output_file_path = Column(String, nullable=True)
-    error_file_path = Column(String, nullable=True)
-    system_prompt = Column(String, nullable=True)
\ No newline at end of file
+    output_file_path = Column(String, nullable=True, index=True)
+    error_file_path = Column(String, nullable=True, index=True)
+    system_prompt = Column(String, nullable=True)
+    # 每次更新自增，用于生成 ETag
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # 客户端提供的幂等键，用于防止重试时重复创建任务
+    idempotency_key = Column(String, nullable=True, unique=True, index=True)
+    # 提交进度，见 SubmissionState
+    submission_state = Column(String, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    # 执行方式，见 TaskRoute，为空的旧数据均为批处理
+    route = Column(String, nullable=True)
+    # 重试任务指向被重试的任务，attempt 为重试次数（原始任务为 0）
+    parent_task_id = Column(String, nullable=True, index=True)
+    attempt = Column(Integer, nullable=False, default=0, server_default="0")
+    # 提交队列的调度依据：优先级越大越先提交，deadline 为期望拿到结果的时间
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
+    deadline = Column(DateTime, nullable=True)
+    # 租户（X-Tenant-Id 请求头），用于按租户限制在途批处理数和 token 数
+    tenant = Column(String, nullable=True, index=True)
+    estimated_tokens = Column(Integer, nullable=True)
+    # 模板任务只保存模板和变量文件路径，提交时再渲染变量文件中 [shard_start, shard_end) 的行
+    template = Column(String, nullable=True)
+    variables_path = Column(String, nullable=True, index=True)
+    shard_start = Column(Integer, nullable=True)
+    shard_end = Column(Integer, nullable=True)
+    # 请求使用的模型和生成参数，未设置的参数不写入请求
+    model = Column(String, nullable=True, index=True)
+    max_tokens = Column(Integer, nullable=True)
+    temperature = Column(Float, nullable=True)
+    # 完整的 content 和 system_prompt 保存在 BlobStore 中（按内容去重），对应列只保存预览
+    content_blob = Column(String, nullable=True, index=True)
+    system_prompt_blob = Column(String, nullable=True, index=True)
+
+class TaskTimelineORM(Base):
+    """任务生命周期各阶段的时间点，本地阶段由服务记录，provider_* 来自批处理详情"""
+    __tablename__ = "task_timelines"
+
+    task_id = Column(String, primary_key=True)
+    batch_id = Column(String, nullable=True, index=True)
+    accepted_at = Column(DateTime, nullable=True)
+    jsonl_written_at = Column(DateTime, nullable=True)
+    uploaded_at = Column(DateTime, nullable=True)
+    batch_created_at = Column(DateTime, nullable=True)
+    provider_created_at = Column(DateTime, nullable=True)
+    provider_in_progress_at = Column(DateTime, nullable=True)
+    provider_finalizing_at = Column(DateTime, nullable=True)
+    provider_completed_at = Column(DateTime, nullable=True)
+    provider_failed_at = Column(DateTime, nullable=True)
+    provider_expired_at = Column(DateTime, nullable=True)
+    completion_detected_at = Column(DateTime, nullable=True)
+    downloaded_at = Column(DateTime, nullable=True)
+    # 实时路由的任务：开始调用和调用完成的时间
+    realtime_started_at = Column(DateTime, nullable=True)
+    realtime_completed_at = Column(DateTime, nullable=True)
+    # 已计入 latency_aggregates 的时间，保证每个任务只统计一次
+    aggregated_at = Column(DateTime, nullable=True)
+
+class LatencyAggregateORM(Base):
+    """各阶段耗时按小时聚合的对数分桶直方图"""
+    __tablename__ = "latency_aggregates"
+
+    stage = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_ms = Column(Float, nullable=False, default=0)
+    # 桶序号 -> 数量，见 utils.latency_histogram
+    buckets = Column(JSON, nullable=False, default=dict)
+
+class SchedulerLeaseORM(Base):
+    """调度器租约，保证多个进程中只有一个运行后台轮询"""
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False)
+
+class TableVersionORM(Base):
+    """记录每张表的变更序号，用于列表接口的 ETag"""
+    __tablename__ = "table_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class ProviderResourceORM(Base):
+    """服务商文件和批处理所属的 API 密钥，后续查询、下载、取消和删除都使用同一个密钥"""
+    __tablename__ = "provider_resources"
+
+    resource_id = Column(String, primary_key=True)
+    # file 或 batch
+    kind = Column(String, nullable=False)
+    # 密钥指纹（见 KeyPool），不保存密钥本身
+    key_id = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+
+
+class UsageDailyORM(Base):
+    """按天和模型汇总的 token 用量，结果摄取时累加"""
+    __tablename__ = "usage_daily"
+
+    day = Column(Date, primary_key=True)
+    model = Column(String, primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+
+
+class UsageTaskORM(Base):
+    """每个任务（含重试任务）各模型的 token 用量，主键保证同一结果只计入一次"""
+    __tablename__ = "usage_by_task"
+
+    # 产生结果的任务
+    attempt_id = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    # 用量归属的任务，重试任务的用量归属于原任务
+    task_id = Column(String, nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+
+
+class SearchDocumentORM(Base):
+    """全文索引中的文档，id 即 FTS5 表 search_index 中对应行的 rowid"""
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True)
+    # 命中结果指向的任务，重试任务的结果归属于原任务
+    task_id = Column(String, nullable=False, index=True)
+    # 产生该文档的任务，重新索引时先删除它之前的文档
+    attempt_id = Column(String, nullable=False, index=True)
+    custom_id = Column(String, nullable=True)
+    # input 或 output
+    field = Column(String, nullable=False)
@@ -14,6 +14,23 @@ class TaskStatus(Enum):
     CANCELLING = 'cancelling'
     CANCELLED = 'cancelled'
 
+class SubmissionState(Enum):
+    """任务提交到服务商的进度，每一步完成后都会持久化"""
+    # 等待提交队列按优先级和配额调度，启动恢复时不会处理
+    QUEUED = 'queued'
+    PENDING = 'pending'
+    # 旧版本将输入文件写入temp目录后的状态，现在JSONL在内存中生成并直接上传
+    FILE_WRITTEN = 'file_written'
+    UPLOADED = 'uploaded'
+    BATCH_CREATED = 'batch_created'
+    # 实时路由的任务已执行完成，不创建批处理
+    EXECUTED = 'executed'
+
+class TaskRoute(Enum):
+    """任务的执行方式"""
+    BATCH = 'batch'
+    REALTIME = 'realtime'
+
 class Task(BaseModel):
     id: str
     status: str
@@ -29,6 +46,26 @@ class Task(BaseModel):
     system_prompt: Optional[str] = None
     output_file_id: Optional[str] = None
     error_file_id: Optional[str] = None
+    version: int = 0
+    idempotency_key: Optional[str] = None
+    submission_state: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    route: Optional[str] = None
+    parent_task_id: Optional[str] = None
+    attempt: int = 0
+    priority: int = 0
+    deadline: Optional[datetime] = None
+    tenant: Optional[str] = None
+    estimated_tokens: Optional[int] = None
+    template: Optional[str] = None
+    variables_path: Optional[str] = None
+    shard_start: Optional[int] = None
+    shard_end: Optional[int] = None
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    content_blob: Optional[str] = None
+    system_prompt_blob: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -47,6 +84,26 @@ class Task(BaseModel):
                 "error_file_path": None,
                 "system_prompt": None,
                 "output_file_id": None,
-                "error_file_id": None
+                "error_file_id": None,
+                "version": 0,
+                "idempotency_key": None,
+                "submission_state": SubmissionState.PENDING.value,
+                "updated_at": "2024-01-01T00:00:00",
+                "route": TaskRoute.BATCH.value,
+                "parent_task_id": None,
+                "attempt": 0,
+                "priority": 0,
+                "deadline": None,
+                "tenant": None,
+                "estimated_tokens": 8,
+                "template": None,
+                "variables_path": None,
+                "shard_start": None,
+                "shard_end": None,
+                "model": "qwen-turbo",
+                "max_tokens": None,
+                "temperature": None,
+                "content_blob": None,
+                "system_prompt_blob": None
             }
         } 
\ No newline at end of file
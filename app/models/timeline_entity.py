@@ -0,0 +1,65 @@
+from pydantic import BaseModel
+from typing import Dict, Optional
+from datetime import datetime
+
+# 统计的阶段：(名称, 开始时间字段, 结束时间字段)
+LATENCY_STAGES = (
+    ("jsonl", "accepted_at", "jsonl_written_at"),
+    ("upload", "jsonl_written_at", "uploaded_at"),
+    ("batch_create", "uploaded_at", "batch_created_at"),
+    ("provider_queue", "provider_created_at", "provider_in_progress_at"),
+    ("provider_run", "provider_in_progress_at", "provider_finalizing_at"),
+    ("provider_finalize", "provider_finalizing_at", "provider_completed_at"),
+    ("completion_detection", "provider_completed_at", "completion_detected_at"),
+    ("download", "completion_detected_at", "downloaded_at"),
+    ("end_to_end", "accepted_at", "downloaded_at"),
+    ("realtime_queue", "accepted_at", "realtime_started_at"),
+    ("realtime_call", "realtime_started_at", "realtime_completed_at"),
+)
+
+# 批处理详情中的时间戳字段 -> 时间线字段
+PROVIDER_TIMESTAMPS = {
+    "created_at": "provider_created_at",
+    "in_progress_at": "provider_in_progress_at",
+    "finalizing_at": "provider_finalizing_at",
+    "completed_at": "provider_completed_at",
+    "failed_at": "provider_failed_at",
+    "expired_at": "provider_expired_at",
+}
+
+
+class TaskTimeline(BaseModel):
+    task_id: str
+    batch_id: Optional[str] = None
+    accepted_at: Optional[datetime] = None
+    jsonl_written_at: Optional[datetime] = None
+    uploaded_at: Optional[datetime] = None
+    batch_created_at: Optional[datetime] = None
+    provider_created_at: Optional[datetime] = None
+    provider_in_progress_at: Optional[datetime] = None
+    provider_finalizing_at: Optional[datetime] = None
+    provider_completed_at: Optional[datetime] = None
+    provider_failed_at: Optional[datetime] = None
+    provider_expired_at: Optional[datetime] = None
+    completion_detected_at: Optional[datetime] = None
+    downloaded_at: Optional[datetime] = None
+    realtime_started_at: Optional[datetime] = None
+    realtime_completed_at: Optional[datetime] = None
+    aggregated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+    def stage_durations(self) -> Dict[str, float]:
+        """
+        已完成阶段的耗时（毫秒）
+
+        服务商时间戳与本机时钟可能存在偏差，跨时钟的阶段（如 completion_detection）
+        出现负值时按 0 计。
+        """
+        durations = {}
+        for stage, start_field, end_field in LATENCY_STAGES:
+            start, end = getattr(self, start_field), getattr(self, end_field)
+            if start and end:
+                durations[stage] = max((end - start).total_seconds() * 1000, 0.0)
+        return durations
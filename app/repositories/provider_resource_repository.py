@@ -0,0 +1,82 @@
+from ..models.database_models import ProviderResourceORM, TaskORM
+from ..database.database import SessionLocal
+from ..models.task_entity import SubmissionState
+from ..utils.metrics import timed_query
+from .task_repository import TaskRepository
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class ProviderResourceRepository:
+    chunk_size = 500
+
+    def __init__(self):
+        self.db = SessionLocal
+
+    @timed_query
+    def bind(self, resource_id: str, kind: str, key_id: str) -> None:
+        """记录资源所属的密钥，已有绑定时保持不变"""
+        db = self.db()
+        try:
+            if db.get(ProviderResourceORM, resource_id) is None:
+                db.add(ProviderResourceORM(resource_id=resource_id, kind=kind, key_id=key_id,
+                                           created_at=datetime.now()))
+                db.commit()
+        except IntegrityError:
+            # 其它进程已记录了同一资源
+            db.rollback()
+        finally:
+            db.close()
+
+    @timed_query
+    def key_for(self, resource_id: str) -> Optional[str]:
+        db = self.db()
+        try:
+            return db.query(ProviderResourceORM.key_id).filter(
+                ProviderResourceORM.resource_id == resource_id
+            ).scalar()
+        finally:
+            db.close()
+
+    @timed_query
+    def active_usage_by_key(self) -> Dict[str, Tuple[int, int]]:
+        """
+        统计各密钥在途的批处理数和估算 token 数
+
+        批处理总是创建在输入文件所属的密钥下，因此按输入文件的绑定统计。
+
+        Returns:
+            Dict[str, Tuple[int, int]]: 密钥 -> (批处理数, token 数)
+        """
+        db = self.db()
+        try:
+            rows = db.query(
+                ProviderResourceORM.key_id, func.count(TaskORM.id),
+                func.coalesce(func.sum(TaskORM.estimated_tokens), 0)
+            ).join(
+                ProviderResourceORM, ProviderResourceORM.resource_id == TaskORM.file_id
+            ).filter(
+                TaskORM.status.in_(TaskRepository.ACTIVE_STATUSES),
+                or_(
+                    TaskORM.batch_id.isnot(None),
+                    TaskORM.submission_state == SubmissionState.UPLOADED.value
+                )
+            ).group_by(ProviderResourceORM.key_id).all()
+            return {key_id: (batches, int(tokens)) for key_id, batches, tokens in rows}
+        finally:
+            db.close()
+
+    @timed_query
+    def delete_many(self, resource_ids: List[str]) -> None:
+        db = self.db()
+        try:
+            for start in range(0, len(resource_ids), self.chunk_size):
+                chunk = resource_ids[start:start + self.chunk_size]
+                db.query(ProviderResourceORM).filter(ProviderResourceORM.resource_id.in_(chunk)).delete(
+                    synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
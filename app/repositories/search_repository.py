@@ -0,0 +1,120 @@
+from ..models.database_models import SearchDocumentORM
+from ..database.database import SessionLocal, SEARCH_TOKENIZER
+from ..utils.metrics import timed_query
+from sqlalchemy import insert, or_, text
+from typing import Iterable, List, Optional, Tuple
+
+
+class SearchRepository:
+    chunk_size = 500
+    # 每次写入全文索引的文档数
+    insert_batch_size = 1000
+
+    def __init__(self):
+        self.db = SessionLocal
+
+    @staticmethod
+    def match_expression(query: str) -> str:
+        """
+        将用户输入转换为 FTS5 查询：按空白切分，每个词作为短语匹配，所有词都需要命中
+
+        Raises:
+            ValueError: 查询为空，或使用 trigram 分词时存在少于 3 个字符的词
+        """
+        terms = query.split()
+        if not terms:
+            raise ValueError("Search query is empty")
+        if SEARCH_TOKENIZER == "trigram" and any(len(term) < 3 for term in terms):
+            raise ValueError("Each search term must be at least 3 characters long")
+        return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+    @timed_query
+    def replace(self, task_id: str, attempt_id: str, documents: Iterable[Tuple[Optional[str], str, str]]) -> int:
+        """
+        写入 attempt_id 产生的文档，替换其之前写入的文档
+
+        删除和写入都按批提交，每个写事务只持有数据库写锁几毫秒，
+        索引大任务时不会阻塞调度器续约、任务创建等其它写入。
+
+        Args:
+            documents: (custom_id, 字段, 文本)
+
+        Returns:
+            int: 写入的文档数
+        """
+        db = self.db()
+        try:
+            self._delete_where(db, SearchDocumentORM.attempt_id == attempt_id)
+            count = 0
+            batch = []
+            # 生成文档（如从变量文件还原模板输入）时不持有事务
+            for document in documents:
+                batch.append(document)
+                if len(batch) >= self.insert_batch_size:
+                    count += self._insert(db, task_id, attempt_id, batch)
+                    batch = []
+            if batch:
+                count += self._insert(db, task_id, attempt_id, batch)
+            return count
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @timed_query
+    def search(self, query: str, limit: int, offset: int) -> List[dict]:
+        """按相关度（bm25）返回命中的文档，query 为 match_expression 的结果"""
+        db = self.db()
+        try:
+            rows = db.execute(text(
+                "SELECT d.task_id, d.custom_id, d.field, "
+                "snippet(search_index, 0, '[', ']', '...', 16) AS snippet, bm25(search_index) AS score "
+                "FROM search_index JOIN search_documents d ON d.id = search_index.rowid "
+                "WHERE search_index MATCH :query ORDER BY score LIMIT :limit OFFSET :offset"
+            ), {"query": query, "limit": limit, "offset": offset}).mappings().all()
+            return [dict(row) for row in rows]
+        finally:
+            db.close()
+
+    @timed_query
+    def delete_tasks(self, task_ids: List[str]) -> None:
+        """删除任务的文档，包括作为原任务或作为重试任务写入的文档"""
+        db = self.db()
+        try:
+            for start in range(0, len(task_ids), self.chunk_size):
+                chunk = task_ids[start:start + self.chunk_size]
+                self._delete_where(db, or_(SearchDocumentORM.task_id.in_(chunk),
+                                           SearchDocumentORM.attempt_id.in_(chunk)))
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _insert(db, task_id: str, attempt_id: str, batch: List[Tuple[Optional[str], str, str]]) -> int:
+        """在一个短事务中写入一批文档"""
+        db.execute(insert(SearchDocumentORM), [
+            {"task_id": task_id, "attempt_id": attempt_id, "custom_id": custom_id, "field": field}
+            for custom_id, field, _ in batch
+        ])
+        # 事务中持有写锁，其它进程不会插入，本 attempt 最新的 len(batch) 行即刚插入的文档（id 按插入顺序递增）
+        rowids = [row[0] for row in db.query(SearchDocumentORM.id).filter(
+            SearchDocumentORM.attempt_id == attempt_id
+        ).order_by(SearchDocumentORM.id.desc()).limit(len(batch)).all()]
+        rowids.reverse()
+        db.execute(text("INSERT INTO search_index (rowid, content) VALUES (:rowid, :content)"), [
+            {"rowid": rowid, "content": content} for rowid, (_, _, content) in zip(rowids, batch)
+        ])
+        db.commit()
+        return len(batch)
+
+    @staticmethod
+    def _delete_where(db, condition) -> None:
+        """按批删除文档，每批单独提交"""
+        ids = [row[0] for row in db.query(SearchDocumentORM.id).filter(condition).all()]
+        db.commit()
+        for start in range(0, len(ids), SearchRepository.chunk_size):
+            chunk = ids[start:start + SearchRepository.chunk_size]
+            db.execute(text(f"DELETE FROM search_index WHERE rowid IN ({','.join(map(str, chunk))})"))
+            db.query(SearchDocumentORM).filter(SearchDocumentORM.id.in_(chunk)).delete(synchronize_session=False)
+            db.commit()
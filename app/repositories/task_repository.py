@@ -1,12 +1,27 @@
-from ..models.database_models import TaskORM
+from ..models.database_models import TaskORM, TableVersionORM
 from ..database.database import SessionLocal
-from ..models.task_entity import Task
-from typing import List, Optional
+from ..models.task_entity import Task, TaskStatus, SubmissionState, TaskRoute
+from ..utils.metrics import timed_query
+from sqlalchemy import and_, or_, func
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 class TaskRepository:
+    # SQLite 单条语句的参数个数有限，批量操作时按此大小分块
+    chunk_size = 500
+    # 批处理尚未结束的状态
+    ACTIVE_STATUSES = [
+        TaskStatus.VALIDATING.value,
+        TaskStatus.IN_PROGRESS.value,
+        TaskStatus.FINALIZING.value,
+        TaskStatus.EXPIRING.value,
+        TaskStatus.CANCELLING.value,
+    ]
+
     def __init__(self):
         self.db = SessionLocal
 
+    @timed_query
     def create(self, task: Task) -> Task:
         db = self.db()
         try:
@@ -21,17 +36,39 @@ class TaskRepository:
                 error_message=task.error_message,
                 result=task.result,
                 output_file_path=task.output_file_path,
+                error_file_path=task.error_file_path,
                 system_prompt=task.system_prompt,
                 output_file_id=task.output_file_id,
-                error_file_id=task.error_file_id
+                error_file_id=task.error_file_id,
+                idempotency_key=task.idempotency_key,
+                submission_state=task.submission_state,
+                route=task.route,
+                parent_task_id=task.parent_task_id,
+                attempt=task.attempt,
+                priority=task.priority,
+                deadline=task.deadline,
+                tenant=task.tenant,
+                estimated_tokens=task.estimated_tokens,
+                template=task.template,
+                variables_path=task.variables_path,
+                shard_start=task.shard_start,
+                shard_end=task.shard_end,
+                model=task.model,
+                max_tokens=task.max_tokens,
+                temperature=task.temperature,
+                content_blob=task.content_blob,
+                system_prompt_blob=task.system_prompt_blob,
+                updated_at=datetime.now()
             )
             db.add(db_task)
+            self._bump_table_version(db)
             db.commit()
             db.refresh(db_task)
             return self.to_model(db_task)
         finally:
             db.close()
 
+    @timed_query
     def get(self, task_id: str) -> Optional[Task]:
         db = self.db()
         try:
@@ -40,6 +77,16 @@ class TaskRepository:
         finally:
             db.close()
 
+    @timed_query
+    def get_by_idempotency_key(self, idempotency_key: str) -> Optional[Task]:
+        db = self.db()
+        try:
+            db_task = db.query(TaskORM).filter(TaskORM.idempotency_key == idempotency_key).first()
+            return self.to_model(db_task) if db_task else None
+        finally:
+            db.close()
+
+    @timed_query
     def list_all(self) -> List[Task]:
         db = self.db()
         try:
@@ -48,13 +95,271 @@ class TaskRepository:
         finally:
             db.close()
 
+    @timed_query
+    def list_filtered(self, task_ids: Optional[List[str]] = None, status: Optional[str] = None,
+                      created_before: Optional[datetime] = None) -> List[Task]:
+        """按任务ID列表、状态和创建时间筛选任务"""
+        db = self.db()
+        try:
+            query = db.query(TaskORM)
+            if status:
+                query = query.filter(TaskORM.status == status)
+            if created_before:
+                query = query.filter(TaskORM.created_at < created_before)
+            if task_ids is None:
+                return [self.to_model(task) for task in query.all()]
+            tasks = []
+            for start in range(0, len(task_ids), self.chunk_size):
+                chunk = task_ids[start:start + self.chunk_size]
+                tasks.extend(self.to_model(task) for task in query.filter(TaskORM.id.in_(chunk)).all())
+            return tasks
+        finally:
+            db.close()
+
+    def iter_filtered(self, task_ids: Optional[List[str]] = None, status: Optional[str] = None,
+                      created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                      include_retries: bool = False, page_size: int = 200) -> Iterator[Task]:
+        """
+        按条件分页遍历任务（按创建时间排序），每页使用独立的会话，不会一次加载全部任务
+
+        Args:
+            include_retries: 是否包含自动重试创建的任务（其结果已合并到原任务中）
+        """
+        chunks = [None] if task_ids is None else [
+            task_ids[start:start + self.chunk_size] for start in range(0, len(task_ids), self.chunk_size)
+        ]
+        for chunk in chunks:
+            after = None
+            while True:
+                page = self._filtered_page(chunk, status, created_after, created_before,
+                                           include_retries, after, page_size)
+                yield from page
+                if len(page) < page_size:
+                    break
+                after = (page[-1].created_at, page[-1].id)
+
+    @timed_query
+    def _filtered_page(self, task_ids: Optional[List[str]], status: Optional[str],
+                       created_after: Optional[datetime], created_before: Optional[datetime],
+                       include_retries: bool, after: Optional[Tuple[datetime, str]], limit: int) -> List[Task]:
+        db = self.db()
+        try:
+            query = db.query(TaskORM)
+            if task_ids is not None:
+                query = query.filter(TaskORM.id.in_(task_ids))
+            if status:
+                query = query.filter(TaskORM.status == status)
+            if created_after:
+                query = query.filter(TaskORM.created_at >= created_after)
+            if created_before:
+                query = query.filter(TaskORM.created_at < created_before)
+            if not include_retries:
+                query = query.filter(TaskORM.parent_task_id.is_(None))
+            if after:
+                created_at, task_id = after
+                query = query.filter(or_(
+                    TaskORM.created_at > created_at,
+                    and_(TaskORM.created_at == created_at, TaskORM.id > task_id)
+                ))
+            rows = query.order_by(TaskORM.created_at, TaskORM.id).limit(limit).all()
+            return [self.to_model(row) for row in rows]
+        finally:
+            db.close()
+
+    @timed_query
+    def get_retry_child(self, task_id: str) -> Optional[Task]:
+        """获取重试该任务的任务"""
+        db = self.db()
+        try:
+            db_task = db.query(TaskORM).filter(TaskORM.parent_task_id == task_id).first()
+            return self.to_model(db_task) if db_task else None
+        finally:
+            db.close()
+
+    @timed_query
+    def list_incomplete_submissions(self, stale_before: Optional[datetime] = None) -> List[Task]:
+        """
+        获取提交过程未完成的任务，包括没有提交状态的旧任务
+
+        Args:
+            stale_before: 只返回在此时间之前最后更新的任务，避免接管其它进程正在进行的提交
+        """
+        db = self.db()
+        try:
+            query = db.query(TaskORM).filter(*self._incomplete_submission_filter())
+            if stale_before:
+                query = query.filter(
+                    or_(TaskORM.updated_at.is_(None), TaskORM.updated_at < stale_before)
+                )
+            db_tasks = query.order_by(TaskORM.created_at).all()
+            return [self.to_model(task) for task in db_tasks]
+        finally:
+            db.close()
+
+    @timed_query
+    def list_queued(self) -> List[Task]:
+        """获取等待提交队列调度的任务"""
+        db = self.db()
+        try:
+            db_tasks = db.query(TaskORM).filter(
+                TaskORM.submission_state == SubmissionState.QUEUED.value,
+                TaskORM.status.notin_([TaskStatus.FAILED.value, TaskStatus.CANCELLED.value])
+            ).all()
+            return [self.to_model(task) for task in db_tasks]
+        finally:
+            db.close()
+
+    @timed_query
+    def has_queued(self, tenant: Optional[str]) -> bool:
+        """租户是否有等待提交队列调度的任务"""
+        db = self.db()
+        try:
+            tenant_filter = TaskORM.tenant.is_(None) if tenant is None else TaskORM.tenant == tenant
+            query = db.query(TaskORM.id).filter(
+                TaskORM.submission_state == SubmissionState.QUEUED.value,
+                TaskORM.status.notin_([TaskStatus.FAILED.value, TaskStatus.CANCELLED.value]),
+                tenant_filter
+            )
+            return db.query(query.exists()).scalar()
+        finally:
+            db.close()
+
+    @timed_query
+    def active_usage_by_tenant(self) -> Dict[Optional[str], Tuple[int, int]]:
+        """
+        统计各租户在途的批处理数和估算 token 数
+
+        在途指正在提交（已通过配额检查，见 reserve_submission）或已创建批处理且尚未结束的任务。
+
+        Returns:
+            Dict[Optional[str], Tuple[int, int]]: 租户 -> (批处理数, token 数)
+        """
+        db = self.db()
+        try:
+            return self._active_usage(db)
+        finally:
+            db.close()
+
+    @timed_query
+    def reserve_submission(self, task_id: str,
+                           admits: Callable[[Dict[Optional[str], Tuple[int, int]]], bool]) -> bool:
+        """
+        在同一个事务中检查配额并占用：先将任务标记为提交中（IN_PROGRESS + PENDING，计入在途用量），
+        再统计其它任务的在途用量交给 admits 判断，不允许时回滚
+
+        先写入再统计，事务持有写锁，其它进程同时进行的检查要等本事务提交后才能继续，
+        看到的用量已包含本任务，不会同时通过检查而超出配额。
+
+        Returns:
+            bool: 是否已占用，任务不存在或已失败、取消时为 False
+        """
+        db = self.db()
+        try:
+            reserved = db.query(TaskORM).filter(
+                TaskORM.id == task_id,
+                TaskORM.status.notin_([TaskStatus.FAILED.value, TaskStatus.CANCELLED.value])
+            ).update(
+                {TaskORM.status: TaskStatus.IN_PROGRESS.value,
+                 TaskORM.submission_state: SubmissionState.PENDING.value,
+                 TaskORM.version: TaskORM.version + 1,
+                 TaskORM.updated_at: datetime.now()},
+                synchronize_session=False
+            )
+            if not reserved or not admits(self._active_usage(db, exclude_id=task_id)):
+                db.rollback()
+                return False
+            self._bump_table_version(db)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def _active_usage(self, db, exclude_id: Optional[str] = None) -> Dict[Optional[str], Tuple[int, int]]:
+        query = db.query(
+            TaskORM.tenant, func.count(TaskORM.id), func.coalesce(func.sum(TaskORM.estimated_tokens), 0)
+        ).filter(
+            TaskORM.status.in_(self.ACTIVE_STATUSES),
+            or_(
+                TaskORM.batch_id.isnot(None),
+                TaskORM.submission_state.in_([SubmissionState.FILE_WRITTEN.value,
+                                              SubmissionState.UPLOADED.value]),
+                # 已通过配额检查、正在生成或上传输入的批处理任务
+                and_(
+                    TaskORM.status == TaskStatus.IN_PROGRESS.value,
+                    TaskORM.submission_state == SubmissionState.PENDING.value,
+                    or_(TaskORM.route.is_(None), TaskORM.route != TaskRoute.REALTIME.value)
+                )
+            )
+        )
+        if exclude_id is not None:
+            query = query.filter(TaskORM.id != exclude_id)
+        rows = query.group_by(TaskORM.tenant).all()
+        return {tenant: (batches, int(tokens)) for tenant, batches, tokens in rows}
+
+    @timed_query
+    def count_by_status(self) -> Dict[str, int]:
+        """统计各状态的任务数"""
+        db = self.db()
+        try:
+            rows = db.query(TaskORM.status, func.count(TaskORM.id)).group_by(TaskORM.status).all()
+            return {status: count for status, count in rows}
+        finally:
+            db.close()
+
+    @timed_query
+    def count_incomplete_submissions(self) -> int:
+        """统计提交过程未完成的任务数"""
+        db = self.db()
+        try:
+            return db.query(func.count(TaskORM.id)).filter(*self._incomplete_submission_filter()).scalar()
+        finally:
+            db.close()
+
+    @timed_query
+    def count_queued(self) -> int:
+        """统计等待提交队列调度的任务数（不在恢复范围内，由提交队列负责提交）"""
+        db = self.db()
+        try:
+            return db.query(func.count(TaskORM.id)).filter(
+                TaskORM.submission_state == SubmissionState.QUEUED.value,
+                TaskORM.status.notin_([TaskStatus.FAILED.value, TaskStatus.CANCELLED.value])
+            ).scalar()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _incomplete_submission_filter() -> tuple:
+        """提交过程未完成的筛选条件，包括没有提交状态的旧任务"""
+        incomplete_states = [
+            SubmissionState.PENDING.value,
+            SubmissionState.FILE_WRITTEN.value,
+            SubmissionState.UPLOADED.value,
+        ]
+        return (
+            TaskORM.status.notin_([TaskStatus.FAILED.value, TaskStatus.CANCELLED.value]),
+            or_(
+                TaskORM.submission_state.in_(incomplete_states),
+                and_(TaskORM.submission_state.is_(None), TaskORM.batch_id.is_(None))
+            ),
+        )
+
+    @timed_query
     def update(self, task: Task) -> Task:
         db = self.db()
         try:
             db_task = db.query(TaskORM).filter(TaskORM.id == task.id).first()
             if db_task:
-                for key, value in task.model_dump().items():
-                    setattr(db_task, key, value)
+                # 只写入变化的列，没有变化时不递增版本号，避免调度器每次轮询都使 ETag 和列表缓存失效
+                changed = False
+                for key, value in task.model_dump(exclude={"version", "updated_at"}).items():
+                    if getattr(db_task, key) != value:
+                        setattr(db_task, key, value)
+                        changed = True
+                if not changed:
+                    return self.to_model(db_task)
+                db_task.version = (db_task.version or 0) + 1
+                db_task.updated_at = datetime.now()
+                self._bump_table_version(db)
                 db.commit()
                 db.refresh(db_task)
                 return self.to_model(db_task)
@@ -62,16 +367,127 @@ class TaskRepository:
         finally:
             db.close()
 
+    @timed_query
+    def is_variables_file_referenced(self, variables_path: str) -> bool:
+        """是否还有任务引用该变量文件"""
+        db = self.db()
+        try:
+            query = db.query(TaskORM.id).filter(TaskORM.variables_path == variables_path)
+            return db.query(query.exists()).scalar()
+        finally:
+            db.close()
+
+    @timed_query
+    def is_blob_referenced(self, path: str) -> bool:
+        """是否还有任务引用该 BlobStore 文件（输入或结果）"""
+        db = self.db()
+        try:
+            query = db.query(TaskORM.id).filter(or_(
+                TaskORM.content_blob == path,
+                TaskORM.system_prompt_blob == path,
+                TaskORM.output_file_path == path,
+                TaskORM.error_file_path == path
+            ))
+            return db.query(query.exists()).scalar()
+        finally:
+            db.close()
+
+    @timed_query
+    def touch(self, task_id: str) -> None:
+        """递增任务版本号，使其 ETag 失效（如重试任务完成后，原任务的合并结果已变化）"""
+        db = self.db()
+        try:
+            updated = db.query(TaskORM).filter(TaskORM.id == task_id).update(
+                {TaskORM.version: TaskORM.version + 1, TaskORM.updated_at: datetime.now()},
+                synchronize_session=False
+            )
+            if updated:
+                self._bump_table_version(db)
+            db.commit()
+        finally:
+            db.close()
+
+    @timed_query
     def delete(self, task_id: str) -> None:
         db = self.db()
         try:
             task = db.query(TaskORM).filter(TaskORM.id == task_id).first()
             if task:
                 db.delete(task)
+                self._bump_table_version(db)
                 db.commit()
         finally:
             db.close()
 
+    @timed_query
+    def update_status_many(self, task_ids: List[str], status: str) -> int:
+        """批量更新任务状态，返回更新的行数"""
+        db = self.db()
+        try:
+            updated = 0
+            for start in range(0, len(task_ids), self.chunk_size):
+                chunk = task_ids[start:start + self.chunk_size]
+                updated += db.query(TaskORM).filter(TaskORM.id.in_(chunk)).update(
+                    {TaskORM.status: status, TaskORM.version: TaskORM.version + 1,
+                     TaskORM.updated_at: datetime.now()},
+                    synchronize_session=False
+                )
+            if updated:
+                self._bump_table_version(db)
+            db.commit()
+            return updated
+        finally:
+            db.close()
+
+    @timed_query
+    def delete_many(self, task_ids: List[str]) -> int:
+        """批量删除任务，返回删除的行数"""
+        db = self.db()
+        try:
+            deleted = 0
+            for start in range(0, len(task_ids), self.chunk_size):
+                chunk = task_ids[start:start + self.chunk_size]
+                deleted += db.query(TaskORM).filter(TaskORM.id.in_(chunk)).delete(
+                    synchronize_session=False
+                )
+            if deleted:
+                self._bump_table_version(db)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    @timed_query
+    def get_version(self, task_id: str) -> Optional[int]:
+        """只查询任务的版本号，不加载整行"""
+        db = self.db()
+        try:
+            row = db.query(TaskORM.version).filter(TaskORM.id == task_id).first()
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    @timed_query
+    def get_table_version(self) -> int:
+        """获取任务表的变更序号"""
+        db = self.db()
+        try:
+            row = db.query(TableVersionORM.version).filter(
+                TableVersionORM.name == TaskORM.__tablename__
+            ).first()
+            return row[0] if row else 0
+        finally:
+            db.close()
+
+    @staticmethod
+    def _bump_table_version(db) -> None:
+        """在同一事务中递增任务表的变更序号"""
+        updated = db.query(TableVersionORM).filter(
+            TableVersionORM.name == TaskORM.__tablename__
+        ).update({TableVersionORM.version: TableVersionORM.version + 1})
+        if not updated:
+            db.add(TableVersionORM(name=TaskORM.__tablename__, version=1))
+
     @staticmethod
     def to_model(task_orm: TaskORM) -> Task:
         return Task(
@@ -85,7 +501,28 @@ class TaskRepository:
             error_message=task_orm.error_message,
             result=task_orm.result,
             output_file_path=task_orm.output_file_path,
+            error_file_path=task_orm.error_file_path,
             system_prompt=task_orm.system_prompt,
             output_file_id=task_orm.output_file_id,
-            error_file_id=task_orm.error_file_id
+            error_file_id=task_orm.error_file_id,
+            version=task_orm.version or 0,
+            idempotency_key=task_orm.idempotency_key,
+            submission_state=task_orm.submission_state,
+            updated_at=task_orm.updated_at,
+            route=task_orm.route,
+            parent_task_id=task_orm.parent_task_id,
+            attempt=task_orm.attempt or 0,
+            priority=task_orm.priority or 0,
+            deadline=task_orm.deadline,
+            tenant=task_orm.tenant,
+            estimated_tokens=task_orm.estimated_tokens,
+            template=task_orm.template,
+            variables_path=task_orm.variables_path,
+            shard_start=task_orm.shard_start,
+            shard_end=task_orm.shard_end,
+            model=task_orm.model,
+            max_tokens=task_orm.max_tokens,
+            temperature=task_orm.temperature,
+            content_blob=task_orm.content_blob,
+            system_prompt_blob=task_orm.system_prompt_blob
         ) 
\ No newline at end of file
@@ -0,0 +1,122 @@
+from ..models.database_models import TaskTimelineORM, LatencyAggregateORM
+from ..database.database import SessionLocal
+from ..models.timeline_entity import TaskTimeline, LATENCY_STAGES, PROVIDER_TIMESTAMPS
+from ..utils.latency_histogram import LatencyHistogram
+from ..utils.metrics import timed_query
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+class TimelineRepository:
+    def __init__(self):
+        self.db = SessionLocal
+
+    @timed_query
+    def mark(self, task_id: str, **stamps: Optional[datetime]) -> None:
+        """
+        记录阶段时间点，已有值的字段不会被覆盖
+
+        恢复提交或调度器重复检测时同一阶段可能被记录多次，只保留第一次的时间。
+        """
+        db = self.db()
+        try:
+            timeline = db.query(TaskTimelineORM).filter(TaskTimelineORM.task_id == task_id).first()
+            if not timeline:
+                timeline = TaskTimelineORM(task_id=task_id)
+                db.add(timeline)
+            for field, value in stamps.items():
+                if value is not None and getattr(timeline, field) is None:
+                    setattr(timeline, field, value)
+            db.commit()
+        finally:
+            db.close()
+
+    def record_batch(self, task_id: str, batch: Any) -> None:
+        """记录批处理 ID 和服务商返回的各状态时间戳（Unix 秒）"""
+        stamps = {
+            field: datetime.fromtimestamp(getattr(batch, key))
+            for key, field in PROVIDER_TIMESTAMPS.items()
+            if getattr(batch, key, None)
+        }
+        self.mark(task_id, batch_id=batch.id, **stamps)
+
+    @timed_query
+    def get(self, task_id: str) -> Optional[TaskTimeline]:
+        db = self.db()
+        try:
+            timeline = db.query(TaskTimelineORM).filter(TaskTimelineORM.task_id == task_id).first()
+            return TaskTimeline.model_validate(timeline) if timeline else None
+        finally:
+            db.close()
+
+    @timed_query
+    def aggregate(self, task_id: str) -> bool:
+        """
+        将任务各阶段耗时计入按小时聚合的直方图，每个任务只统计一次
+
+        Returns:
+            bool: 本次是否计入
+        """
+        db = self.db()
+        try:
+            claimed = db.query(TaskTimelineORM).filter(
+                TaskTimelineORM.task_id == task_id,
+                TaskTimelineORM.aggregated_at.is_(None)
+            ).update({TaskTimelineORM.aggregated_at: datetime.now()}, synchronize_session=False)
+            if not claimed:
+                db.rollback()
+                return False
+
+            timeline = TaskTimeline.model_validate(
+                db.query(TaskTimelineORM).filter(TaskTimelineORM.task_id == task_id).first()
+            )
+            end_fields = {stage: end_field for stage, _, end_field in LATENCY_STAGES}
+            for stage, duration_ms in timeline.stage_durations().items():
+                # 按阶段结束时间所在的小时归档
+                hour = getattr(timeline, end_fields[stage]).replace(minute=0, second=0, microsecond=0)
+                row = db.query(LatencyAggregateORM).filter(
+                    LatencyAggregateORM.stage == stage,
+                    LatencyAggregateORM.hour == hour
+                ).first()
+                if not row:
+                    row = LatencyAggregateORM(stage=stage, hour=hour, count=0, total_ms=0.0, buckets={})
+                    db.add(row)
+                histogram = LatencyHistogram(row.buckets, row.count, row.total_ms)
+                histogram.add(duration_ms)
+                row.buckets = histogram.to_json()
+                row.count = histogram.count
+                row.total_ms = histogram.total_ms
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    @timed_query
+    def latency_histograms(self, since: datetime) -> Dict[str, LatencyHistogram]:
+        """汇总 since 所在小时起的各阶段直方图"""
+        since_hour = since.replace(minute=0, second=0, microsecond=0)
+        db = self.db()
+        try:
+            rows = db.query(LatencyAggregateORM).filter(LatencyAggregateORM.hour >= since_hour).all()
+            histograms: Dict[str, LatencyHistogram] = {}
+            for row in rows:
+                histograms.setdefault(row.stage, LatencyHistogram()).merge(
+                    LatencyHistogram(row.buckets, row.count, row.total_ms)
+                )
+            return histograms
+        finally:
+            db.close()
+
+    @timed_query
+    def delete_many(self, task_ids: List[str], chunk_size: int = 500) -> None:
+        """删除任务的时间线，已计入的聚合数据保留"""
+        db = self.db()
+        try:
+            for start in range(0, len(task_ids), chunk_size):
+                chunk = task_ids[start:start + chunk_size]
+                db.query(TaskTimelineORM).filter(TaskTimelineORM.task_id.in_(chunk)).delete(
+                    synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,107 @@
+from ..models.database_models import UsageDailyORM, UsageTaskORM
+from ..database.database import SessionLocal
+from ..utils.metrics import timed_query
+from sqlalchemy import func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from datetime import date
+from typing import Dict, List, Optional
+
+# 用量字段，顺序与 usage 字典的值一致
+USAGE_FIELDS = ("requests", "prompt_tokens", "completion_tokens", "total_tokens")
+# 支持 INSERT ... ON CONFLICT DO UPDATE 的方言
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class UsageRepository:
+    def __init__(self):
+        self.db = SessionLocal
+
+    @timed_query
+    def record(self, task_id: str, attempt_id: str, day: date, usage: Dict[str, Dict[str, int]]) -> bool:
+        """
+        计入一次结果摄取的用量，同一 attempt_id 只计入一次
+
+        Args:
+            task_id: 用量归属的任务
+            attempt_id: 产生结果的任务
+            usage: 模型 -> 各用量字段
+
+        Returns:
+            bool: 本次是否计入
+        """
+        db = self.db()
+        try:
+            for model, counts in usage.items():
+                db.add(UsageTaskORM(attempt_id=attempt_id, model=model, task_id=task_id, day=day, **counts))
+            # 先写入任务用量，主键冲突说明已经计入过
+            db.flush()
+            insert = self._upsert_insert(db)
+            for model, counts in usage.items():
+                # 原子累加，多个进程同时计入同一天同一模型时不会冲突
+                statement = insert(UsageDailyORM).values(day=day, model=model, **counts)
+                db.execute(statement.on_conflict_do_update(
+                    index_elements=[UsageDailyORM.day, UsageDailyORM.model],
+                    set_={field: getattr(UsageDailyORM, field) + getattr(statement.excluded, field)
+                          for field in USAGE_FIELDS}
+                ))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    @staticmethod
+    def _upsert_insert(db):
+        """
+        Raises:
+            NotImplementedError: 数据库不支持 ON CONFLICT DO UPDATE
+        """
+        dialect = db.get_bind().dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise NotImplementedError(f"Usage aggregation requires SQLite or PostgreSQL, not {dialect}")
+        return UPSERT_INSERTS[dialect]
+
+    @timed_query
+    def daily(self, since: date, model: Optional[str] = None) -> List[dict]:
+        """since 当天起各天各模型的用量"""
+        db = self.db()
+        try:
+            query = db.query(UsageDailyORM).filter(UsageDailyORM.day >= since)
+            if model:
+                query = query.filter(UsageDailyORM.model == model)
+            rows = query.order_by(UsageDailyORM.day, UsageDailyORM.model).all()
+            return [
+                {"day": row.day, "model": row.model, **{field: getattr(row, field) for field in USAGE_FIELDS}}
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+    @timed_query
+    def for_task(self, task_id: str) -> Dict[str, Dict[str, int]]:
+        """任务（含其重试任务）各模型的用量"""
+        db = self.db()
+        try:
+            rows = db.query(
+                UsageTaskORM.model, *[func.sum(getattr(UsageTaskORM, field)) for field in USAGE_FIELDS]
+            ).filter(UsageTaskORM.task_id == task_id).group_by(UsageTaskORM.model).all()
+            return {row[0]: dict(zip(USAGE_FIELDS, map(int, row[1:]))) for row in rows}
+        finally:
+            db.close()
+
+    @timed_query
+    def delete_many(self, task_ids: List[str], chunk_size: int = 500) -> None:
+        """删除任务的用量明细，已计入的按天汇总保留"""
+        db = self.db()
+        try:
+            for start in range(0, len(task_ids), chunk_size):
+                chunk = task_ids[start:start + chunk_size]
+                db.query(UsageTaskORM).filter(
+                    or_(UsageTaskORM.task_id.in_(chunk), UsageTaskORM.attempt_id.in_(chunk))
+                ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
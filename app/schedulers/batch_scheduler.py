@@ -1,80 +1,204 @@
 import asyncio
+import time
+from datetime import datetime
+from typing import Dict, FrozenSet, Optional
 from ..services.task_service import TaskService
 from ..models.task_entity import TaskStatus
+from ..models.timeline_entity import PROVIDER_TIMESTAMPS
 from ..utils.logger import setup_logger
+from .leader_lease import LeaderLease
+from ..utils.metrics import SCHEDULER_TICK_SECONDS
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-import json
 
 class BatchScheduler:
-    def __init__(self):
+    # 租约有效期和续约间隔（秒），主调度进程退出后其它进程最多约 lease_ttl_seconds 后接管
+    lease_ttl_seconds = 15
+    lease_heartbeat_seconds = 5
+    # 提交超过该时间未更新才视为中断，避免接管其它进程正在进行的提交
+    recovery_grace_seconds = 300
+    # 提交队列的调度间隔（秒）
+    submission_interval_seconds = 5
+
+    def __init__(self, task_service: Optional[TaskService] = None):
+        """
+        Args:
+            task_service: 与控制器共享的 TaskService（见 app.container），为 None 时创建新的实例
+        """
         self.scheduler = AsyncIOScheduler()
-        self.task_service = TaskService()
+        self.task_service = task_service or TaskService()
+        self.result_ingester = self.task_service.result_ingester
         self.logger = setup_logger(__name__)
+        # 多个 worker 进程中只有持有租约的进程运行轮询
+        self.lease = LeaderLease("batch_scheduler", ttl_seconds=self.lease_ttl_seconds)
+        self.is_leader = False
+        # 最近一次成功续约的时间（time.monotonic）
+        self.renewed_at = 0.0
+        # 各在途任务已记录到时间线的服务商时间戳字段，只在出现新字段时写入时间线
+        self.recorded_stamps: Dict[str, FrozenSet[str]] = {}
+
+    async def renew_lease(self):
+        """获取或续约调度器租约"""
+        was_leader = self.is_leader
+        try:
+            self.is_leader = await asyncio.to_thread(self.lease.try_acquire)
+        except Exception as e:
+            self.logger.error(f"续约调度器租约时发生错误: {str(e)}", exc_info=True)
+            self.is_leader = False
+        if self.is_leader:
+            self.renewed_at = time.monotonic()
+        if self.is_leader and not was_leader:
+            self.logger.info(f"进程 {self.lease.holder} 成为主调度进程")
+        elif was_leader and not self.is_leader:
+            self.logger.warning(f"进程 {self.lease.holder} 失去主调度进程身份")
+
+    async def still_leader(self) -> bool:
+        """处理每个任务前确认仍持有租约，距上次续约超过续约间隔时先续约"""
+        if self.is_leader and time.monotonic() - self.renewed_at >= self.lease_heartbeat_seconds:
+            await self.renew_lease()
+        return self.is_leader
 
     async def update_batch_status(self):
         """更新所有批处理任务的状态"""
+        if not self.is_leader:
+            self.logger.debug("当前进程不是主调度进程，跳过本次更新")
+            return
+        with SCHEDULER_TICK_SECONDS.time():
+            await self._update_batch_status()
+
+    async def _update_batch_status(self):
+        await self.recover_submissions()
         try:
             self.logger.info("开始批量更新任务状态")
             tasks = self.task_service.list_tasks()
-            self.logger.info(f"找到 {len(tasks)} 个任务需要检查")
+            self.logger.info("找到 %d 个任务需要检查", len(tasks))
+            # 清理已删除或在别处结束（如被取消）的任务
+            active_ids = {task.id for task in tasks}
+            self.recorded_stamps = {task_id: stamps for task_id, stamps in self.recorded_stamps.items()
+                                    if task_id in active_ids}
             
             for task in tasks:
+                # 处理单个任务可能耗时较长，租约过期后其它进程可能已接管，不再继续处理
+                if not await self.still_leader():
+                    self.logger.warning("已失去调度器租约，中止本次更新")
+                    break
                 try:
-                    self.logger.info(f"正在检查任务 {task.id}，当前状态: {task.status}")
+                    self.logger.debug("正在检查任务 %s，当前状态: %s", task.id, task.status)
+
+                    if not task.batch_id:
+                        # 尚未创建批处理（提交中或提交失败），没有可查询的状态
+                        self.logger.debug("跳过任务 %s，尚未创建批处理", task.id)
+                        continue
                     
                     if task.status not in [TaskStatus.COMPLETED.value, TaskStatus.EXPIRED.value, 
                                          TaskStatus.CANCELLING.value, TaskStatus.CANCELLED.value]:
-                        self.logger.info(f"任务 {task.id} 正在进行中，获取批处理状态 (batch_id: {task.batch_id})")
-                        batch_info = self.task_service.get_batch_status(task.batch_id)
+                        self.logger.debug("任务 %s 正在进行中，获取批处理状态 (batch_id: %s)", task.id, task.batch_id)
+                        # 服务商接口是同步调用，在线程中执行，避免阻塞事件循环（包括续约任务）
+                        batch_info = await asyncio.to_thread(self.task_service.get_batch_status, task.batch_id)
+                        self._record_batch_timeline(task, batch_info)
                         old_status = task.status
                         task.status = batch_info.status
-                        self.logger.info(f"任务 {task.id} 状态从 {old_status} 更新为 {task.status}")
+                        if task.status != old_status:
+                            self.logger.info("任务 %s 状态从 %s 更新为 %s", task.id, old_status, task.status)
                         
-                        if task.status == TaskStatus.COMPLETED.value and task.output_file_path is None:
-                            self.logger.info(f"任务 {task.id} 已完成，开始处理输出文件")
+                        finished = task.status in (TaskStatus.COMPLETED.value, TaskStatus.EXPIRED.value)
+                        if finished and task.output_file_path is None:
+                            # 过期的批处理也可能有部分输出和错误文件
+                            self.logger.info("任务 %s 已结束（%s），开始处理输出文件", task.id, task.status)
+                            self.task_service.record_timeline(task.id, completion_detected_at=datetime.now())
                             
                             if batch_info.output_file_id:
-                                self.logger.info(f"下载输出文件 (file_id: {batch_info.output_file_id})")
+                                self.logger.debug("下载输出文件 (file_id: %s)", batch_info.output_file_id)
                                 out_path = await self.task_service.download_file(batch_info.output_file_id)
                                 task.output_file_path = out_path
-                                self.logger.info(f"输出文件已保存到: {out_path}")
-                                
-                                with open(out_path, 'r', encoding='utf-8') as f:
-                                    content = f.read()
-                                    task.result = json.loads(content)
-                                    task.output_file_id = batch_info.output_file_id
-                                    self.logger.info(f"已解析输出文件内容到任务结果")
+                                task.output_file_id = batch_info.output_file_id
+                                self.logger.info("输出文件已保存到: %s", out_path)
                             
                             if batch_info.error_file_id:
-                                self.logger.info(f"发现错误文件 (error_file_id: {batch_info.error_file_id})")
-                                error_path = await self.task_service.download_file(
-                                    batch_info.error_file_id, 
-                                    f"results/error_{task.id}.jsonl"
-                                )
-                                self.logger.info(f"错误文件已保存到: {error_path}")
-                                
-                                with open(error_path, 'r', encoding='utf-8') as f:
-                                    error_content = f.read()
-                                    if task.result is None:
-                                        task.result = {}
-                                    task.result['errors'] = json.loads(error_content)
-                                    task.error_file_path = error_path
-                                    task.error_file_id = batch_info.error_file_id
-                                    self.logger.info(f"已解析错误文件内容到任务结果")
-
-                        self.task_service.update_task(task)
-                        self.logger.info(f"任务 {task.id} 更新完成")
+                                self.logger.info("发现错误文件 (error_file_id: %s)", batch_info.error_file_id)
+                                error_path = await self.task_service.download_file(batch_info.error_file_id)
+                                task.error_file_path = error_path
+                                task.error_file_id = batch_info.error_file_id
+                                self.logger.info("错误文件已保存到: %s", error_path)
+
+                            # 解压、解析结果文件和计入用量都可能较慢，在线程中执行，避免阻塞续约
+                            await asyncio.to_thread(self._ingest_results, task)
+
+                            self.task_service.record_timeline(task.id, finished=True, downloaded_at=datetime.now())
+                        elif task.status in (TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+                            self.task_service.record_timeline(task.id, finished=True)
+
+                        await asyncio.to_thread(self.task_service.update_task, task)
+                        if finished:
+                            # 下载的结果与已有文件相同时，该文件可能在任务更新前被删除其它任务时清理
+                            task = await self.task_service.restore_downloads(task)
+                        self.logger.debug("任务 %s 更新完成", task.id)
+
+                        if task.status in (TaskStatus.COMPLETED.value, TaskStatus.EXPIRED.value,
+                                           TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+                            self.recorded_stamps.pop(task.id, None)
+
+                        if finished:
+                            # 输入和输出写入全文索引，每个任务只在摄取结果时索引一次
+                            await self.task_service.index_task(task)
+                            # 重新提交可重试的失败请求
+                            retry = await self.task_service.handle_batch_finished(task)
+                            if retry:
+                                self.logger.info("任务 %s 的失败请求已重新提交为任务 %s", task.id, retry.id)
                     else:
-                        self.logger.debug(f"跳过任务 {task.id}，当前状态 {task.status} 无需更新")
+                        self.logger.debug("跳过任务 %s，当前状态 %s 无需更新", task.id, task.status)
                             
                 except Exception as e:
-                    self.logger.error(f"更新任务 {task.id} 时发生错误: {str(e)}", exc_info=True)
+                    self.logger.error("更新任务 %s 时发生错误: %s", task.id, e, exc_info=True)
                     continue
         except Exception as e:
             self.logger.error(f"批量更新任务状态时发生错误: {str(e)}", exc_info=True)
         finally:
             self.logger.info("批量更新任务状态完成")
 
+    def _ingest_results(self, task) -> None:
+        """解析下载的结果文件：计入 token 用量，任务中只保存结果摘要，结果行从文件按需读取"""
+        output_lines, error_lines = [], []
+        if task.output_file_path:
+            output_lines = self.result_ingester.load_output(task.output_file_path)
+            # 解析时顺便提取 token 用量计入汇总，之后统计不再读取结果文件
+            self.task_service.record_usage(task, output_lines)
+        if task.error_file_path:
+            error_lines = self.result_ingester.load_errors(task.error_file_path)
+        if task.output_file_path or task.error_file_path:
+            task.result = self.result_ingester.summarize(
+                output_lines, error_lines, task.output_file_path, task.error_file_path
+            )
+            self.logger.debug("已记录任务 %s 的结果摘要", task.id)
+
+    def _record_batch_timeline(self, task, batch_info) -> None:
+        """状态变化或服务商返回了新的时间戳时才记录时间线，避免每次轮询都写入"""
+        stamps = frozenset(key for key in PROVIDER_TIMESTAMPS if getattr(batch_info, key, None))
+        if batch_info.status == task.status and stamps == self.recorded_stamps.get(task.id):
+            return
+        self.task_service.record_timeline(task.id, batch=batch_info)
+        self.recorded_stamps[task.id] = stamps
+
+    async def recover_submissions(self):
+        """恢复进程中断时未完成的任务提交，只在主调度进程中执行"""
+        await self.renew_lease()
+        if not self.is_leader:
+            return
+        try:
+            await self.task_service.recover_submissions(stale_after_seconds=self.recovery_grace_seconds)
+        except Exception as e:
+            self.logger.error(f"恢复未完成的任务提交时发生错误: {str(e)}", exc_info=True)
+
+    async def submit_queued_tasks(self):
+        """按优先级和租户配额提交排队中的任务，只在主调度进程中执行"""
+        if not self.is_leader:
+            return
+        try:
+            submitted = await self.task_service.submit_queued()
+            if submitted:
+                self.logger.info("已从提交队列提交 %d 个任务", submitted)
+        except Exception as e:
+            self.logger.error(f"提交排队任务时发生错误: {str(e)}", exc_info=True)
+
     def start(self):
         """启动调度器"""
         self.scheduler.add_job(
@@ -83,9 +207,24 @@ class BatchScheduler:
             minutes=1,
             id='update_batch_status'
         )
+        self.scheduler.add_job(
+            self.renew_lease,
+            'interval',
+            seconds=self.lease_heartbeat_seconds,
+            id='renew_lease'
+        )
+        self.scheduler.add_job(
+            self.submit_queued_tasks,
+            'interval',
+            seconds=self.submission_interval_seconds,
+            id='submit_queued_tasks'
+        )
         self.scheduler.start()
 
     def shutdown(self):
         """关闭调度器"""
         if self.scheduler:
-            self.scheduler.shutdown() 
\ No newline at end of file
+            self.scheduler.shutdown()
+        if self.is_leader:
+            self.lease.release()
+            self.is_leader = False 
\ No newline at end of file
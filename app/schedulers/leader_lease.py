@@ -0,0 +1,73 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from ..database.database import SessionLocal
+from ..models.database_models import SchedulerLeaseORM
+from ..utils.logger import setup_logger
+
+
+class LeaderLease:
+    """
+    基于数据库的租约
+
+    持有者需要在租约过期前续约；进程退出或卡死导致租约过期后，
+    其它进程在下一次续约时即可接管。
+    """
+
+    def __init__(self, name: str, ttl_seconds: int = 15, holder: str = None):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.db = SessionLocal
+        self.logger = setup_logger(__name__)
+
+    def try_acquire(self) -> bool:
+        """获取或续约租约，返回当前进程是否为持有者"""
+        now = datetime.utcnow()
+        values = {
+            SchedulerLeaseORM.holder: self.holder,
+            SchedulerLeaseORM.expires_at: now + self.ttl,
+            SchedulerLeaseORM.heartbeat_at: now,
+        }
+        db = self.db()
+        try:
+            # 自己持有或已过期时才能更新，UPDATE 本身是原子的
+            updated = db.query(SchedulerLeaseORM).filter(
+                SchedulerLeaseORM.name == self.name,
+                or_(SchedulerLeaseORM.holder == self.holder, SchedulerLeaseORM.expires_at < now)
+            ).update(values, synchronize_session=False)
+            if not updated:
+                if db.get(SchedulerLeaseORM, self.name) is not None:
+                    db.rollback()
+                    return False
+                db.add(SchedulerLeaseORM(
+                    name=self.name,
+                    holder=self.holder,
+                    expires_at=now + self.ttl,
+                    heartbeat_at=now
+                ))
+            db.commit()
+            return True
+        except IntegrityError:
+            # 其它进程同时插入了租约
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def release(self) -> None:
+        """主动释放租约，让其它进程无需等待过期即可接管"""
+        db = self.db()
+        try:
+            db.query(SchedulerLeaseORM).filter(
+                SchedulerLeaseORM.name == self.name,
+                SchedulerLeaseORM.holder == self.holder
+            ).update({SchedulerLeaseORM.expires_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            self.logger.warning(f"Failed to release lease {self.name}: {e}")
+        finally:
+            db.close()
@@ -0,0 +1,115 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import openai
+
+
+def key_fingerprint(api_key: str) -> str:
+    """密钥的标识，只保存到数据库和日志中，不暴露密钥本身"""
+    return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class KeyPool:
+    """
+    服务商 API 密钥池
+
+    选择：上传文件（即决定批处理所属账号）时选择健康且在途批处理最少的密钥，
+    实时调用在健康的密钥间轮询。
+    配额：每个密钥在途批处理数上限，0 表示不限制；所有密钥都达到上限时仍选择负载最低的。
+    健康：鉴权失败或被限流的密钥冷却一段时间，冷却期间不参与选择；健康状态在进程内所有实例间共享。
+    """
+    # key_id -> 冷却结束时间（time.monotonic()）
+    _cooldown_until: Dict[str, float] = {}
+    _lock = threading.Lock()
+    _round_robin = itertools.count()
+
+    def __init__(self, api_keys: List[str]):
+        if not api_keys:
+            raise ValueError("No provider API key configured: set DASHSCOPE_API_KEYS or DASHSCOPE_API_KEY")
+        # 按配置顺序去重，第一个为主密钥（未绑定的旧资源使用主密钥）
+        self.keys: Dict[str, str] = {}
+        for api_key in api_keys:
+            self.keys.setdefault(key_fingerprint(api_key), api_key)
+        self.max_active_batches = int(os.getenv("KEY_MAX_ACTIVE_BATCHES", "0"))
+        self.rate_limit_cooldown = float(os.getenv("KEY_RATE_LIMIT_COOLDOWN_SECONDS", "60"))
+        self.auth_cooldown = float(os.getenv("KEY_AUTH_COOLDOWN_SECONDS", "600"))
+
+    @classmethod
+    def from_env(cls, api_key: Optional[str] = None) -> "KeyPool":
+        """显式传入的密钥优先，其次为逗号分隔的 DASHSCOPE_API_KEYS，最后为 DASHSCOPE_API_KEY"""
+        if api_key:
+            return cls([api_key])
+        keys = [key.strip() for key in os.getenv("DASHSCOPE_API_KEYS", "").split(",") if key.strip()]
+        if not keys and os.getenv("DASHSCOPE_API_KEY"):
+            keys = [os.getenv("DASHSCOPE_API_KEY")]
+        return cls(keys)
+
+    @property
+    def primary(self) -> str:
+        return next(iter(self.keys))
+
+    def is_healthy(self, key_id: str) -> bool:
+        return self._cooldown_until.get(key_id, 0.0) <= time.monotonic()
+
+    def healthy_keys(self) -> List[str]:
+        """健康的密钥；全部处于冷却时返回最早结束冷却的密钥，避免完全无法调用"""
+        healthy = [key_id for key_id in self.keys if self.is_healthy(key_id)]
+        if healthy:
+            return healthy
+        return [min(self.keys, key=lambda key_id: self._cooldown_until.get(key_id, 0.0))]
+
+    def select(self, loads: Dict[str, Tuple[int, int]]) -> str:
+        """
+        选择在途批处理数最少的健康密钥，相同时选择在途 token 数少的
+
+        Args:
+            loads: 各密钥在途的 (批处理数, token 数)
+        """
+        candidates = self.healthy_keys()
+        if self.max_active_batches:
+            under_quota = [key_id for key_id in candidates if loads.get(key_id, (0, 0))[0] < self.max_active_batches]
+            candidates = under_quota or candidates
+        order = {key_id: index for index, key_id in enumerate(self.keys)}
+        return min(candidates, key=lambda key_id: (*loads.get(key_id, (0, 0)), order[key_id]))
+
+    def next_healthy(self) -> str:
+        """在健康的密钥间轮询，用于不产生服务商资源的实时调用"""
+        candidates = self.healthy_keys()
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    def capacity(self) -> int:
+        """健康密钥的在途批处理总配额，0 表示不限制"""
+        if not self.max_active_batches:
+            return 0
+        return self.max_active_batches * len([key_id for key_id in self.keys if self.is_healthy(key_id)])
+
+    def report_error(self, key_id: str, error: BaseException) -> None:
+        """根据调用异常更新密钥健康状态：鉴权失败和限流的密钥进入冷却"""
+        if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+            cooldown = self.auth_cooldown
+        elif isinstance(error, openai.RateLimitError):
+            cooldown = self.rate_limit_cooldown
+        else:
+            return
+        with self._lock:
+            self._cooldown_until[key_id] = max(self._cooldown_until.get(key_id, 0.0), time.monotonic() + cooldown)
+
+    def status(self, loads: Dict[str, Tuple[int, int]]) -> List[dict]:
+        """各密钥的健康状态和在途用量（不含密钥本身）"""
+        now = time.monotonic()
+        return [
+            {
+                "key_id": key_id,
+                "primary": key_id == self.primary,
+                "healthy": self.is_healthy(key_id),
+                "cooldown_seconds": max(0.0, round(self._cooldown_until.get(key_id, 0.0) - now, 1)),
+                "active_batches": loads.get(key_id, (0, 0))[0],
+                "active_tokens": loads.get(key_id, (0, 0))[1],
+                "max_active_batches": self.max_active_batches,
+            }
+            for key_id in self.keys
+        ]
@@ -0,0 +1,81 @@
+from typing import Any, Dict, List, Optional
+from .retry_policy import RetryPolicy
+from ..utils.blob_store import BlobStore
+from ..utils.json_codec import codec as default_codec
+from ..utils.logger import setup_logger
+from ..utils.metrics import record_ingestion
+
+
+class ResultIngester:
+    """解析批处理任务下载下来的输出文件和错误文件"""
+
+    def __init__(self, codec=None):
+        self.codec = codec or default_codec
+        # 结果文件可能压缩保存在 BlobStore 中，读取时透明解压
+        self.blob_store = BlobStore()
+        self.logger = setup_logger(__name__)
+
+    def load_output(self, file_path: str) -> List[Any]:
+        """读取并解析下载的输出文件，计入摄取指标"""
+        return self._load(file_path, "output")
+
+    def load_errors(self, file_path: str) -> List[Any]:
+        """读取并解析下载的错误文件，计入摄取指标"""
+        return self._load(file_path, "error")
+
+    def read_lines(self, file_path: str) -> List[Any]:
+        """逐行解析 JSONL 文件，不计入摄取指标（用于合并结果、重试等重复读取）"""
+        return self._parse(self.blob_store.read_bytes(file_path))
+
+    def _load(self, file_path: str, kind: str) -> List[Any]:
+        # 直接以字节读取，orjson 可省去一次解码
+        data = self.blob_store.read_bytes(file_path)
+        record_ingestion(kind, data)
+        return self._parse(data)
+
+    def _parse(self, data: bytes) -> List[Any]:
+        return [self.codec.loads(line) for line in data.splitlines() if line.strip()]
+
+    @staticmethod
+    def usage_by_model(lines: List[Any], default_model: str) -> Dict[str, Dict[str, int]]:
+        """
+        按模型汇总结果行中 response.body.usage 的 token 用量，只统计有用量的行
+
+        Returns:
+            Dict[str, Dict[str, int]]: 模型 -> requests/prompt_tokens/completion_tokens/total_tokens
+        """
+        usage: Dict[str, Dict[str, int]] = {}
+        for line in lines:
+            body = (line.get("response") or {}).get("body") if isinstance(line, dict) else None
+            if not isinstance(body, dict) or not body.get("usage"):
+                continue
+            counts = usage.setdefault(body.get("model") or default_model, {
+                "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0
+            })
+            counts["requests"] += 1
+            for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                counts[field] += int(body["usage"].get(field) or 0)
+        return usage
+
+    def lines_of(self, file_path: Optional[str]) -> List[Any]:
+        """按需读取结果文件（如任务的 output_file_path）的各行，文件未下载时为空"""
+        return self.read_lines(file_path) if file_path else []
+
+    @staticmethod
+    def summarize(output_lines: List[Any], error_lines: List[Any],
+                  output_file_path: Optional[str], error_file_path: Optional[str]) -> Dict[str, Any]:
+        """
+        保存在 tasks.result 中的结果摘要
+
+        大任务的结果文件可达数十 MB，数据库中只保存行数、成功和失败数以及文件路径，
+        结果行通过 lines_of 从文件按需读取。
+        """
+        succeeded = sum(1 for line in output_lines if isinstance(line, dict) and RetryPolicy.is_success(line))
+        lines = len(output_lines) + len(error_lines)
+        return {
+            "lines": lines,
+            "succeeded": succeeded,
+            "failed": lines - succeeded,
+            "output_file_path": output_file_path,
+            "error_file_path": error_file_path,
+        }
@@ -0,0 +1,59 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class RetryPolicy:
+    """判断批处理中失败的请求是否值得重新提交"""
+
+    # 限流、超时和服务端错误可以重试；参数错误、内容审核等重试也不会成功
+    RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+    RETRYABLE_ERROR_CODES = ("rate_limit", "throttl", "timeout", "timed_out", "expired",
+                             "server_error", "internal_error", "service_unavailable")
+
+    def is_retryable(self, line: Dict[str, Any]) -> bool:
+        """错误文件（或输出文件中非 200）的一行是否可以重试"""
+        response = line.get("response") or {}
+        if response.get("status_code") in self.RETRYABLE_STATUS_CODES:
+            return True
+        code = self._error_code(line)
+        return bool(code) and any(marker in code for marker in self.RETRYABLE_ERROR_CODES)
+
+    def retryable_ids(self, input_ids: Iterable[str], output_lines: List[Dict[str, Any]],
+                      error_lines: List[Dict[str, Any]], expired: bool) -> List[str]:
+        """
+        按输入顺序返回需要重新提交的 custom_id
+
+        Args:
+            input_ids: 输入文件中的 custom_id
+            output_lines: 输出文件的各行
+            error_lines: 错误文件的各行
+            expired: 批处理是否已过期，过期时没有任何结果的请求也需要重试
+        """
+        succeeded, retryable, failed = set(), set(), set()
+        for line in list(output_lines) + list(error_lines):
+            custom_id = line.get("custom_id")
+            if self.is_success(line):
+                succeeded.add(custom_id)
+            elif self.is_retryable(line):
+                retryable.add(custom_id)
+            else:
+                failed.add(custom_id)
+
+        ids = []
+        for custom_id in input_ids:
+            if custom_id in succeeded or custom_id in failed:
+                continue
+            if custom_id in retryable or expired:
+                ids.append(custom_id)
+        return ids
+
+    @staticmethod
+    def is_success(line: Dict[str, Any]) -> bool:
+        response = line.get("response") or {}
+        return not line.get("error") and response.get("status_code") == 200
+
+    @staticmethod
+    def _error_code(line: Dict[str, Any]) -> Optional[str]:
+        body = (line.get("response") or {}).get("body") or {}
+        error = line.get("error") or (body.get("error") if isinstance(body, dict) else None) or {}
+        code = error.get("code") if isinstance(error, dict) else None
+        return str(code).lower() if code else None
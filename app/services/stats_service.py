@@ -0,0 +1,118 @@
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+from ..models.timeline_entity import LATENCY_STAGES
+from ..repositories.timeline_repository import TimelineRepository
+from ..repositories.usage_repository import UsageRepository, USAGE_FIELDS
+from ..utils.logger import setup_logger
+
+
+class StatsService:
+    def __init__(self):
+        self.timeline_repository = TimelineRepository()
+        self.usage_repository = UsageRepository()
+        self.logger = setup_logger(__name__)
+        # 各模型每百万 token 的价格，如 {"qwen-turbo": {"prompt": 0.15, "completion": 0.3}}，未配置价格的模型不计算费用
+        self.model_prices = self._load_model_prices()
+
+    def _load_model_prices(self) -> Dict[str, Dict[str, float]]:
+        """读取环境变量 MODEL_PRICES，格式错误时记录日志并不计算费用"""
+        try:
+            prices = json.loads(os.getenv("MODEL_PRICES", "{}"))
+            if not isinstance(prices, dict):
+                raise ValueError("expected a JSON object")
+            return prices
+        except ValueError as e:
+            self.logger.error(f"Invalid MODEL_PRICES, costs will not be reported: {e}")
+            return {}
+
+    def latency_stats(self, hours: int) -> Dict[str, Any]:
+        """
+        统计最近 hours 小时内结束的各阶段耗时
+
+        数据来自按小时聚合的直方图，窗口起点按整点对齐。
+        """
+        since = datetime.now() - timedelta(hours=hours)
+        histograms = self.timeline_repository.latency_histograms(since)
+        stages = {}
+        for stage, _, _ in LATENCY_STAGES:
+            histogram = histograms.get(stage)
+            if not histogram or not histogram.count:
+                continue
+            stages[stage] = {
+                "count": histogram.count,
+                # 保留到微秒，数据库写入等亚毫秒级的阶段不会都显示为 0 或 1
+                "p50_ms": round(histogram.percentile(0.5), 3),
+                "p95_ms": round(histogram.percentile(0.95), 3),
+                "mean_ms": round(histogram.mean(), 3),
+            }
+        return {
+            "window_hours": hours,
+            "since": since.replace(minute=0, second=0, microsecond=0).isoformat(),
+            "stages": stages,
+        }
+
+    def usage_stats(self, days: int, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        统计最近 days 天（含今天）的 token 用量和费用
+
+        数据来自结果摄取时累加的按天汇总表，查询量只与天数和模型数有关。
+        """
+        since = date.today() - timedelta(days=days - 1)
+        by_day = self.usage_repository.daily(since, model)
+        by_model: Dict[str, Dict[str, int]] = {}
+        for row in by_day:
+            counts = by_model.setdefault(row["model"], dict.fromkeys(USAGE_FIELDS, 0))
+            for field in USAGE_FIELDS:
+                counts[field] += row[field]
+        return {
+            "window_days": days,
+            "since": since.isoformat(),
+            "total": self._with_cost(self._sum(by_model.values()), by_model),
+            "by_model": {name: self._with_cost(counts, {name: counts}) for name, counts in by_model.items()},
+            "by_day": [
+                dict(self._with_cost(row, {row["model"]: row}), day=row["day"].isoformat()) for row in by_day
+            ],
+        }
+
+    def task_usage(self, task_id: str) -> Dict[str, Any]:
+        """获取任务（含其重试任务）的 token 用量和费用"""
+        by_model = self.usage_repository.for_task(task_id)
+        if not by_model:
+            raise ValueError(f"Usage for task {task_id} not found")
+        return {
+            "task_id": task_id,
+            "total": self._with_cost(self._sum(by_model.values()), by_model),
+            "by_model": {name: self._with_cost(counts, {name: counts}) for name, counts in by_model.items()},
+        }
+
+    @staticmethod
+    def _sum(rows) -> Dict[str, int]:
+        total = dict.fromkeys(USAGE_FIELDS, 0)
+        for row in rows:
+            for field in USAGE_FIELDS:
+                total[field] += row[field]
+        return total
+
+    def _with_cost(self, counts: Dict[str, Any], by_model: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """附加按 MODEL_PRICES 计算的费用，任一模型未配置价格时费用为 None"""
+        cost = 0.0
+        for name, usage in by_model.items():
+            price = self.model_prices.get(name)
+            if price is None:
+                cost = None
+                break
+            cost += (usage["prompt_tokens"] * price.get("prompt", 0)
+                     + usage["completion_tokens"] * price.get("completion", 0)) / 1_000_000
+        return dict(counts, cost=round(cost, 6) if cost is not None else None)
+
+    def task_timeline(self, task_id: str) -> Dict[str, Any]:
+        """获取任务的时间线和各阶段耗时"""
+        timeline = self.timeline_repository.get(task_id)
+        if not timeline:
+            raise ValueError(f"Timeline for task {task_id} not found")
+        return {
+            "timeline": timeline.model_dump(),
+            "stages_ms": {stage: round(ms, 1) for stage, ms in timeline.stage_durations().items()},
+        }
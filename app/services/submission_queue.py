@@ -0,0 +1,99 @@
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from ..models.task_entity import Task
+
+
+class SubmissionQueue:
+    """
+    提交队列的调度策略
+
+    排序：deadline 临近的任务最先，其次按优先级从高到低、deadline 从早到晚、创建时间从早到晚。
+    配额：限制每个租户在途的批处理数和估算 token 数，以及全局在途批处理数，0 表示不限制。
+    全局上限同时受服务商密钥池的总配额限制（见 KeyPool.capacity）。
+    公平：每轮每个租户最多提交一个任务，大量积压的租户不会饿死其它租户。
+    """
+
+    def __init__(self, provider_capacity: Optional[Callable[[], int]] = None):
+        self.tenant_max_active_batches = int(os.getenv("TENANT_MAX_ACTIVE_BATCHES", "0"))
+        self.tenant_max_active_tokens = int(os.getenv("TENANT_MAX_ACTIVE_TOKENS", "0"))
+        self.max_active_batches = int(os.getenv("MAX_ACTIVE_BATCHES", "0"))
+        # deadline 在该时间内的任务视为紧急，排在所有任务之前（默认与批处理的 24h 完成窗口相同）
+        self.urgent_within = timedelta(seconds=float(os.getenv("DEADLINE_URGENT_SECONDS", str(24 * 3600))))
+        # 估算 token 数时每个 token 对应的字符数（中文约 1，英文约 4，取偏保守的值）
+        self.chars_per_token = 2
+        # 返回服务商当前可承载的在途批处理总数，0 表示不限制
+        self.provider_capacity = provider_capacity or (lambda: 0)
+
+    def global_limit(self) -> int:
+        """全局在途批处理数上限，取配置和密钥池配额中较小的非零值"""
+        limits = [limit for limit in (self.max_active_batches, self.provider_capacity()) if limit]
+        return min(limits) if limits else 0
+
+    def estimate_tokens(self, content: str, system_prompt: Optional[str] = None) -> int:
+        """按字符数粗略估算请求的输入 token 数"""
+        return max(1, math.ceil((len(content) + len(system_prompt or "")) / self.chars_per_token))
+
+    def sort_key(self, task: Task, now: datetime) -> tuple:
+        urgent = task.deadline is not None and task.deadline - now <= self.urgent_within
+        return (
+            not urgent,
+            -task.priority,
+            task.deadline is None,
+            task.deadline or datetime.max,
+            task.created_at,
+        )
+
+    def admits(self, task: Task, usage: Dict[Optional[str], Tuple[int, int]]) -> bool:
+        """在当前在途用量下，提交该任务是否不会超出配额"""
+        global_limit = self.global_limit()
+        if global_limit and sum(batches for batches, _ in usage.values()) >= global_limit:
+            return False
+        batches, tokens = usage.get(task.tenant, (0, 0))
+        if self.tenant_max_active_batches and batches >= self.tenant_max_active_batches:
+            return False
+        # 租户没有在途任务时总是允许提交，避免单个超大任务永远无法提交
+        if self.tenant_max_active_tokens and batches and tokens + (task.estimated_tokens or 0) > self.tenant_max_active_tokens:
+            return False
+        return True
+
+    def pick(self, queued: List[Task], usage: Dict[Optional[str], Tuple[int, int]],
+             limit: int, now: Optional[datetime] = None) -> List[Task]:
+        """
+        从排队的任务中选出本轮要提交的任务
+
+        Args:
+            queued: 排队中的任务
+            usage: 各租户在途的 (批处理数, token 数)，选中的任务会累加进去
+            limit: 本轮最多提交的任务数
+        """
+        now = now or datetime.now()
+        by_tenant: Dict[Optional[str], List[Task]] = {}
+        for task in sorted(queued, key=lambda t: self.sort_key(t, now)):
+            by_tenant.setdefault(task.tenant, []).append(task)
+
+        picked = []
+        while len(picked) < limit:
+            progressed = False
+            # 每轮按各租户队首任务的顺序轮流提交
+            heads = sorted(
+                (tasks for tasks in by_tenant.values() if tasks),
+                key=lambda tasks: self.sort_key(tasks[0], now)
+            )
+            for tasks in heads:
+                if len(picked) >= limit:
+                    break
+                task = tasks[0]
+                if not self.admits(task, usage):
+                    # 该租户已达到配额，本次不再调度
+                    tasks.clear()
+                    continue
+                tasks.pop(0)
+                batches, tokens = usage.get(task.tenant, (0, 0))
+                usage[task.tenant] = (batches + 1, tokens + (task.estimated_tokens or 0))
+                picked.append(task)
+                progressed = True
+            if not progressed:
+                break
+        return picked
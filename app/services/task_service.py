@@ -1,89 +1,591 @@
+import io
+import os
 import uuid
-import json
-from datetime import datetime
-from typing import List, Optional
-from ..models.task_entity import Task, TaskStatus
+import asyncio
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from sqlalchemy.exc import IntegrityError
+from ..models.task_entity import Task, TaskStatus, SubmissionState, TaskRoute
 from ..utils.jsonl_generator import JsonlGenerator
 from ..utils.logger import setup_logger
+from ..utils.json_codec import codec
+from ..utils.jsonl_generator import PromptTemplate
+from ..utils.variables_file import read_columns, count_rows, iter_values
+from ..utils.blob_store import BlobStore
+from ..utils.export_formats import EXPORT_COLUMNS
 from ..api_batch import BatchProcessor
 from pathlib import Path
 from ..repositories.task_repository import TaskRepository
+from ..repositories.timeline_repository import TimelineRepository
+from ..repositories.search_repository import SearchRepository
+from ..repositories.usage_repository import UsageRepository
+from .result_ingester import ResultIngester
+from .retry_policy import RetryPolicy
+from .submission_queue import SubmissionQueue
 import aiofiles
 
 class TaskService:
-    def __init__(self):
+    # 进程内正在创建中的幂等键，后到的重复请求等待首个请求完成
+    _inflight_keys: Dict[str, asyncio.Event] = {}
+    # 等待其它请求完成提交的轮询间隔和超时时间（秒）
+    submission_poll_interval = 0.5
+    submission_wait_timeout = 120
+    # 批量操作时并发调用服务商接口的上限
+    bulk_concurrency = 8
+    # 内容不超过该字符数的任务走实时接口，0 表示只有标记为交互式的任务走实时接口
+    realtime_max_chars = int(os.getenv("REALTIME_MAX_CHARS", "0"))
+    # 进程内同时进行的实时调用上限
+    realtime_concurrency = int(os.getenv("REALTIME_CONCURRENCY", "4"))
+    _realtime_semaphore: Optional[asyncio.Semaphore] = None
+    # 失败请求自动重新提交的最大次数
+    retry_max_attempts = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))
+    # 模板任务每个分片（即每个批处理）的最大请求数
+    template_shard_rows = int(os.getenv("TEMPLATE_SHARD_ROWS", "50000"))
+    # 提交队列每次调度最多提交的任务数
+    queue_submit_limit = int(os.getenv("QUEUE_SUBMIT_LIMIT", "20"))
+    # 输入JSONL在内存中生成后直接上传，超过该字节数才转存到匿名临时文件
+    spool_max_bytes = int(os.getenv("SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+    # 数据库中 content 和 system_prompt 只保存的预览字符数，完整内容保存在 BlobStore 中
+    preview_chars = 200
+    # 已结束的任务无需再取消批处理
+    TERMINAL_STATUSES = {
+        TaskStatus.COMPLETED.value,
+        TaskStatus.FAILED.value,
+        TaskStatus.EXPIRED.value,
+        TaskStatus.CANCELLING.value,
+        TaskStatus.CANCELLED.value,
+    }
+
+    def __init__(self, batch_processor: Optional[BatchProcessor] = None):
+        """
+        Args:
+            batch_processor: 共享的 BatchProcessor（见 app.container），为 None 时创建新的实例
+        """
         self.jsonl_generator = JsonlGenerator()
-        self.batch_processor = BatchProcessor()
+        self.batch_processor = batch_processor or BatchProcessor()
         self.logger = setup_logger(__name__)
         self.task_repository = TaskRepository()
+        self.timeline_repository = TimelineRepository()
+        self.search_repository = SearchRepository()
+        self.usage_repository = UsageRepository()
+        self.result_ingester = ResultIngester()
+        self.retry_policy = RetryPolicy()
+        self.blob_store = BlobStore()
+        self.submission_queue = SubmissionQueue(provider_capacity=self.batch_processor.key_pool.capacity)
 
-    def create_task(self, content: str, system_prompt: Optional[str] = None) -> Task:
-        """创建新任务"""
+    def create_task(self, content: str, system_prompt: Optional[str] = None,
+                    idempotency_key: Optional[str] = None, interactive: bool = False,
+                    priority: int = 0, deadline: Optional[datetime] = None,
+                    tenant: Optional[str] = None, model: Optional[str] = None,
+                    max_tokens: Optional[int] = None, temperature: Optional[float] = None) -> Task:
+        """
+        创建新任务，执行方式由 route_for 决定，未指定模型时使用默认模型
+
+        超过预览长度的 content 和 system_prompt 完整保存在 BlobStore 中（相同内容只保存一份），
+        数据库中只保存预览。
+        """
         task = Task(
             id=str(uuid.uuid4()),
             status=TaskStatus.VALIDATING.value,
-            content=content,
+            content=self._preview(content),
             created_at=datetime.now(),
             file_path=None,
             file_id=None,
             batch_id=None,
             error_message=None,
             result=None,
-            system_prompt=system_prompt
+            system_prompt=self._preview(system_prompt),
+            idempotency_key=idempotency_key,
+            submission_state=SubmissionState.PENDING.value,
+            route=self.route_for(content, interactive).value,
+            priority=priority,
+            deadline=deadline,
+            tenant=tenant,
+            estimated_tokens=self.submission_queue.estimate_tokens(content, system_prompt),
+            model=model or self.jsonl_generator.model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            content_blob=self._store_if_truncated(content),
+            system_prompt_blob=self._store_if_truncated(system_prompt)
+        )
+        task = self.task_repository.create(task)
+        task = self._restore_blobs(task, content_blob=content, system_prompt_blob=system_prompt)
+        self.record_timeline(task.id, accepted_at=task.created_at)
+        return task
+
+    def _restore_blobs(self, task: Task, **contents: Union[str, bytes]) -> Task:
+        """
+        任务写入数据库后确认其引用的 BlobStore 文件仍存在，缺失时重新写入
+
+        put 返回已有的文件后、任务写入数据库前，删除其它任务时可能因该文件暂未被引用而将其删除；
+        任务写入后文件已被引用，不会再被删除，补写即可。
+
+        Args:
+            contents: 字段名 -> 该字段文件的完整内容
+        """
+        changed = False
+        for field, data in contents.items():
+            path = getattr(task, field)
+            if path and not Path(path).exists():
+                self.logger.warning(f"Blob {path} of task {task.id} was deleted concurrently, writing it again")
+                restored = self.blob_store.put(data)
+                if restored != path:
+                    setattr(task, field, restored)
+                    changed = True
+        return self.task_repository.update(task) if changed else task
+
+    async def restore_downloads(self, task: Task) -> Task:
+        """下载的结果文件与已有文件相同时同理（见 _restore_blobs），任务更新后缺失的结果文件重新下载"""
+        changed = False
+        for path_field, id_field in (("output_file_path", "output_file_id"), ("error_file_path", "error_file_id")):
+            path, file_id = getattr(task, path_field), getattr(task, id_field)
+            if path and file_id and self.blob_store.is_blob(path) and not Path(path).exists():
+                self.logger.warning(f"Blob {path} of task {task.id} was deleted concurrently, downloading it again")
+                setattr(task, path_field, await self.download_file(file_id))
+                changed = True
+        return self.update_task(task) if changed else task
+
+    def _preview(self, text: Optional[str]) -> Optional[str]:
+        if text is None or len(text) <= self.preview_chars:
+            return text
+        return text[:self.preview_chars] + "..."
+
+    def _store_if_truncated(self, text: Optional[str]) -> Optional[str]:
+        """预览不完整时将完整内容保存到 BlobStore，返回文件路径"""
+        if text is None or len(text) <= self.preview_chars:
+            return None
+        return self.blob_store.put(text)
+
+    def _full_input(self, task: Task) -> Task:
+        """返回 content 和 system_prompt 为完整内容的任务副本，用于生成请求"""
+        update = {}
+        if task.content_blob:
+            update["content"] = self.blob_store.read_text(task.content_blob)
+        if task.system_prompt_blob:
+            update["system_prompt"] = self.blob_store.read_text(task.system_prompt_blob)
+        return task.model_copy(update=update) if update else task
+
+    def route_for(self, content: str, interactive: bool = False) -> TaskRoute:
+        """路由策略：交互式或内容较短的任务实时执行，其余任务打包为批处理"""
+        if interactive or (self.realtime_max_chars and len(content) <= self.realtime_max_chars):
+            return TaskRoute.REALTIME
+        return TaskRoute.BATCH
+
+    async def create_and_process_task(self, content: str, system_prompt: Optional[str] = None,
+                                      idempotency_key: Optional[str] = None,
+                                      interactive: bool = False, priority: int = 0,
+                                      deadline: Optional[datetime] = None,
+                                      tenant: Optional[str] = None, model: Optional[str] = None,
+                                      max_tokens: Optional[int] = None,
+                                      temperature: Optional[float] = None) -> Task:
+        """
+        创建并提交任务，支持幂等键
+
+        相同幂等键的重放请求直接返回已存在的任务；并发的重复请求等待首个请求
+        提交完成，不会再次上传文件或创建批处理任务。
+        """
+        options = dict(system_prompt=system_prompt, interactive=interactive,
+                       priority=priority, deadline=deadline, tenant=tenant,
+                       model=model, max_tokens=max_tokens, temperature=temperature)
+        if not idempotency_key:
+            task = self.create_task(content, **options)
+            return await self.submit_or_enqueue(task)
+
+        inflight = self._inflight_keys.get(idempotency_key)
+        if inflight is not None:
+            self.logger.info(f"Waiting for in-flight request with idempotency key: {idempotency_key}")
+            await inflight.wait()
+
+        existing = self.task_repository.get_by_idempotency_key(idempotency_key)
+        if existing:
+            self.logger.info(f"Replaying task {existing.id} for idempotency key: {idempotency_key}")
+            return await self._wait_for_submission(existing.id)
+
+        event = asyncio.Event()
+        self._inflight_keys[idempotency_key] = event
+        try:
+            try:
+                task = self.create_task(content, idempotency_key=idempotency_key, **options)
+            except IntegrityError:
+                # 其它进程已使用相同幂等键创建了任务
+                existing = self.task_repository.get_by_idempotency_key(idempotency_key)
+                if not existing:
+                    raise
+                return await self._wait_for_submission(existing.id)
+            return await self.submit_or_enqueue(task)
+        finally:
+            self._inflight_keys.pop(idempotency_key, None)
+            event.set()
+
+    async def submit_or_enqueue(self, task: Task) -> Task:
+        """
+        立即提交任务；租户已有排队的任务或在途用量超出配额时放入提交队列，由调度器按优先级提交
+
+        实时路由的任务不经过提交队列。配额检查和占用在同一个事务中完成（见 TaskRepository.reserve_submission），
+        并发的请求不会同时通过检查。
+        """
+        if task.route != TaskRoute.REALTIME.value and (
+            self.task_repository.has_queued(task.tenant)
+            or not self.task_repository.reserve_submission(
+                task.id, lambda usage: self.submission_queue.admits(task, usage)
+            )
+        ):
+            task.submission_state = SubmissionState.QUEUED.value
+            task = self.task_repository.update(task)
+            self.logger.info(f"Queued task {task.id} (tenant: {task.tenant}, priority: {task.priority})")
+            return task
+        return await self.process_task(task.id)
+
+    async def submit_queued(self) -> int:
+        """
+        按 SubmissionQueue 的顺序和配额提交排队中的任务
+
+        Returns:
+            int: 本次提交的任务数
+        """
+        queued = self.task_repository.list_queued()
+        if not queued:
+            return 0
+        usage = self.task_repository.active_usage_by_tenant()
+        picked = self.submission_queue.pick(queued, usage, self.queue_submit_limit)
+        submitted = 0
+        for task in picked:
+            # 选出后到提交前其它进程可能已占用了配额，占用时再检查一次
+            if not self.task_repository.reserve_submission(
+                task.id, lambda usage, task=task: self.submission_queue.admits(task, usage)
+            ):
+                continue
+            submitted += 1
+            try:
+                await self.process_task(task.id)
+            except Exception as e:
+                self.logger.error(f"Failed to submit queued task {task.id}: {e}", exc_info=True)
+        return submitted
+
+    async def _wait_for_submission(self, task_id: str) -> Task:
+        """等待任务提交完成（已创建批处理任务或已失败），超时则返回当前状态"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.submission_wait_timeout
+        task = self.get_task(task_id)
+        while task and self._is_submitting(task) and loop.time() < deadline:
+            await asyncio.sleep(self.submission_poll_interval)
+            task = self.get_task(task_id)
+        return task
+
+    @classmethod
+    def _is_submitting(cls, task: Task) -> bool:
+        """任务是否仍处于提交过程中（排队中的任务已被接受，不算在内）"""
+        if task.status in (TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+            return False
+        return cls._submission_state(task) not in (
+            SubmissionState.BATCH_CREATED, SubmissionState.EXECUTED, SubmissionState.QUEUED
         )
-        return self.task_repository.create(task)
+
+    async def create_template_tasks(self, template: str, variables_path: str,
+                                    system_prompt: Optional[str] = None, shard_rows: Optional[int] = None,
+                                    priority: int = 0, deadline: Optional[datetime] = None,
+                                    tenant: Optional[str] = None, model: Optional[str] = None,
+                                    max_tokens: Optional[int] = None,
+                                    temperature: Optional[float] = None) -> List[Task]:
+        """
+        用模板和变量文件创建任务，每 shard_rows 行一个任务（一个批处理）
+
+        任务只保存模板、变量文件路径和分片范围，提交时才逐行渲染。
+
+        Raises:
+            ValueError: 模板变量在变量文件中不存在，或变量文件为空
+        """
+        names = PromptTemplate.placeholders(template)
+        columns = await asyncio.to_thread(read_columns, variables_path)
+        missing = [name for name in names if name not in columns]
+        if missing:
+            raise ValueError(f"Variables file has no column(s): {', '.join(missing)}")
+        total = await asyncio.to_thread(count_rows, variables_path)
+        if not total:
+            raise ValueError("Variables file has no rows")
+
+        shard_rows = shard_rows or self.template_shard_rows
+        tokens_per_row = self.submission_queue.estimate_tokens(template, system_prompt)
+        tasks = []
+        for start in range(0, total, shard_rows):
+            end = min(start + shard_rows, total)
+            task = self.task_repository.create(Task(
+                id=str(uuid.uuid4()),
+                status=TaskStatus.VALIDATING.value,
+                content=template,
+                created_at=datetime.now(),
+                system_prompt=system_prompt,
+                submission_state=SubmissionState.PENDING.value,
+                route=TaskRoute.BATCH.value,
+                priority=priority,
+                deadline=deadline,
+                tenant=tenant,
+                estimated_tokens=tokens_per_row * (end - start),
+                template=template,
+                variables_path=variables_path,
+                shard_start=start,
+                shard_end=end,
+                model=model or self.jsonl_generator.model,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ))
+            self.record_timeline(task.id, accepted_at=task.created_at)
+            tasks.append(await self.submit_or_enqueue(task))
+        self.logger.info(f"Created {len(tasks)} template tasks for {total} rows from {variables_path}")
+        return tasks
+
+    @staticmethod
+    def _provider_resource_ids(tasks: List[Task]) -> List[Optional[str]]:
+        """任务在服务商处的文件和批处理ID"""
+        return [resource_id for task in tasks
+                for resource_id in (task.file_id, task.batch_id, task.output_file_id, task.error_file_id)]
+
+    def _remove_unreferenced_variables_files(self, tasks: List[Task]) -> None:
+        """删除任务后，清理不再被任何任务引用的变量文件"""
+        for path in {task.variables_path for task in tasks if task.variables_path}:
+            if not self.task_repository.is_variables_file_referenced(path):
+                Path(path).unlink(missing_ok=True)
+
+    def _remove_unreferenced_blobs(self, tasks: List[Task]) -> None:
+        """删除任务后，清理不再被任何任务引用的 BlobStore 文件"""
+        paths = {path for task in tasks
+                 for path in (task.content_blob, task.system_prompt_blob, task.output_file_path, task.error_file_path)
+                 if path and self.blob_store.is_blob(path)}
+        for path in paths:
+            if not self.task_repository.is_blob_referenced(path):
+                self.blob_store.delete(path)
 
     def create_multiple_tasks(self, contents: List[str]) -> List[Task]:
         """创建多个任务"""
         return [self.create_task(content) for content in contents]
 
     async def process_task(self, task_id: str) -> Task:
-        """处理任务"""
+        """
+        处理任务
+
+        提交过程按 SubmissionState 逐步推进，每一步都会持久化，
+        进程中断后可从最后完成的步骤继续（见 recover_submissions）。
+        """
         task = self.get_task(task_id)
         if not task:
             raise ValueError(f"Task not found: {task_id}")
+        if self._submission_state(task) in (SubmissionState.BATCH_CREATED, SubmissionState.EXECUTED):
+            return task
         
         try:
-            # 更新任务状态为处理中
+            # 更新任务状态为处理中，排队的任务从头开始提交
             task.status = TaskStatus.IN_PROGRESS.value
+            state = self._submission_state(task)
+            if state == SubmissionState.QUEUED:
+                state = SubmissionState.PENDING
+            task.submission_state = state.value
             task = self.task_repository.update(task)
-            
-            # 创建JSONL文件
-            file_path = self._create_jsonl_file(task)
-            task.file_path = file_path
-            
-            # 上传文件并获取file_id
-            file_id = await self.batch_processor.upload_file(file_path)
-            if not file_id:
-                task.status = TaskStatus.FAILED.value
-                task.error_message = "Failed to upload file: file_id is empty"
-                return self.task_repository.update(task)
-            
-            task.file_id = file_id
-            task = self.task_repository.update(task)  # 保存file_id
+
+            if task.route == TaskRoute.REALTIME.value:
+                return await self._process_realtime(task)
+
+            # 生成JSONL并上传，获取file_id
+            if task.submission_state in (SubmissionState.PENDING.value, SubmissionState.FILE_WRITTEN.value):
+                if task.file_path and Path(task.file_path).exists():
+                    # 旧版本写入temp目录的输入文件
+                    file_id = await self.batch_processor.upload_file(task.file_path)
+                else:
+                    # 在内存中生成，不落盘；进程中断时任务仍为PENDING，恢复时重新生成即可
+                    # 模板任务可能有大量行，在线程中生成避免阻塞事件循环
+                    with await asyncio.to_thread(self._build_jsonl, task) as buffer:
+                        self.record_timeline(task.id, jsonl_written_at=datetime.now())
+                        file_id = await self.batch_processor.upload_file(
+                            buffer, filename=f"batch_input_{task.id}.jsonl"
+                        )
+                if not file_id:
+                    return self._rollback_submission(task, "Failed to upload file: file_id is empty")
+
+                task.file_id = file_id
+                task.submission_state = SubmissionState.UPLOADED.value
+                task = self.task_repository.update(task)  # 保存file_id
+                self.record_timeline(task.id, uploaded_at=datetime.now())
             
             # 创建批处理任务
-            try:
-                batch = self.batch_processor.create_batch(file_id)
+            if task.submission_state == SubmissionState.UPLOADED.value:
+                try:
+                    batch = await asyncio.to_thread(self.batch_processor.create_batch, task.file_id)
+                except Exception as batch_error:
+                    self.logger.error(f"创建批处理任务失败: {str(batch_error)}")
+                    return self._rollback_submission(task, f"Failed to create batch: {str(batch_error)}")
+
                 task.batch_id = batch.id
                 task.status = batch.status
-                # 已经请求成功后，如果内容超过200个字符，截断并添加省略号
-                if len(task.content) > 200:
-                    task.content = task.content[:200] + "..."
-            
-            except Exception as batch_error:
-                task.status = TaskStatus.FAILED.value
-                task.error_message = f"Failed to create batch: {str(batch_error)}"
-                self.logger.error(f"创建批处理任务失败: {str(batch_error)}")
-                return self.task_repository.update(task)
+                task.submission_state = SubmissionState.BATCH_CREATED.value
+                self.record_timeline(task.id, batch=batch, batch_created_at=datetime.now())
+                # 已经请求成功后，如果内容超过200个字符，截断并添加省略号（完整内容已保存在 BlobStore 中）
+                task.content = self._preview(task.content)
                 
         except Exception as e:
-            task.status = TaskStatus.FAILED.value
-            task.error_message = str(e)
             self.logger.error(f"处理任务失败: {str(e)}")
+            return self._rollback_submission(task, str(e))
         
         return self.task_repository.update(task)
 
+    async def _process_realtime(self, task: Task) -> Task:
+        """
+        通过 chat.completions 实时执行任务
+
+        结果按批处理输出文件的格式写入 BlobStore，与批处理任务共用结果读取逻辑。
+        """
+        full = await asyncio.to_thread(self._full_input, task)
+        request = self.jsonl_generator.generate_request(
+            full.content,
+            system_prompt=full.system_prompt or "You are a helpful assistant.",
+            model=task.model,
+            max_tokens=task.max_tokens,
+            temperature=task.temperature
+        )
+        async with self._get_realtime_semaphore():
+            self.record_timeline(task.id, realtime_started_at=datetime.now())
+            completion = await asyncio.to_thread(self.batch_processor.chat_completion, request["body"])
+
+        result = {
+            "id": uuid.uuid4().hex,
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "request_id": completion.id, "body": completion.model_dump()},
+            "error": None,
+        }
+        output = codec.dumps_bytes(result) + b'\n'
+        task.output_file_path = await asyncio.to_thread(self.blob_store.put, output)
+        task.result = self.result_ingester.summarize([result], [], task.output_file_path, None)
+        task.status = TaskStatus.COMPLETED.value
+        task.submission_state = SubmissionState.EXECUTED.value
+        task.content = self._preview(task.content)
+        task = self.task_repository.update(task)
+        task = self._restore_blobs(task, output_file_path=output)
+        self.record_timeline(task.id, finished=True, realtime_completed_at=datetime.now())
+        self.record_usage(task, [result])
+        await self.index_task(task)
+        return task
+
+    @classmethod
+    def _get_realtime_semaphore(cls) -> asyncio.Semaphore:
+        """实时调用的并发限制在进程内所有 TaskService 实例间共享"""
+        if cls._realtime_semaphore is None:
+            cls._realtime_semaphore = asyncio.Semaphore(cls.realtime_concurrency)
+        return cls._realtime_semaphore
+
+    def _rollback_submission(self, task: Task, error_message: str) -> Task:
+        """提交失败时删除已上传的远程文件和本地文件，并将任务标记为失败"""
+        if task.file_id and not task.batch_id:
+            try:
+                self.batch_processor.delete_file(task.file_id)
+                task.file_id = None
+            except Exception as e:
+                self.logger.warning(f"Failed to delete remote file {task.file_id}: {e}")
+        if task.file_path and not task.batch_id:
+            Path(task.file_path).unlink(missing_ok=True)
+            task.file_path = None
+        task.status = TaskStatus.FAILED.value
+        task.error_message = error_message
+        return self.task_repository.update(task)
+
+    @staticmethod
+    def _submission_state(task: Task) -> SubmissionState:
+        """获取任务的提交状态，旧数据没有该字段时根据已保存的信息推断"""
+        if task.submission_state:
+            return SubmissionState(task.submission_state)
+        if task.batch_id:
+            return SubmissionState.BATCH_CREATED
+        if task.file_id:
+            return SubmissionState.UPLOADED
+        if task.file_path:
+            return SubmissionState.FILE_WRITTEN
+        return SubmissionState.PENDING
+
+    async def recover_submissions(self, stale_after_seconds: Optional[float] = None) -> None:
+        """
+        恢复中断的提交
+
+        已上传但未记录batch_id的任务先在服务商处查找是否已有对应批处理，
+        避免重复创建；其余任务从最后完成的步骤继续提交，失败则回滚。
+        同时清理temp目录中不属于任何任务的输入文件。
+
+        Args:
+            stale_after_seconds: 只恢复超过该时间未更新的提交，多进程部署时避免接管其它进程正在进行的提交
+        """
+        stale_before = None
+        if stale_after_seconds is not None:
+            stale_before = datetime.now() - timedelta(seconds=stale_after_seconds)
+        tasks = self.task_repository.list_incomplete_submissions(stale_before)
+        if tasks:
+            self.logger.info(f"Recovering {len(tasks)} incomplete submissions")
+
+        for task in tasks:
+            try:
+                if self._submission_state(task) == SubmissionState.UPLOADED:
+                    batch = self._find_batch_for_file(task.file_id)
+                    if batch:
+                        self.logger.info(f"Found existing batch {batch.id} for task {task.id}")
+                        task.batch_id = batch.id
+                        task.status = batch.status
+                        task.submission_state = SubmissionState.BATCH_CREATED.value
+                        self.task_repository.update(task)
+                        self.record_timeline(task.id, batch=batch, batch_created_at=datetime.now())
+                        continue
+                recovered = await self.process_task(task.id)
+                self.logger.info(f"Recovered task {task.id}: status={recovered.status}, "
+                                 f"submission_state={recovered.submission_state}")
+            except Exception as e:
+                self.logger.error(f"Failed to recover task {task.id}: {e}", exc_info=True)
+
+        self._remove_orphaned_input_files()
+
+    def _find_batch_for_file(self, file_id: str, max_pages: int = 5):
+        """在输入文件所属密钥最近的批处理任务中查找输入文件为file_id的批处理"""
+        key_id = self.batch_processor.key_for(file_id)
+        after = None
+        for _ in range(max_pages):
+            page = self.batch_processor.list_batches(after=after, limit=100, key_id=key_id)
+            for batch in page.data:
+                if batch.input_file_id == file_id:
+                    return batch
+            if not page.has_more or not page.data:
+                return None
+            after = page.data[-1].id
+        return None
+
+    def _remove_orphaned_input_files(self) -> None:
+        """删除temp目录中对应任务已不存在的输入文件"""
+        temp_dir = Path("temp")
+        if not temp_dir.exists():
+            return
+        prefix = "batch_input_"
+        for path in temp_dir.glob(f"{prefix}*.jsonl"):
+            task_id = path.stem[len(prefix):]
+            if self.task_repository.get_version(task_id) is None:
+                self.logger.info(f"Removing orphaned input file: {path}")
+                path.unlink(missing_ok=True)
+
+    def record_timeline(self, task_id: str, batch=None, finished: bool = False,
+                        **stamps: Optional[datetime]) -> None:
+        """
+        记录任务时间线
+
+        Args:
+            task_id: 任务ID
+            batch: 批处理详情，记录其中服务商返回的各状态时间戳
+            finished: 任务是否已结束，结束时将各阶段耗时计入聚合表
+            stamps: 本地阶段的时间点，如 uploaded_at=datetime.now()
+
+        时间线只用于统计，记录失败不影响任务处理。
+        """
+        try:
+            if stamps:
+                self.timeline_repository.mark(task_id, **stamps)
+            if batch is not None:
+                self.timeline_repository.record_batch(task_id, batch)
+            if finished:
+                self.timeline_repository.aggregate(task_id)
+        except Exception as e:
+            self.logger.warning(f"Failed to record timeline for task {task_id}: {e}")
+
     def get_task(self, task_id: str) -> Optional[Task]:
         """获取任务"""
         return self.task_repository.get(task_id)
@@ -92,6 +594,14 @@ class TaskService:
         """获取所有任务"""
         return self.task_repository.list_all()
 
+    def get_task_version(self, task_id: str) -> Optional[int]:
+        """获取任务版本号，任务不存在时返回None"""
+        return self.task_repository.get_version(task_id)
+
+    def get_tasks_version(self) -> int:
+        """获取任务表的变更序号"""
+        return self.task_repository.get_table_version()
+
     async def cancel_task(self, task_id: str) -> Task:
         """取消任务"""
         task = self.task_repository.get(task_id)
@@ -160,29 +670,37 @@ class TaskService:
             self.task_repository.update(task)
             raise
 
-    def _create_jsonl_file(self, task: Task) -> str:
-        """为单个任务创建JSONL文件"""
-        temp_dir = Path("temp")
-        temp_dir.mkdir(exist_ok=True)
-        file_path = temp_dir / f"batch_input_{task.id}.jsonl"
-        return self.jsonl_generator.create_jsonl_file(task, str(file_path))
+    def _build_jsonl(self, task: Task) -> tempfile.SpooledTemporaryFile:
+        """
+        生成任务的JSONL到内存缓冲区并定位到开头
+
+        超过 spool_max_bytes 时自动转存到匿名临时文件，关闭后即删除，不会留下孤立文件。
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes, mode='w+b')
+        try:
+            if task.template:
+                self.jsonl_generator.write_template(task, buffer)
+            else:
+                self.jsonl_generator.write_jsonl(self._full_input(task), buffer)
+            buffer.seek(0)
+            return buffer
+        except BaseException:
+            buffer.close()
+            raise
 
     async def download_file(self, file_id: str, save_path: str = None) -> str:
         """下载文件并保存到指定路径
         Args:
             file_id: 文件ID
-            save_path: 保存路径，如果为空则保存到 results 目录
+            save_path: 保存路径，如果为空则边下载边压缩保存到 BlobStore
         Returns:
             str: 实际保存的文件路径
         """
         try:
             if save_path is None:
-                # 创建 results 目录（如果不存在）
-                results_dir = Path("results")
-                results_dir.mkdir(exist_ok=True)
-                # 生成默认文件名
-                save_path = str(results_dir / f"{file_id}")
+                return await asyncio.to_thread(self.batch_processor.stream_file, file_id, self.blob_store.put_stream)
 
+            Path(save_path).parent.mkdir(parents=True, exist_ok=True)
             response = await self.batch_processor.download_results(file_id, save_path)
             return response
         except Exception as e:
@@ -195,47 +713,335 @@ class TaskService:
         return TaskRepository.to_model(db_task)
 
     async def get_task_result_content(self, task_id: str) -> dict:
-        """获取任务结果文件的内容"""
+        """获取任务结果文件的内容，已重试的请求以重试结果为准"""
         task = self.get_task(task_id)
         if not task or not task.result:
             raise ValueError("任务不存在或没有结果")
 
         result_content = {}
-        
-        # 读取输出文件
-        if task.output_file_path:
-            try:
-                async with aiofiles.open(task.output_file_path, 'r', encoding='utf-8') as f:
-                    content = await f.read()
-                    # 解析JSON并提取content字段
-                    data = json.loads(content)
-                    if isinstance(data, dict):
-                        # 正确的路径: response -> body -> choices[0] -> message -> content
-                        response_body = data.get('response', {}).get('body', {})
-                        choices = response_body.get('choices', [])
-                        if choices:
-                            message = choices[0].get('message', {})
-                            result_content["output"] = message.get('content', '')
-                        else:
-                            result_content["output"] = "No content found in response"
-                    else:
-                        result_content["output"] = "Invalid response format"
-            except Exception as e:
-                self.logger.error(f"读取输出文件失败: {str(e)}")
-                result_content["output_error"] = str(e)
+        try:
+            merged = await asyncio.to_thread(self.get_merged_results, task_id)
+        except Exception as e:
+            self.logger.error(f"读取结果文件失败: {str(e)}")
+            result_content["output_error"] = str(e)
+            return result_content
 
-        # 读取错误文件
-        if task.error_file_path:
-            try:
-                async with aiofiles.open(task.error_file_path, 'r', encoding='utf-8') as f:
-                    error_content = await f.read()
-                    result_content["error"] = json.loads(error_content)
-            except Exception as e:
-                self.logger.error(f"读取错误文件失败: {str(e)}")
-                result_content["error_file_error"] = str(e)
+        outputs, errors = [], []
+        for line in merged["results"]:
+            if not self.retry_policy.is_success(line):
+                errors.append(line)
+                continue
+            # 正确的路径: response -> body -> choices[0] -> message -> content
+            choices = (line["response"].get("body") or {}).get("choices", [])
+            if choices:
+                outputs.append(choices[0].get("message", {}).get("content", ""))
+            else:
+                outputs.append("No content found in response")
 
+        if outputs:
+            result_content["output"] = "\n\n".join(outputs)
+        if errors:
+            result_content["error"] = errors[0] if len(errors) == 1 else errors
         return result_content
 
+    def get_merged_results(self, task_id: str) -> dict:
+        """
+        合并任务及其重试任务的结果
+
+        同一 custom_id 以成功的结果为准，都未成功时保留最近一次的错误。
+        """
+        task = self.get_task(task_id)
+        if not task:
+            raise ValueError(f"Task {task_id} not found")
+
+        attempts = [task]
+        child = self.task_repository.get_retry_child(task.id)
+        while child:
+            attempts.append(child)
+            child = self.task_repository.get_retry_child(child.id)
+
+        merged: Dict[str, dict] = {}
+        for attempt in attempts:
+            for path in (attempt.output_file_path, attempt.error_file_path):
+                if not path or not Path(path).exists():
+                    continue
+                for line in self.result_ingester.read_lines(path):
+                    previous = merged.get(line.get("custom_id"))
+                    if previous is None or not self.retry_policy.is_success(previous):
+                        merged[line.get("custom_id")] = line
+
+        results = list(merged.values())
+        succeeded = sum(1 for line in results if self.retry_policy.is_success(line))
+        return {
+            "task_id": task.id,
+            "attempts": [attempt.id for attempt in attempts],
+            "retry_in_progress": len(attempts) > 1 and attempts[-1].status not in self.TERMINAL_STATUSES,
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        }
+
+    def iter_export_rows(self, task_ids: Optional[List[str]] = None, status: Optional[str] = None,
+                         created_after: Optional[datetime] = None,
+                         created_before: Optional[datetime] = None) -> Iterator[dict]:
+        """
+        逐行生成导出数据：每个请求一行，关联输入、合并重试后的结果、用量和错误
+
+        任务分页读取，每次只在内存中保存一个任务的结果；模板任务的输入按 custom_id
+        （row-<行号>）从变量文件流式还原，尚无结果的任务也输出其输入。
+        """
+        for task in self.task_repository.iter_filtered(task_ids, status, created_after, created_before):
+            merged = {line.get("custom_id"): line for line in self.get_merged_results(task.id)["results"]}
+            full = self._full_input(task)
+            base = {
+                "task_id": task.id,
+                "task_status": task.status,
+                "model": task.model or self.jsonl_generator.model,
+                "system_prompt": full.system_prompt,
+                "created_at": task.created_at.isoformat() if task.created_at else None,
+            }
+            if task.template and task.variables_path:
+                if not Path(task.variables_path).exists():
+                    self.logger.warning(f"Variables file of task {task.id} is missing, exporting results only")
+                    for custom_id, line in merged.items():
+                        yield self._export_row(base, custom_id, None, line)
+                    continue
+                for custom_id, input_text in self._iter_template_inputs(full):
+                    yield self._export_row(base, custom_id, input_text, merged.get(custom_id))
+            elif merged:
+                for custom_id, line in merged.items():
+                    yield self._export_row(base, custom_id, full.content, line)
+            else:
+                yield self._export_row(base, None, full.content, None)
+
+    def _iter_template_inputs(self, task: Task) -> Iterator[Tuple[str, str]]:
+        """从变量文件还原模板任务各请求的用户消息，返回 (custom_id, 文本)"""
+        template = PromptTemplate(task.template, task.system_prompt or "", task.model or self.jsonl_generator.model)
+        rows = iter_values(task.variables_path, template.names, task.shard_start, task.shard_end)
+        for row_number, values in enumerate(rows, task.shard_start):
+            yield f"row-{row_number}", template.fill(values)
+
+    def _export_row(self, base: dict, custom_id: Optional[str], input_text: Optional[str],
+                    line: Optional[dict]) -> dict:
+        row = dict.fromkeys(EXPORT_COLUMNS)
+        row.update(base, custom_id=custom_id, input=input_text)
+        if line is None:
+            return row
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if not isinstance(body, dict):
+            body = {}
+        row["succeeded"] = self.retry_policy.is_success(line)
+        choices = body.get("choices") or []
+        if choices:
+            row["output"] = (choices[0].get("message") or {}).get("content")
+            row["finish_reason"] = choices[0].get("finish_reason")
+        usage = body.get("usage") or {}
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            row[field] = usage.get(field)
+        error = line.get("error") or body.get("error")
+        if isinstance(error, dict):
+            row["error_code"] = str(error["code"]) if error.get("code") is not None else None
+            row["error_message"] = error.get("message")
+        elif error:
+            row["error_message"] = str(error)
+        elif not row["succeeded"]:
+            row["error_code"] = str(response.get("status_code"))
+        return row
+
+    async def index_task(self, task: Task) -> None:
+        """将任务的输入和本次得到的输出写入全文索引，失败只记录警告，不影响结果摄取"""
+        try:
+            count = await asyncio.to_thread(self._index_task, task)
+            self.logger.debug("Indexed %d search documents for task %s", count, task.id)
+        except Exception as e:
+            self.logger.warning(f"Failed to index task {task.id} for search: {e}")
+
+    def _index_task(self, task: Task) -> int:
+        """
+        索引一个任务（或重试任务）的文档，只在结果摄取时调用一次，重复调用会替换之前的文档
+
+        原任务索引输入和输出，重试任务只索引输出，命中结果都指向原任务。
+        """
+        output_lines = []
+        if task.output_file_path and Path(task.output_file_path).exists():
+            output_lines = self.result_ingester.read_lines(task.output_file_path)
+
+        documents: List[Tuple[Optional[str], str, str]] = []
+        if not task.parent_task_id:
+            full = self._full_input(task)
+            if task.template and task.variables_path:
+                if Path(task.variables_path).exists():
+                    documents.extend((custom_id, "input", text) for custom_id, text in self._iter_template_inputs(full))
+            elif full.content:
+                custom_id = output_lines[0].get("custom_id") if len(output_lines) == 1 else None
+                documents.append((custom_id, "input", full.content))
+
+        for line in output_lines:
+            body = (line.get("response") or {}).get("body") or {}
+            choices = body.get("choices") if isinstance(body, dict) else None
+            content = (choices[0].get("message") or {}).get("content") if choices else None
+            if content:
+                documents.append((line.get("custom_id"), "output", content))
+        return self.search_repository.replace(self._root_task_id(task), task.id, documents)
+
+    def _root_task_id(self, task: Task) -> str:
+        """重试链最上游的原任务ID"""
+        root_id = task.id
+        parent_id = task.parent_task_id
+        while parent_id:
+            parent = self.task_repository.get(parent_id)
+            if not parent:
+                break
+            root_id, parent_id = parent.id, parent.parent_task_id
+        return root_id
+
+    def record_usage(self, task: Task, lines: List[dict]) -> None:
+        """
+        从结果行中提取 token 用量并计入按天、模型和任务的汇总，每个任务只计入一次
+
+        在结果摄取时调用，之后的用量统计只读取汇总表，不再解析结果文件。失败只记录警告。
+        用量计入批处理完成的那一天（见 _completed_on），而不是摄取的那一天。
+        """
+        try:
+            usage = self.result_ingester.usage_by_model(lines, task.model or self.jsonl_generator.model)
+            if usage:
+                self.usage_repository.record(self._root_task_id(task), task.id, self._completed_on(task), usage)
+        except Exception as e:
+            self.logger.warning(f"Failed to record usage for task {task.id}: {e}")
+
+    def _completed_on(self, task: Task) -> date:
+        """
+        任务结果产生的日期：依次取时间线中服务商返回的完成（或过期）时间、检测到完成的时间和实时调用完成的时间，
+        都没有时为当天。结果延迟下载（如停机后恢复）时用量仍计入完成的那一天。
+        """
+        timeline = self.timeline_repository.get(task.id)
+        if timeline:
+            for stamp in (timeline.provider_completed_at, timeline.provider_expired_at,
+                          timeline.completion_detected_at, timeline.realtime_completed_at):
+                if stamp:
+                    return stamp.date()
+        return date.today()
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> dict:
+        """
+        在任务输入和输出中全文检索，按相关度排序
+
+        Raises:
+            ValueError: 查询不合法
+        """
+        expression = self.search_repository.match_expression(query)
+        hits = self.search_repository.search(expression, limit + 1, offset)
+        return {
+            "query": query,
+            "limit": limit,
+            "offset": offset,
+            "has_more": len(hits) > limit,
+            "hits": hits[:limit],
+        }
+
+    async def handle_batch_finished(self, task: Task) -> Optional[Task]:
+        """
+        批处理结束（完成或过期）并下载结果后调用
+
+        使上游任务的结果缓存失效，并重新提交可重试的失败请求。
+
+        Returns:
+            Optional[Task]: 新建的重试任务
+        """
+        parent_id = task.parent_task_id
+        while parent_id:
+            self.task_repository.touch(parent_id)
+            parent = self.task_repository.get(parent_id)
+            parent_id = parent.parent_task_id if parent else None
+        return await self.resubmit_failed_requests(task)
+
+    async def resubmit_failed_requests(self, task: Task) -> Optional[Task]:
+        """
+        将可重试的失败请求（限流、超时、服务端错误、过期）重新打包为新的批处理任务
+
+        只提交失败的请求，保留原 custom_id，新任务通过 parent_task_id 关联原任务。
+
+        Returns:
+            Optional[Task]: 新建的重试任务，没有可重试的请求或已达到重试上限时返回 None
+        """
+        if task.attempt >= self.retry_max_attempts:
+            return None
+        if self.task_repository.get_retry_child(task.id):
+            return None
+
+        input_lines = await self._load_input_lines(task)
+        # 结果文件可能很大，在线程中解压和解析
+        output_lines = await asyncio.to_thread(self.result_ingester.lines_of, task.output_file_path)
+        error_lines = await asyncio.to_thread(self.result_ingester.lines_of, task.error_file_path)
+        retry_ids = set(self.retry_policy.retryable_ids(
+            [custom_id for custom_id, _ in input_lines], output_lines, error_lines,
+            expired=task.status == TaskStatus.EXPIRED.value
+        ))
+        if not retry_ids:
+            return None
+
+        # 重试任务的输入无法从content重新生成，先从内存上传再创建任务，记录的任务总是已有file_id
+        retry_id = str(uuid.uuid4())
+        data = b"".join(raw + b"\n" for custom_id, raw in input_lines if custom_id in retry_ids)
+        accepted_at = datetime.now()
+        file_id = await self.batch_processor.upload_file(io.BytesIO(data), filename=f"batch_input_{retry_id}.jsonl")
+        if not file_id:
+            self.logger.error(f"Failed to upload retry input of task {task.id}: file_id is empty")
+            return None
+
+        retry = self.task_repository.create(Task(
+            id=retry_id,
+            status=TaskStatus.VALIDATING.value,
+            content=task.content,
+            created_at=accepted_at,
+            system_prompt=task.system_prompt,
+            file_id=file_id,
+            submission_state=SubmissionState.UPLOADED.value,
+            route=TaskRoute.BATCH.value,
+            parent_task_id=task.id,
+            attempt=task.attempt + 1,
+            priority=task.priority,
+            deadline=task.deadline,
+            tenant=task.tenant,
+            estimated_tokens=task.estimated_tokens,
+            model=task.model,
+            max_tokens=task.max_tokens,
+            temperature=task.temperature,
+            content_blob=task.content_blob,
+            system_prompt_blob=task.system_prompt_blob
+        ))
+        self.record_timeline(retry.id, accepted_at=accepted_at, uploaded_at=datetime.now())
+
+        self.logger.info(f"Resubmitting {len(retry_ids)} failed requests of task {task.id} "
+                         f"as task {retry.id} (attempt {retry.attempt})")
+        return await self.process_task(retry.id)
+
+    async def _load_input_lines(self, task: Task) -> List[Tuple[str, bytes]]:
+        """
+        读取任务输入的各行及其 custom_id
+
+        依次尝试旧版本留下的本地输入文件、按模板和变量文件在内存中重新生成
+        （custom_id 确定），最后从服务商读取已上传的输入文件，均不写入本地。
+        """
+        path = Path(task.file_path) if task.file_path else None
+        if path and path.exists():
+            async with aiofiles.open(path, 'rb') as f:
+                data = await f.read()
+        elif task.template and task.variables_path and Path(task.variables_path).exists():
+            with await asyncio.to_thread(self._build_jsonl, task) as buffer:
+                data = buffer.read()
+        elif task.file_id:
+            try:
+                data = await self.batch_processor.read_file(task.file_id)
+            except Exception as e:
+                self.logger.warning(f"Failed to read input file {task.file_id} of task {task.id}: {e}")
+                return []
+        else:
+            return []
+        return [(codec.loads(line).get("custom_id"), line) for line in data.splitlines() if line.strip()]
+
     async def delete_task(self, task_id: str) -> None:
         """删除任务及其相关资源"""
         task = self.task_repository.get(task_id)
@@ -243,58 +1049,142 @@ class TaskService:
             raise ValueError(f"Task {task_id} not found")
 
         try:
-            # 如果有批处理任务，尝试取消
+            semaphore = asyncio.Semaphore(self.bulk_concurrency)
+            await self._release_task_resources(task, semaphore)
+
+            # 从数据库中删除任务
+            self.task_repository.delete(task_id)
+            self.timeline_repository.delete_many([task_id])
+            self.search_repository.delete_tasks([task_id])
+            self.usage_repository.delete_many([task_id])
+            self.batch_processor.forget(self._provider_resource_ids([task]))
+            self._remove_unreferenced_variables_files([task])
+            self._remove_unreferenced_blobs([task])
+            
+        except Exception as e:
+            self.logger.error(f"Error while deleting task {task_id}: {e}")
+            raise Exception(f"Failed to delete task: {str(e)}") 
+
+    async def bulk_cancel_tasks(self, task_ids: Optional[List[str]] = None, status: Optional[str] = None,
+                                created_before: Optional[datetime] = None) -> List[dict]:
+        """
+        批量取消任务，并发调用服务商接口
+
+        Returns:
+            List[dict]: 每个任务的处理结果
+        """
+        tasks = self.task_repository.list_filtered(task_ids, status, created_before)
+        semaphore = asyncio.Semaphore(self.bulk_concurrency)
+
+        async def cancel_one(task: Task) -> dict:
+            if task.status in self.TERMINAL_STATUSES:
+                return {"task_id": task.id, "success": False, "error": f"Task is already {task.status}"}
             if task.batch_id:
                 try:
-                    self.batch_processor.cancel_batch(task.batch_id)
+                    await self._call_provider(semaphore, self.batch_processor.cancel_batch, task.batch_id)
                 except Exception as e:
                     self.logger.warning(f"Failed to cancel batch {task.batch_id}: {e}")
+                    return {"task_id": task.id, "success": False, "error": str(e)}
 
-            # 如果有远程文件，尝试删除
+            warnings = []
             if task.file_id:
                 try:
-                    self.batch_processor.delete_file(task.file_id)
+                    await self._call_provider(semaphore, self.batch_processor.delete_file, task.file_id)
                 except Exception as e:
-                    self.logger.warning(f"Failed to delete remote file {task.file_id}: {e}")
-
-            # 删除本地文件
+                    warnings.append(f"Failed to delete remote file {task.file_id}: {e}")
             if task.file_path:
+                # 批处理已取消，删除本地文件失败（如权限不足）只作为警告，不影响其它任务
                 try:
                     Path(task.file_path).unlink(missing_ok=True)
-                except Exception as e:
-                    self.logger.warning(f"Failed to delete local file {task.file_path}: {e}")
-            
-            if task.output_file_id:
-                try:
-                    self.batch_processor.delete_file(task.output_file_id)
-                except Exception as e:
-                    self.logger.warning(f"Failed to delete remote file {task.output_file_id}: {e}")
-            
-            if task.error_file_id:
-                try:
-                    self.batch_processor.delete_file(task.error_file_id)
-                except Exception as e:
-                    self.logger.warning(f"Failed to delete remote file {task.error_file_id}: {e}")
-            
-            if task.output_file_path:
-                try:
-                    Path(task.output_file_path).unlink(missing_ok=True)
-                except Exception as e:
-                    self.logger.warning(f"Failed to delete local file {task.output_file_path}: {e}")
-            
-            if task.error_file_path:
+                except OSError as e:
+                    warnings.append(f"Failed to delete local file {task.file_path}: {e}")
+            return {"task_id": task.id, "success": True, "warnings": warnings}
+
+        outcomes = await asyncio.gather(*[cancel_one(task) for task in tasks])
+        cancelled_ids = [outcome["task_id"] for outcome in outcomes if outcome["success"]]
+        self.task_repository.update_status_many(cancelled_ids, TaskStatus.CANCELLED.value)
+        return list(outcomes) + self._missing_task_outcomes(task_ids, tasks)
+
+    async def bulk_delete_tasks(self, task_ids: Optional[List[str]] = None, status: Optional[str] = None,
+                                created_before: Optional[datetime] = None) -> List[dict]:
+        """
+        批量删除任务及其相关资源，并发调用服务商接口，一次性删除数据库记录
+
+        Returns:
+            List[dict]: 每个任务的处理结果
+        """
+        tasks = self.task_repository.list_filtered(task_ids, status, created_before)
+        semaphore = asyncio.Semaphore(self.bulk_concurrency)
+        all_warnings = await asyncio.gather(
+            *[self._release_task_resources(task, semaphore) for task in tasks]
+        )
+        self.task_repository.delete_many([task.id for task in tasks])
+        self.timeline_repository.delete_many([task.id for task in tasks])
+        self.search_repository.delete_tasks([task.id for task in tasks])
+        self.usage_repository.delete_many([task.id for task in tasks])
+        self.batch_processor.forget(self._provider_resource_ids(tasks))
+        self._remove_unreferenced_variables_files(tasks)
+        self._remove_unreferenced_blobs(tasks)
+        outcomes = [
+            {"task_id": task.id, "success": True, "warnings": warnings}
+            for task, warnings in zip(tasks, all_warnings)
+        ]
+        return outcomes + self._missing_task_outcomes(task_ids, tasks)
+
+    async def _release_task_resources(self, task: Task, semaphore: asyncio.Semaphore) -> List[str]:
+        """
+        取消批处理并删除任务的远程文件和本地文件，失败只记录警告
+
+        Returns:
+            List[str]: 警告信息
+        """
+        warnings = []
+
+        # 如果批处理任务未结束，先尝试取消
+        if task.batch_id and task.status not in self.TERMINAL_STATUSES:
+            try:
+                await self._call_provider(semaphore, self.batch_processor.cancel_batch, task.batch_id)
+            except Exception as e:
+                warnings.append(f"Failed to cancel batch {task.batch_id}: {e}")
+
+        # 并发删除远程文件
+        file_ids = [file_id for file_id in (task.file_id, task.output_file_id, task.error_file_id) if file_id]
+        results = await asyncio.gather(
+            *[self._call_provider(semaphore, self.batch_processor.delete_file, file_id) for file_id in file_ids],
+            return_exceptions=True
+        )
+        for file_id, result in zip(file_ids, results):
+            if isinstance(result, Exception):
+                warnings.append(f"Failed to delete remote file {file_id}: {result}")
+
+        # 删除本地文件（BlobStore 中的文件可能被其它任务共用，删除任务后再清理）
+        for path in (task.file_path, task.output_file_path, task.error_file_path):
+            if path and not self.blob_store.is_blob(path):
                 try:
-                    Path(task.error_file_path).unlink(missing_ok=True)
+                    Path(path).unlink(missing_ok=True)
                 except Exception as e:
-                    self.logger.warning(f"Failed to delete local file {task.error_file_path}: {e}")
+                    warnings.append(f"Failed to delete local file {path}: {e}")
 
+        for warning in warnings:
+            self.logger.warning(warning)
+        return warnings
 
-            # 从数据库中删除任务
-            self.task_repository.delete(task_id)
-            
-        except Exception as e:
-            self.logger.error(f"Error while deleting task {task_id}: {e}")
-            raise Exception(f"Failed to delete task: {str(e)}") 
+    @staticmethod
+    async def _call_provider(semaphore: asyncio.Semaphore, func, *args):
+        """在线程池中执行同步的服务商接口调用，并用信号量限制并发数"""
+        async with semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    @staticmethod
+    def _missing_task_outcomes(task_ids: Optional[List[str]], tasks: List[Task]) -> List[dict]:
+        """为请求中不存在的任务ID生成失败结果"""
+        if task_ids is None:
+            return []
+        found = {task.id for task in tasks}
+        return [
+            {"task_id": task_id, "success": False, "error": "Task not found"}
+            for task_id in dict.fromkeys(task_ids) if task_id not in found
+        ]
 
     def get_batch_status(self, batch_id: str) -> dict:
         """获取批处理详情"""
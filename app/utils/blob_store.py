@@ -0,0 +1,128 @@
+"""
+按内容寻址的压缩文件存储
+
+内容以未压缩数据的 SHA-256 命名，相同内容只保存一份；写入时流式压缩，
+读取时根据扩展名流式解压，未压缩的旧文件（如 results/ 下的结果文件）按原样读取。
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，未安装时使用 gzip
+    zstandard = None
+
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+
+class BlobStore:
+    # 读取时的块大小
+    chunk_size = 1024 * 1024
+
+    def __init__(self, root: Optional[str] = None, compression: Optional[str] = None):
+        """
+        Args:
+            root: 存储目录，默认为环境变量 BLOB_DIR 或 blobs
+            compression: "zstd" 或 "gzip"，默认为环境变量 BLOB_COMPRESSION，
+                         未配置则在安装了 zstandard 时使用 zstd
+        """
+        self.root = Path(root or os.getenv("BLOB_DIR", "blobs"))
+        compression = compression or os.getenv("BLOB_COMPRESSION") or ("zstd" if zstandard else "gzip")
+        if compression not in SUFFIXES:
+            raise ValueError(f"Unsupported blob compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            compression = "gzip"
+        self.compression = compression
+
+    def path_for(self, digest: str, compression: Optional[str] = None) -> Path:
+        return self.root / digest[:2] / (digest + SUFFIXES[compression or self.compression])
+
+    def find(self, digest: str) -> Optional[Path]:
+        """查找已保存的内容，不论使用哪种压缩方式写入"""
+        for compression in SUFFIXES:
+            path = self.path_for(digest, compression)
+            if path.exists():
+                return path
+        return None
+
+    def put(self, data: Union[bytes, str]) -> str:
+        """保存内容，返回文件路径"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self.find(digest)
+        if existing:
+            return str(existing)
+        return self.put_stream([data])
+
+    def put_stream(self, chunks: Iterable[bytes]) -> str:
+        """
+        流式压缩保存内容，返回文件路径
+
+        先写入同目录下的临时文件，边压缩边计算哈希，完成后按哈希重命名；
+        内容已存在时丢弃临时文件。
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        fd, temp_name = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                with self._compressor(raw) as writer:
+                    for chunk in chunks:
+                        hasher.update(chunk)
+                        writer.write(chunk)
+            digest = hasher.hexdigest()
+            existing = self.find(digest)
+            if existing:
+                os.unlink(temp_name)
+                return str(existing)
+            path = self.path_for(digest)
+            path.parent.mkdir(exist_ok=True)
+            os.replace(temp_name, path)
+            return str(path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+
+    def open(self, path: Union[str, Path]) -> BinaryIO:
+        """以二进制流打开文件，压缩文件透明解压"""
+        path = Path(path)
+        if path.suffix == SUFFIXES["gzip"]:
+            return gzip.open(path, "rb")
+        if path.suffix == SUFFIXES["zstd"]:
+            if zstandard is None:
+                raise RuntimeError(f"zstandard is required to read {path}")
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return open(path, "rb")
+
+    def read_bytes(self, path: Union[str, Path]) -> bytes:
+        with self.open(path) as f:
+            chunks = []
+            while chunk := f.read(self.chunk_size):
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def read_text(self, path: Union[str, Path]) -> str:
+        return self.read_bytes(path).decode("utf-8")
+
+    def is_blob(self, path: Union[str, Path]) -> bool:
+        """是否为本存储中的文件（其它路径如 results/ 下的旧结果文件不归本存储管理）"""
+        try:
+            Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return False
+        return True
+
+    def delete(self, path: Union[str, Path]) -> None:
+        # 不删除空的子目录：并发的 put_stream 可能已创建该目录、正要把临时文件移入
+        Path(path).unlink(missing_ok=True)
+
+    def _compressor(self, raw: BinaryIO):
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+        # mtime 固定为 0，相同内容压缩结果一致
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0)
@@ -0,0 +1,128 @@
+"""
+导出结果的流式编码
+
+各编码器逐批消费行迭代器并产出字节块，不在内存中保存整个结果集。
+"""
+import csv
+import io
+import zlib
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List
+
+from .json_codec import codec
+
+# 导出的列及其类型（Parquet 使用）
+EXPORT_COLUMNS = {
+    "task_id": "string",
+    "custom_id": "string",
+    "task_status": "string",
+    "succeeded": "bool",
+    "model": "string",
+    "system_prompt": "string",
+    "input": "string",
+    "output": "string",
+    "finish_reason": "string",
+    "prompt_tokens": "int64",
+    "completion_tokens": "int64",
+    "total_tokens": "int64",
+    "error_code": "string",
+    "error_message": "string",
+    "created_at": "string",
+}
+
+# 格式 -> (Content-Type, 文件扩展名)
+EXPORT_FORMATS = {
+    "jsonl.gz": ("application/gzip", "jsonl.gz"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def check_format(export_format: str) -> None:
+    """
+    检查导出格式是否可用，需要在开始输出前调用
+
+    Raises:
+        ValueError: 格式不支持，或导出 Parquet 但未安装 pyarrow
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}, expected one of {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export requires pyarrow (pip install pyarrow)")
+
+
+def encode_rows(rows: Iterable[Dict[str, Any]], export_format: str, batch_rows: int = 1000) -> Iterator[bytes]:
+    """按格式编码导出行，每 batch_rows 行产出一次"""
+    batches = _batches(rows, batch_rows)
+    if export_format == "jsonl.gz":
+        return _encode_jsonl_gz(batches)
+    if export_format == "csv":
+        return _encode_csv(batches)
+    return _encode_parquet(batches)
+
+
+def _batches(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _encode_jsonl_gz(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    # wbits=31 输出 gzip 格式
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for batch in batches:
+        data = compressor.compress(b"".join(codec.dumps_bytes(row) + b"\n" for row in batch))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _encode_csv(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(EXPORT_COLUMNS))
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _Drain(io.RawIOBase):
+    """只追加的输出流，已写入的数据可随时取出"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _encode_parquet(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"string": pa.string(), "int64": pa.int64(), "bool": pa.bool_()}
+    schema = pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS.items()])
+    drain = _Drain()
+    # 每批写为一个行组，写完即可把已编码的部分发送出去
+    with pq.ParquetWriter(pa.PythonFile(drain, mode="w"), schema) as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            if data := drain.take():
+                yield data
+    yield drain.take()
@@ -0,0 +1,32 @@
+from typing import Optional
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    """根据版本信息生成弱 ETag"""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """判断请求的 If-None-Match 是否与当前 ETag 匹配"""
+    if_none_match: Optional[str] = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 按弱比较规则忽略 W/ 前缀
+    current = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == current
+        for candidate in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    """返回 304 响应"""
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+def cache_headers(etag: str) -> dict:
+    """ETag 相关响应头，no-cache 让浏览器每次都带上 If-None-Match 重新验证"""
+    return {"ETag": etag, "Cache-Control": "no-cache"}
@@ -0,0 +1,66 @@
+import json
+import os
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+class StdlibJsonCodec:
+    """标准库 json 编解码器"""
+    name = "json"
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self.dumps(obj).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """orjson 编解码器，输出与标准库一致的紧凑 UTF-8 JSON"""
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> str:
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+def get_codec(backend: str = None):
+    """
+    获取 JSON 编解码器
+
+    Args:
+        backend: "orjson" 或 "json"，为 None 时读取环境变量 JSON_BACKEND，
+                 未配置则在安装了 orjson 时优先使用 orjson
+
+    Returns:
+        编解码器实例
+    """
+    backend = backend or os.getenv("JSON_BACKEND")
+    if backend == "json" or orjson is None:
+        return StdlibJsonCodec()
+    return OrjsonCodec()
+
+
+# 默认编解码器
+codec = get_codec()
+
+
+class FastJSONResponse(JSONResponse):
+    """使用默认编解码器渲染的 JSONResponse"""
+
+    def render(self, content: Any) -> bytes:
+        return codec.dumps_bytes(content)
@@ -1,23 +1,182 @@
-import json
-from typing import List, Dict, Any
+import functools
+import multiprocessing
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, BinaryIO, Iterable, Iterator, Optional, Sequence, Tuple
 from uuid import uuid4
 from ..utils.logger import setup_logger
 import os
 from ..models.task_entity import Task
+from .json_codec import codec as default_codec, get_codec
+from .variables_file import iter_values
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+# 未指定模型的任务使用的模型
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "qwen-turbo")
+# 所有请求行和批处理使用的接口，同一个批处理输入文件中的请求必须相同
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+
+def generation_params(max_tokens: Optional[int] = None, temperature: Optional[float] = None) -> Dict[str, Any]:
+    """请求体中的可选生成参数，未设置的参数不写入，由服务商使用默认值"""
+    params = {"max_tokens": max_tokens, "temperature": temperature}
+    return {key: value for key, value in params.items() if value is not None}
+
+
+class PromptTemplate:
+    """
+    预编译的提示词模板，使用 {{name}} 占位
+
+    请求行中除 custom_id 和变量值以外的部分在编译时就转义为 JSON 片段，
+    渲染时只转义变量值再拼接字节，不为每一行构造请求字典。
+    """
+    PLACEHOLDER = re.compile(r"\{\{\s*([^{}\s]+)\s*\}\}")
+
+    def __init__(self, template: str, system_prompt: str, model: str, codec=None,
+                 params: Optional[Dict[str, Any]] = None):
+        self.codec = codec or default_codec
+        parts = self.PLACEHOLDER.split(template)
+        # parts 为 [文本, 变量名, 文本, 变量名, ..., 文本]，同一变量可出现多次
+        self.names = list(dict.fromkeys(parts[1::2]))
+        self.slots = [self.names.index(name) for name in parts[1::2]]
+        self.texts = parts[0::2]
+        self.fragments = [self._escape(text) for text in self.texts]
+        self.head = b'{"custom_id":"'
+        self.middle = (
+            '","method":"POST","url":' + self.codec.dumps(CHAT_COMPLETIONS_ENDPOINT)
+            + ',"body":{"model":' + self.codec.dumps(model)
+            + "".join(f",{self.codec.dumps(key)}:{self.codec.dumps(value)}" for key, value in (params or {}).items())
+            + ',"messages":[{"role":"system","content":'
+            + self.codec.dumps(system_prompt)
+            + '},{"role":"user","content":"'
+        ).encode("utf-8")
+        self.tail = b'"}]}}\n'
+
+    @classmethod
+    def placeholders(cls, template: str) -> List[str]:
+        """模板中用到的变量名（去重，保持顺序）"""
+        return list(dict.fromkeys(cls.PLACEHOLDER.findall(template)))
+
+    def render(self, custom_id: str, values: Sequence[Any]) -> bytes:
+        """渲染一行请求，values 与 self.names 一一对应"""
+        escaped = [self._escape(value) for value in values]
+        out = [self.head, self._escape(custom_id), self.middle, self.fragments[0]]
+        for slot, fragment in zip(self.slots, self.fragments[1:]):
+            out.append(escaped[slot])
+            out.append(fragment)
+        out.append(self.tail)
+        return b"".join(out)
+
+    def fill(self, values: Sequence[Any]) -> str:
+        """渲染用户消息的原文（不转义），values 与 self.names 一一对应"""
+        out = [self.texts[0]]
+        for slot, text in zip(self.slots, self.texts[1:]):
+            out.append(self._text(values[slot]))
+            out.append(text)
+        return "".join(out)
+
+    def _text(self, value: Any) -> str:
+        """
+        变量值对应的文本：字符串原样，None 为空，数字用 str()，
+        其它值（JSONL 变量文件中的对象、数组和布尔值）按 JSON 编码，如 true 而不是 Python 的 True
+        """
+        if isinstance(value, str):
+            return value
+        if value is None:
+            return ""
+        # bool 是 int 的子类，需要排除
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return self.codec.dumps(value)
+
+    def _escape(self, value: Any) -> bytes:
+        # JSON 字符串去掉两侧引号即为可直接拼接的转义片段
+        return self.codec.dumps_bytes(self._text(value))[1:-1]
+
+
+@functools.lru_cache(maxsize=8)
+def _compiled_template(template: str, system_prompt: str, model: str,
+                       params: Tuple[Tuple[str, Any], ...], codec_name: str) -> PromptTemplate:
+    # 每个进程缓存编译好的模板，同一分片的各块只编译一次
+    return PromptTemplate(template, system_prompt, model, get_codec(codec_name), dict(params))
+
+
+def render_chunk(template_key: Tuple[str, str, str, Tuple[Tuple[str, Any], ...], str], start: int,
+                 rows: List[Sequence[Any]]) -> bytes:
+    """
+    渲染一块请求行，返回可直接写入文件的字节
+
+    在编码进程池的工作进程中执行，参数和返回值都只包含基本类型。
+
+    Args:
+        template_key: (模板, 系统提示词, 模型, 生成参数, 编解码器名称)
+        start: 第一行的行号
+        rows: 各行的变量值
+    """
+    template = _compiled_template(*template_key)
+    return b"".join(template.render(f"row-{index}", values) for index, values in enumerate(rows, start))
+
+
+_encoding_pool: Optional[ProcessPoolExecutor] = None
+_encoding_pool_lock = threading.Lock()
+
+
+def encoding_workers() -> int:
+    """编码进程池的进程数，环境变量 ENCODING_WORKERS，默认 CPU 核数"""
+    return int(os.getenv("ENCODING_WORKERS", str(os.cpu_count() or 1)))
+
+
+def get_encoding_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    获取共享的编码进程池，进程数不大于 1 时返回 None（在当前进程中编码）
+
+    使用 spawn 启动工作进程，避免 fork 时复制日志线程等持有的锁。
+    """
+    global _encoding_pool
+    workers = encoding_workers()
+    if workers <= 1:
+        return None
+    with _encoding_pool_lock:
+        if _encoding_pool is None:
+            _encoding_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _encoding_pool
+
+
+def shutdown_encoding_pool() -> None:
+    """关闭编码进程池"""
+    global _encoding_pool
+    with _encoding_pool_lock:
+        if _encoding_pool is not None:
+            _encoding_pool.shutdown(cancel_futures=True)
+            _encoding_pool = None
+
 
 class JsonlGenerator:
-    def __init__(self, model: str = "qwen-turbo"):
+    # 并行编码时每块的行数，以及分片达到多少行才使用进程池（更小的分片进程间传输的开销不划算）
+    chunk_rows = 5000
+    parallel_min_rows = int(os.getenv("PARALLEL_ENCODING_MIN_ROWS", "20000"))
+
+    def __init__(self, model: str = DEFAULT_MODEL, codec=None):
         self.model = model
+        self.codec = codec or default_codec
         self.logger = setup_logger(__name__)
 
-    def generate_request(self, content: str, system_prompt: str = "You are a helpful assistant.") -> Dict[str, Any]:
-        """生成单个请求数据"""
+    def generate_request(self, content: str, system_prompt: str = "You are a helpful assistant.",
+                         model: Optional[str] = None, max_tokens: Optional[int] = None,
+                         temperature: Optional[float] = None) -> Dict[str, Any]:
+        """生成单个请求数据，未指定模型时使用默认模型"""
         return {
             "custom_id": f"request-{str(uuid4())}",
             "method": "POST",
-            "url": "/v1/chat/completions",
+            "url": CHAT_COMPLETIONS_ENDPOINT,
             "body": {
-                "model": self.model,
+                "model": model or self.model,
+                **generation_params(max_tokens, temperature),
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": content}
@@ -29,15 +188,73 @@ class JsonlGenerator:
         """
         生成JSONL文件，使用task的content和system_prompt
         """
-        self.logger.info(f"Creating JSONL file for task {task.id}")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            request = self.generate_request(
-                task.content, 
-                system_prompt=task.system_prompt or "You are a helpful assistant."
-            )
-            json_line = json.dumps(request, ensure_ascii=False)
-            self.logger.debug(f"Generated JSONL line: {json_line}")
-            f.write(json_line + '\n')
-        
-        self.logger.info(f"JSONL file created at: {output_path}")
-        return output_path 
\ No newline at end of file
+        with open(output_path, 'wb') as f:
+            self.write_jsonl(task, f)
+        self.logger.info("JSONL file created at: %s", output_path)
+        return output_path
+
+    def write_jsonl(self, task: Task, f: BinaryIO) -> None:
+        """将任务的请求行写入已打开的二进制文件对象（可以是内存缓冲区）"""
+        self.logger.debug("Creating JSONL for task %s", task.id)
+        request = self.generate_request(
+            task.content, 
+            system_prompt=task.system_prompt or "You are a helpful assistant.",
+            model=task.model,
+            max_tokens=task.max_tokens,
+            temperature=task.temperature
+        )
+        json_line = self.codec.dumps(request)
+        self.logger.debug("Generated JSONL line: %s", json_line)
+        f.write((json_line + '\n').encode('utf-8'))
+
+    def create_template_file(self, task: Task, output_path: str) -> str:
+        """
+        用任务的模板和变量文件中 [shard_start, shard_end) 的行生成JSONL文件
+
+        变量文件按块流式读取，custom_id 为 row-<行号>，便于对应回变量文件。
+        分片较大时各块在编码进程池中并行渲染，按顺序写入。
+        """
+        with open(output_path, 'wb') as f:
+            self.write_template(task, f)
+        self.logger.info("JSONL file created at: %s", output_path)
+        return output_path
+
+    def write_template(self, task: Task, f: BinaryIO) -> None:
+        """将模板任务的请求行写入已打开的二进制文件对象（可以是内存缓冲区），规则同 create_template_file"""
+        template_key = (
+            task.template, task.system_prompt or DEFAULT_SYSTEM_PROMPT, task.model or self.model,
+            tuple(generation_params(task.max_tokens, task.temperature).items()), self.codec.name
+        )
+        rows = iter_values(task.variables_path, PromptTemplate.placeholders(task.template),
+                           task.shard_start, task.shard_end)
+        chunks = self._chunks(rows, task.shard_start)
+
+        pool = None
+        if task.shard_end - task.shard_start >= self.parallel_min_rows:
+            pool = get_encoding_pool()
+        encoded = self._encode_parallel(pool, template_key, chunks) if pool else (
+            render_chunk(template_key, start, chunk) for start, chunk in chunks
+        )
+        for data in encoded:
+            f.write(data)
+        self.logger.debug("Rendered template task %s (%d requests, %s)", task.id,
+                          task.shard_end - task.shard_start, "parallel" if pool else "inline")
+
+    def _chunks(self, rows: Iterable[Sequence[Any]], start: int) -> Iterator[Tuple[int, List[Sequence[Any]]]]:
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.chunk_rows)):
+            yield start, chunk
+            start += len(chunk)
+
+    @staticmethod
+    def _encode_parallel(pool: ProcessPoolExecutor, template_key: tuple,
+                         chunks: Iterator[Tuple[int, List[Sequence[Any]]]]) -> Iterator[bytes]:
+        """提交各块到进程池并按顺序返回结果，同时在途的块数有上限以控制内存"""
+        window = max(2, encoding_workers() * 2)
+        pending = deque()
+        for start, chunk in chunks:
+            pending.append(pool.submit(render_chunk, template_key, start, chunk))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
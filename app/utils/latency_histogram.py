@@ -0,0 +1,58 @@
+import math
+from typing import Dict, Optional
+
+# 相邻桶的上界之比，2 的 1/8 次方，百分位的相对误差约 4%
+BUCKET_GROWTH = 2 ** 0.125
+# 最小的桶，不超过 1 微秒（包括 0）的耗时都落入该桶；1 毫秒以下的桶序号为负数
+MIN_BUCKET = math.ceil(math.log(0.001, BUCKET_GROWTH))
+
+
+def bucket_index(value_ms: float) -> int:
+    """耗时所在的桶序号，桶 i 覆盖 (GROWTH^(i-1), GROWTH^i] 毫秒"""
+    if value_ms <= BUCKET_GROWTH ** MIN_BUCKET:
+        return MIN_BUCKET
+    return max(MIN_BUCKET, math.ceil(math.log(value_ms, BUCKET_GROWTH)))
+
+
+class LatencyHistogram:
+    """
+    对数分桶的耗时直方图
+
+    桶的数量与耗时范围的对数成正比，可以直接合并，适合按小时存入聚合表后再按时间窗口汇总。
+    """
+
+    def __init__(self, buckets: Optional[Dict] = None, count: int = 0, total_ms: float = 0.0):
+        # JSON 列中的键是字符串
+        self.buckets: Dict[int, int] = {int(k): v for k, v in (buckets or {}).items()}
+        self.count = count
+        self.total_ms = total_ms
+
+    def add(self, value_ms: float) -> None:
+        index = bucket_index(value_ms)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total_ms += value_ms
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.count += other.count
+        self.total_ms += other.total_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """估算百分位（q 取 0~1），返回所在桶的几何中点（毫秒）"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return BUCKET_GROWTH ** (index - 0.5)
+        return BUCKET_GROWTH ** (max(self.buckets) - 0.5)
+
+    def mean(self) -> Optional[float]:
+        return self.total_ms / self.count if self.count else None
+
+    def to_json(self) -> Dict[str, int]:
+        return {str(index): n for index, n in self.buckets.items()}
@@ -1,7 +1,118 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 from pathlib import Path
 
+# 所有记录器共享一个队列，业务代码只负责入队，
+# 格式化和控制台/文件 I/O 都在后台监听线程中完成，不阻塞事件循环
+_queue_handler = None
+_listener = None
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class LazyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """第一次写入日志时才创建日志目录和文件，导入模块、构造应用不产生文件"""
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    不在调用线程中格式化消息的 QueueHandler
+
+    标准 QueueHandler.prepare 会在入队前调用 format，
+    这里直接入队原始记录，消息拼接推迟到监听线程。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_level(value: str) -> int:
+    level = logging.getLevelName(value.strip().upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def get_log_level(name: str) -> int:
+    """
+    获取记录器的日志级别
+
+    全局级别由环境变量 LOG_LEVEL 配置（默认 INFO），
+    LOG_LEVELS 可按模块覆盖，例如 "app.schedulers=DEBUG,app.api_batch=WARNING"，
+    以最长匹配的模块前缀为准。
+    """
+    level = _parse_level(os.getenv("LOG_LEVEL", "INFO"))
+    matched = ""
+    for item in os.getenv("LOG_LEVELS", "").split(","):
+        if "=" not in item:
+            continue
+        prefix, value = item.split("=", 1)
+        prefix = prefix.strip()
+        if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > len(matched):
+            matched = prefix
+            level = _parse_level(value)
+    return level
+
+
+def _get_queue_handler() -> logging.Handler:
+    """首次调用时创建输出处理器并启动后台监听线程"""
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        return _queue_handler
+
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(DEFAULT_FORMAT)
+
+    # 创建控制台处理器
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+
+    # 创建按大小滚动的文件处理器
+    logs_dir = Path(os.getenv("LOG_DIR", "logs"))
+    file_handler = LazyRotatingFileHandler(
+        logs_dir / "app.log",
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+    _listener.start()
+    # 退出前把队列中剩余的日志写完
+    atexit.register(_listener.stop)
+    _queue_handler = DeferredQueueHandler(log_queue)
+    return _queue_handler
+
+
 def setup_logger(name: str) -> logging.Logger:
     """
     设置日志记录器
@@ -18,29 +129,9 @@ def setup_logger(name: str) -> logging.Logger:
     if logger.handlers:
         return logger
         
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(get_log_level(name))
     # 防止日志向上传播
     logger.propagate = False
+    logger.addHandler(_get_queue_handler())
 
-    # 创建控制台处理器
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.DEBUG)
-    
-    # 创建文件处理器
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
-    file_handler = logging.FileHandler(logs_dir / "app.log", encoding='utf-8')
-    file_handler.setLevel(logging.DEBUG)
-
-    # 创建格式化器
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    console_handler.setFormatter(formatter)
-    file_handler.setFormatter(formatter)
-
-    # 添加处理器
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-
-    return logger 
\ No newline at end of file
+    return logger
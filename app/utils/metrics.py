@@ -0,0 +1,178 @@
+"""
+Prometheus 指标
+
+所有指标和埋点装饰器集中在这里，BatchProcessor、TaskRepository、
+调度器和结果解析只需引用对应的装饰器或计数器。
+"""
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+PROVIDER_CALL_SECONDS = Histogram(
+    "provider_call_seconds",
+    "Latency of BatchProcessor calls to the provider",
+    ["method"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+PROVIDER_CALL_ERRORS = Counter(
+    "provider_call_errors_total",
+    "BatchProcessor calls that raised an exception",
+    ["method", "error"],
+)
+PROVIDER_CALL_RETRIES = Counter(
+    "provider_call_retries_total",
+    "HTTP retries made by the OpenAI client inside BatchProcessor calls",
+    ["method"],
+)
+SCHEDULER_TICK_SECONDS = Histogram(
+    "scheduler_tick_seconds",
+    "Duration of one BatchScheduler status update pass",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+REPOSITORY_QUERY_SECONDS = Histogram(
+    "repository_query_seconds",
+    "Latency of TaskRepository operations",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+RESULT_INGESTED_BYTES = Counter(
+    "result_ingested_bytes_total",
+    "Bytes of downloaded output/error files parsed by the result ingester",
+    ["kind"],
+)
+RESULT_INGESTED_LINES = Counter(
+    "result_ingested_lines_total",
+    "Lines of downloaded output/error files parsed by the result ingester",
+    ["kind"],
+)
+# 以下两项只在开启 PROFILING_ENABLED 时记录，见 utils.profiling
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Latency of HTTP requests by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between the scheduled and actual wake-up of the event loop heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+# 当前 BatchProcessor 调用中已发出的 HTTP 请求，用于统计 OpenAI 客户端的内部重试
+_http_attempts: ContextVar[Optional[list]] = ContextVar("provider_http_attempts", default=None)
+
+
+def count_http_request(request) -> None:
+    """
+    httpx 请求钩子，记录每次发出的 HTTP 请求（含重试）
+
+    一次调用中可能请求多个不同的 URL（如下载时先查询文件信息再下载内容），
+    同一方法和 URL 的重复请求才视为重试。
+    """
+    attempts = _http_attempts.get()
+    if attempts is not None:
+        attempts.append((request.method, str(request.url)))
+
+
+def instrumented_provider_call(func):
+    """记录 BatchProcessor 方法的耗时、异常和重试次数"""
+    method = func.__name__
+
+    def start():
+        return _http_attempts.set([]), time.perf_counter()
+
+    def finish(token, started, error: Optional[BaseException]):
+        PROVIDER_CALL_SECONDS.labels(method).observe(time.perf_counter() - started)
+        attempts = _http_attempts.get()
+        _http_attempts.reset(token)
+        retries = len(attempts) - len(set(attempts))
+        if retries:
+            PROVIDER_CALL_RETRIES.labels(method).inc(retries)
+        if error is not None:
+            PROVIDER_CALL_ERRORS.labels(method, type(error).__name__).inc()
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            token, started = start()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException as e:
+                finish(token, started, e)
+                raise
+            finish(token, started, None)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token, started = start()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            finish(token, started, e)
+            raise
+        finish(token, started, None)
+        return result
+    return wrapper
+
+
+def timed_query(func):
+    """记录 TaskRepository 方法的耗时"""
+    histogram = REPOSITORY_QUERY_SECONDS.labels(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with histogram.time():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def record_ingestion(kind: str, data: bytes) -> None:
+    """记录解析的结果文件大小和行数"""
+    RESULT_INGESTED_BYTES.labels(kind).inc(len(data))
+    lines = data.count(b"\n")
+    if data and not data.endswith(b"\n"):
+        lines += 1
+    RESULT_INGESTED_LINES.labels(kind).inc(lines)
+
+
+class TaskStateCollector:
+    """抓取时从数据库统计各状态任务数和提交队列深度，任何 worker 进程上的数值都一致"""
+
+    def describe(self):
+        # 注册时只描述指标，避免在导入阶段查询数据库
+        yield GaugeMetricFamily("tasks", "Tasks by status", labels=["status"])
+        yield GaugeMetricFamily("submission_queue_depth", "Tasks whose submission to the provider has not finished")
+        yield GaugeMetricFamily("submission_queued", "Tasks waiting in the submission queue")
+
+    def collect(self):
+        from ..repositories.task_repository import TaskRepository
+
+        repository = TaskRepository()
+        by_status = GaugeMetricFamily("tasks", "Tasks by status", labels=["status"])
+        for status, count in repository.count_by_status().items():
+            by_status.add_metric([status], count)
+        yield by_status
+
+        # 排队中的任务也尚未提交，计入队列深度
+        queued = repository.count_queued()
+        yield GaugeMetricFamily(
+            "submission_queue_depth",
+            "Tasks whose submission to the provider has not finished",
+            value=repository.count_incomplete_submissions() + queued,
+        )
+        yield GaugeMetricFamily("submission_queued", "Tasks waiting in the submission queue", value=queued)
+
+
+REGISTRY.register(TaskStateCollector())
+
+
+def render_metrics():
+    """生成 Prometheus 文本格式的指标，返回 (内容, Content-Type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
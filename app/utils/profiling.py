@@ -0,0 +1,235 @@
+"""
+按需开启的性能分析工具（环境变量 PROFILING_ENABLED=true）
+
+- RequestTimingMiddleware：按路由模板记录请求耗时，慢请求写日志
+- SamplingProfiler：运行时开启的采样分析器，输出 collapsed stack 格式，可用 flamegraph.pl 或 speedscope 生成火焰图
+- LoopLagMonitor：监测事件循环延迟，循环被阻塞时记录阻塞它的调用栈
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from .logger import setup_logger
+from .metrics import EVENT_LOOP_LAG_SECONDS, HTTP_REQUEST_SECONDS
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+
+
+class RequestTimingMiddleware:
+    """ASGI 中间件，按 (方法, 路由模板, 状态码) 记录请求耗时，流式响应计到最后一块发送完成"""
+
+    def __init__(self, app, slow_request_ms: Optional[float] = None):
+        self.app = app
+        if slow_request_ms is None:
+            slow_request_ms = float(os.getenv("PROFILING_SLOW_REQUEST_MS", "1000"))
+        self.slow_request_seconds = slow_request_ms / 1000
+        self.logger = setup_logger(__name__)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            # 路由匹配后 scope 中才有 route，未匹配的请求（404、静态文件）归为一类，避免标签数量失控
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            if elapsed >= self.slow_request_seconds:
+                self.logger.warning("Slow request %s %s (%s) took %.0f ms, status %d",
+                                    scope["method"], scope["path"], route, elapsed * 1000, status)
+
+
+class SamplingProfiler:
+    """
+    采样分析器
+
+    后台线程每隔 interval_ms 抓取进程内所有线程的调用栈，持续 seconds 秒后写入
+    PROFILE_DIR（默认 profiles/）下的 .folded 文件，每行为 "线程;栈帧;...;栈帧 次数"。
+    进程内同时只运行一个。
+    """
+    max_seconds = 600
+    _lock = threading.Lock()
+    _current: Optional["SamplingProfiler"] = None
+
+    def __init__(self, seconds: float, interval_ms: float = 10, output_dir: Optional[str] = None):
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"Profiling duration must be between 0 and {self.max_seconds} seconds")
+        if interval_ms <= 0:
+            raise ValueError("Sampling interval must be positive")
+        self.seconds = seconds
+        self.interval = interval_ms / 1000
+        self.output_dir = Path(output_dir or os.getenv("PROFILE_DIR", "profiles"))
+        self.path = self.output_dir / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.logger = setup_logger(__name__)
+
+    def start(self) -> "SamplingProfiler":
+        """
+        在后台线程中开始采样
+
+        Raises:
+            RuntimeError: 已有分析正在进行
+        """
+        with self._lock:
+            if SamplingProfiler._current is not None:
+                raise RuntimeError(f"A profile is already running: {SamplingProfiler._current.path.name}")
+            SamplingProfiler._current = self
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._run, name="sampling-profiler", daemon=True).start()
+        self.logger.info("Sampling profiler started for %.0f s, writing to %s", self.seconds, self.path)
+        return self
+
+    @classmethod
+    def current(cls) -> Optional["SamplingProfiler"]:
+        return cls._current
+
+    def status(self) -> dict:
+        return {
+            "file": self.path.name,
+            "seconds": self.seconds,
+            "interval_ms": self.interval * 1000,
+            "remaining_seconds": round(max(0.0, self.started_at + self.seconds - time.monotonic()), 1),
+            "samples": self.samples,
+        }
+
+    def _run(self) -> None:
+        stacks: Counter = Counter()
+        own_id = threading.get_ident()
+        names = {}
+        try:
+            deadline = self.started_at + self.seconds
+            while time.monotonic() < deadline:
+                for thread in threading.enumerate():
+                    names[thread.ident] = thread.name
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_id:
+                        stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.logger.info("Sampling profiler wrote %d samples to %s", self.samples, self.path)
+        except Exception as e:
+            self.logger.error(f"Sampling profiler failed: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                SamplingProfiler._current = None
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            # 按函数而不是行号归并，火焰图中同一函数只占一格
+            parts.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+            frame = frame.f_back
+        parts.append(thread_name)
+        # collapsed stack 格式中分号分隔栈帧、空格分隔次数
+        return ";".join(reversed(parts)).replace(" ", "_")
+
+    @classmethod
+    def list_profiles(cls, output_dir: Optional[str] = None) -> List[dict]:
+        directory = Path(output_dir or os.getenv("PROFILE_DIR", "profiles"))
+        if not directory.exists():
+            return []
+        return [
+            {"file": path.name, "size": path.stat().st_size,
+             "created_at": datetime.fromtimestamp(path.stat().st_mtime).isoformat()}
+            for path in sorted(directory.glob("*.folded"), reverse=True)
+        ]
+
+    @classmethod
+    def profile_path(cls, name: str, output_dir: Optional[str] = None) -> Path:
+        """
+        Raises:
+            ValueError: 文件不存在或文件名不合法
+        """
+        directory = Path(output_dir or os.getenv("PROFILE_DIR", "profiles"))
+        path = directory / name
+        if Path(name).name != name or path.suffix != ".folded" or not path.is_file():
+            raise ValueError(f"Profile {name} not found")
+        return path
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监测
+
+    循环中的心跳协程每隔 interval 唤醒一次，实际唤醒时间与预期的差值即循环延迟，计入
+    event_loop_lag_seconds。独立的看门狗线程检查心跳，超过 threshold 未唤醒时抓取事件循环
+    所在线程的调用栈写入日志，即当时阻塞循环的代码；每次阻塞只记录一次。
+    """
+
+    def __init__(self, threshold_ms: Optional[float] = None, interval_ms: Optional[float] = None):
+        if threshold_ms is None:
+            threshold_ms = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "200"))
+        self.threshold = threshold_ms / 1000
+        self.interval = (interval_ms if interval_ms is not None else max(threshold_ms / 4, 10)) / 1000
+        self.logger = setup_logger(__name__)
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._reported = False
+
+    def start(self) -> None:
+        """在事件循环中调用"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            self._last_beat = now
+            if lag >= self.threshold:
+                self.logger.warning("Event loop was blocked for %.0f ms", lag * 1000)
+            self._reported = False
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            stalled = time.monotonic() - self._last_beat
+            if self._reported or stalled < self.threshold + self.interval:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported = True
+            self.logger.warning("Event loop blocked for %.0f ms so far, blocking stack:\n%s",
+                                stalled * 1000, "".join(traceback.format_stack(frame)))
@@ -0,0 +1,81 @@
+"""
+模板变量文件（CSV 或 JSONL）的流式读取
+
+CSV 第一行为列名；JSONL 每行一个对象，以第一行的键作为列名。
+读取时逐行解析，不会把整个文件载入内存。
+"""
+import csv
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+from .json_codec import codec
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl"}
+
+
+def detect_format(filename: str) -> str:
+    """根据扩展名判断变量文件格式"""
+    fmt = FORMATS.get(Path(filename).suffix.lower())
+    if not fmt:
+        raise ValueError(f"Unsupported variables file {filename}, expected .csv or .jsonl")
+    return fmt
+
+
+def read_columns(path: str) -> List[str]:
+    """读取变量文件的列名"""
+    if detect_format(path) == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return next(csv.reader(f), [])
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                return list(codec.loads(line).keys())
+    return []
+
+
+def count_rows(path: str) -> int:
+    """统计变量文件的数据行数（不含 CSV 表头），JSONL 只数非空行不解析"""
+    if detect_format(path) == "csv":
+        return sum(1 for _ in _iter_raw_rows(path))
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def iter_values(path: str, names: Sequence[str], start: int = 0,
+                stop: Optional[int] = None) -> Iterator[List[str]]:
+    """
+    按 names 的顺序逐行返回变量值
+
+    Args:
+        path: 变量文件路径
+        names: 需要的列名
+        start: 起始行号（从 0 开始，不含表头）
+        stop: 结束行号（不含），为 None 时读到文件末尾
+    """
+    if detect_format(path) == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            columns = next(reader, [])
+            indices = [columns.index(name) for name in names]
+            for row in islice(reader, start, stop):
+                yield [row[i] if i < len(row) else "" for i in indices]
+        return
+
+    for row_number, row in enumerate(islice(_iter_raw_rows(path), start, stop), start):
+        try:
+            yield [row[name] for name in names]
+        except KeyError as e:
+            raise ValueError(f"Row {row_number} of {path} has no variable {e}")
+
+
+def _iter_raw_rows(path: str) -> Iterator:
+    if detect_format(path) == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield codec.loads(line)
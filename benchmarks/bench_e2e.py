@@ -0,0 +1,295 @@
+"""
+端到端吞吐与延迟基准测试
+
+在进程内驱动 FastAPI 应用，服务商接口由本地模拟服务（app.mock.dashscope_server）提供，
+测量以下热点路径，并把结果写入 JSON 报告，便于在不同提交之间对比：
+
+- 通过 /api/task/create 和 /api/task/upload 创建任务的吞吐量
+- 1k、10k、100k 个任务时调度器单次轮询的耗时
+- 小结果和大结果的读取延迟
+- 列表接口的 p50/p95/p99 延迟
+
+用法（在项目根目录执行）:
+    python -m benchmarks.bench_e2e --report bench_report.json
+    python -m benchmarks.bench_e2e --tick-sizes 1000,10000 --report new.json --compare bench_report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def percentiles(samples: list) -> dict:
+    """计算延迟分位数（毫秒）"""
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed_requests(func, count: int) -> list:
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = func()
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return samples
+
+
+def start_mock_server(port: int):
+    """在后台线程中启动模拟服务，批处理状态快速推进"""
+    import uvicorn
+    from app.mock.dashscope_server import create_app, MockConfig
+
+    config = MockConfig(validating_seconds=0.05, in_progress_seconds=0.1, finalizing_seconds=0.05, seed=42)
+    mock_app = create_app(config)
+    server = uvicorn.Server(uvicorn.Config(mock_app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return mock_app.state.mock
+
+
+def seed_tasks(count: int, in_flight_ratio: float, batch_ids: list, output_path: str = None) -> None:
+    """直接向数据库批量插入任务，按比例设置为进行中（指向模拟服务中的批处理）"""
+    from sqlalchemy import delete, insert
+    from app.database.database import engine
+    from app.models.database_models import TaskORM
+
+    in_flight = int(count * in_flight_ratio)
+    now = datetime.now()
+    rows = []
+    for i in range(count):
+        active = i < in_flight
+        rows.append({
+            "id": str(uuid4()),
+            "status": "in_progress" if active else "completed",
+            "content": f"benchmark task {i}",
+            "created_at": now,
+            "updated_at": now,
+            "file_id": f"file-batch-{i}",
+            "batch_id": batch_ids[i % len(batch_ids)] if active else f"batch_done_{i}",
+            "output_file_path": None if active else output_path,
+            "result": None if active else {"custom_id": f"request-{i}"},
+            "submission_state": "batch_created",
+            "version": 0,
+        })
+    with engine.begin() as conn:
+        conn.execute(delete(TaskORM))
+        for start in range(0, len(rows), 5000):
+            conn.execute(insert(TaskORM), rows[start:start + 5000])
+
+
+def write_result_file(path: Path, content_chars: int) -> None:
+    from app.utils.json_codec import codec
+    record = {
+        "id": uuid4().hex,
+        "custom_id": "request-1",
+        "response": {
+            "status_code": 200,
+            "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": "答" * content_chars}}]},
+        },
+        "error": None,
+    }
+    path.write_bytes(codec.dumps_bytes(record) + b"\n")
+
+
+def bench_creation(client, count: int, upload_files: int) -> dict:
+    start = time.perf_counter()
+    for i in range(count):
+        client.post("/api/task/create", json={"content": f"benchmark prompt {i}"}).raise_for_status()
+    create_elapsed = time.perf_counter() - start
+
+    files = [("files", (f"bench_{i}.txt", f"benchmark upload {i}".encode("utf-8"), "text/plain"))
+             for i in range(upload_files)]
+    start = time.perf_counter()
+    client.post("/api/task/upload", files=files, data={"system_prompt": "You are a helpful assistant."}).raise_for_status()
+    upload_elapsed = time.perf_counter() - start
+
+    return {
+        "create_tasks_per_sec": round(count / create_elapsed, 2),
+        "upload_tasks_per_sec": round(upload_files / upload_elapsed, 2),
+    }
+
+
+def bench_scheduler_ticks(sizes: list, in_flight_ratio: float, mock, output_path: str) -> dict:
+    from app.schedulers.batch_scheduler import BatchScheduler
+    from app.api_batch import BatchProcessor
+
+    # 在模拟服务中准备若干进行中的批处理，供种子任务轮询
+    processor = BatchProcessor()
+    input_file = mock.create_file("bench_input.jsonl", "batch", b"")
+    batch_ids = [processor.create_batch(input_file.id).id for _ in range(10)]
+    for batch_id in batch_ids:
+        # 让批处理一直处于进行中
+        mock.batches[batch_id].created_at = time.time() + 3600
+
+    scheduler = BatchScheduler()
+    scheduler.is_leader = True
+    scheduler.recovery_grace_seconds = 3600
+    results = {}
+    for size in sizes:
+        seed_tasks(size, in_flight_ratio, batch_ids, output_path)
+        start = time.perf_counter()
+        asyncio.run(scheduler.update_batch_status())
+        results[str(size)] = {"tick_seconds": round(time.perf_counter() - start, 3)}
+    return results
+
+
+def bench_results(client, work_dir: Path, requests: int) -> dict:
+    from app.services.task_service import TaskService
+
+    service = TaskService()
+    results = {}
+    for name, chars in (("small", 200), ("large", 5_000_000)):
+        path = work_dir / f"result_{name}.jsonl"
+        write_result_file(path, chars)
+        task = service.create_task(f"result benchmark {name}")
+        task.status = "completed"
+        task.batch_id = f"batch_result_{name}"
+        task.output_file_path = str(path)
+        task.result = {"custom_id": "request-1"}
+        service.update_task(task)
+        samples = timed_requests(lambda: client.get(f"/api/task/{task.id}/result"), requests)
+        results[name] = percentiles(samples)
+    return results
+
+
+def bench_list_endpoints(client, task_count: int, requests: int, output_path: str) -> dict:
+    seed_tasks(task_count, 0, ["unused"], output_path)
+    return {
+        f"/api/task/get ({task_count} tasks)": percentiles(timed_requests(lambda: client.get("/api/task/get"), requests)),
+        "/api/batch/list": percentiles(timed_requests(lambda: client.get("/api/batch/list"), requests)),
+        "/api/batch/files": percentiles(timed_requests(lambda: client.get("/api/batch/files"), requests)),
+    }
+
+
+def flatten(prefix: str, value, out: dict) -> dict:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(f"{prefix}.{key}" if prefix else key, item, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    return out
+
+
+def compare(current: dict, baseline_path: str, threshold: float) -> int:
+    """与基线报告对比，返回退化指标的数量"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    now = flatten("", current["results"], {})
+    before = flatten("", baseline["results"], {})
+    regressions = 0
+    print(f"\n对比基线 {baseline_path} (commit {baseline.get('commit')})")
+    print(f"{'metric':<70}{'baseline':>14}{'current':>14}{'change':>10}")
+    for key in sorted(now):
+        # 单次最大值波动太大，不参与对比
+        if key not in before or key.endswith((".count", ".max_ms")) or not before[key]:
+            continue
+        change = (now[key] - before[key]) / before[key]
+        # 吞吐量越大越好，其余（耗时、延迟）越小越好
+        worse = change < -threshold if key.endswith("per_sec") else change > threshold
+        regressions += worse
+        flag = "  <-- regression" if worse else ""
+        print(f"{key:<70}{before[key]:>14}{now[key]:>14}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput and latency benchmark")
+    parser.add_argument("--create-count", type=int, default=200, help="通过 /api/task/create 创建的任务数")
+    parser.add_argument("--upload-files", type=int, default=50, help="通过 /api/task/upload 上传的文件数")
+    parser.add_argument("--tick-sizes", default="1000,10000,100000", help="调度器轮询测试的任务数量，逗号分隔")
+    parser.add_argument("--in-flight-ratio", type=float, default=0.01, help="种子任务中进行中任务的比例")
+    parser.add_argument("--list-tasks", type=int, default=10000, help="列表接口测试时的任务数量")
+    parser.add_argument("--requests", type=int, default=100, help="每个延迟测试的请求次数")
+    parser.add_argument("--mock-port", type=int, default=8299)
+    parser.add_argument("--report", default="bench_report.json", help="JSON 报告输出路径")
+    parser.add_argument("--compare", help="用于对比的基线报告路径")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定为退化的变化比例")
+    args = parser.parse_args()
+    report_path = os.path.abspath(args.report)
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        # 应用在当前目录下写 temp/、results/、logs/，切换到临时目录避免污染项目
+        os.chdir(work_dir)
+        os.environ["DATABASE_URL"] = f"sqlite:///{work_dir / 'bench.db'}"
+        os.environ["DASHSCOPE_BASE_URL"] = f"http://127.0.0.1:{args.mock_port}/compatible-mode/v1"
+        os.environ.setdefault("DASHSCOPE_API_KEY", "mock")
+        sys.path.insert(0, str(PROJECT_DIR))
+
+        mock = start_mock_server(args.mock_port)
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.database.database import create_tables
+
+        # 不运行 lifespan（不启动调度器），需要自行建表
+        create_tables()
+
+        client = TestClient(app)
+        output_path = str(work_dir / "seed_output.jsonl")
+        write_result_file(Path(output_path), 200)
+
+        results = {}
+        print("测试任务创建吞吐量...")
+        results["creation"] = bench_creation(client, args.create_count, args.upload_files)
+        print("测试调度器轮询耗时...")
+        sizes = [int(size) for size in args.tick_sizes.split(",") if size]
+        results["scheduler_tick"] = bench_scheduler_ticks(sizes, args.in_flight_ratio, mock, output_path)
+        print("测试结果读取延迟...")
+        results["result_read"] = bench_results(client, work_dir, args.requests)
+        print("测试列表接口延迟...")
+        results["list_endpoints"] = bench_list_endpoints(client, args.list_tasks, args.requests, output_path)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "results": results,
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"\n报告已写入 {report_path}")
+
+    if baseline_path:
+        regressions = compare(report, baseline_path, args.threshold)
+        if regressions:
+            print(f"\n发现 {regressions} 项性能退化")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+模板任务 JSONL 编码基准测试：对比逐行构造字典编码、预编译模板单进程渲染和进程池并行渲染
+
+用法（在项目根目录执行）:
+    python -m benchmarks.bench_encoding
+    python -m benchmarks.bench_encoding --rows 1000000 --workers 1 2 4 8
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from app.models.task_entity import Task, TaskStatus
+from app.utils import jsonl_generator
+from app.utils.jsonl_generator import JsonlGenerator
+from app.utils.variables_file import iter_values
+
+TEMPLATE = "请将下面这段话翻译成{{lang}}，保持原文语气：\n{{text}}"
+
+
+def write_variables(path: str, rows: int) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["text", "lang"])
+        for i in range(rows):
+            writer.writerow([f"第 {i} 条 \"示例\" 文本，包含需要转义的字符。\n" * 3, "英文"])
+
+
+def build_task(path: str, rows: int) -> Task:
+    return Task(
+        id="bench", status=TaskStatus.VALIDATING.value, content=TEMPLATE, created_at=datetime.now(),
+        template=TEMPLATE, variables_path=path, shard_start=0, shard_end=rows,
+    )
+
+
+def encode_with_dicts(generator: JsonlGenerator, path: str, rows: int, output: str) -> None:
+    """改造前的方式：每行渲染字符串、构造请求字典再序列化"""
+    with open(output, 'w', encoding='utf-8') as f:
+        for text, lang in iter_values(path, ["text", "lang"], 0, rows):
+            content = TEMPLATE.replace("{{lang}}", lang).replace("{{text}}", text)
+            f.write(generator.codec.dumps(generator.generate_request(content)) + '\n')
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template JSONL encoding benchmark")
+    parser.add_argument("--rows", type=int, default=300000, help="变量行数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1],
+                        help="进程池大小，1 表示在当前进程中渲染")
+    args = parser.parse_args()
+
+    generator = JsonlGenerator()
+    generator.parallel_min_rows = 0
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        variables = os.path.join(tmp_dir, "vars.csv")
+        output = os.path.join(tmp_dir, "out.jsonl")
+        print(f"生成 {args.rows} 行变量文件...")
+        write_variables(variables, args.rows)
+        task = build_task(variables, args.rows)
+
+        results.append(("dict + dumps", timed(lambda: encode_with_dicts(generator, variables, args.rows, output))))
+        for workers in dict.fromkeys(args.workers):
+            os.environ["ENCODING_WORKERS"] = str(workers)
+            jsonl_generator.shutdown_encoding_pool()
+            if workers > 1:
+                # 预先启动工作进程，不把进程启动时间计入
+                pool = jsonl_generator.get_encoding_pool()
+                list(pool.map(abs, range(workers)))
+            elapsed = timed(lambda: generator.create_template_file(task, output))
+            results.append((f"template, {workers} worker(s)", elapsed))
+        jsonl_generator.shutdown_encoding_pool()
+
+    print()
+    print(f"{'case':<28}{'seconds':>10}{'rows/s':>14}")
+    for case, elapsed in results:
+        print(f"{case:<28}{elapsed:>10.3f}{args.rows / elapsed:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
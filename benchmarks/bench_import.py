@@ -0,0 +1,90 @@
+"""
+启动耗时基准测试：在全新的子进程中分别测量导入 app.main、执行 lifespan 启动和第一个请求的耗时，
+并检查导入阶段是否有副作用（创建数据库、日志目录，导入 openai）
+
+用法（在项目根目录执行）:
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# 在子进程中执行，结果以一行 JSON 输出
+CHILD = r"""
+import json, os, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+side_effects = {
+    "openai_imported": "openai" in sys.modules,
+    "database_created": os.path.exists("bench.db"),
+    "logs_dir_created": os.path.exists("logs"),
+}
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    started_up = time.perf_counter()
+    client.get("/api/task/get")
+    first_request = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (started_up - imported) * 1000,
+    "first_request_ms": (first_request - started_up) * 1000,
+    **side_effects,
+}))
+"""
+
+
+def run_once(work_dir: Path) -> dict:
+    for name in ("bench.db", "logs"):
+        path = work_dir / name
+        if path.is_dir():
+            for child in path.iterdir():
+                child.unlink()
+            path.rmdir()
+        elif path.exists():
+            path.unlink()
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(PROJECT_DIR),
+        DATABASE_URL=f"sqlite:///{work_dir / 'bench.db'}",
+        DASHSCOPE_API_KEY=os.getenv("DASHSCOPE_API_KEY", "bench"),
+        DASHSCOPE_BASE_URL="http://127.0.0.1:9/compatible-mode/v1",
+        LOG_LEVEL="WARNING",
+    )
+    # 在临时目录中运行，避免读取项目的 .env 和写入项目目录
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=work_dir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Application import and startup benchmark")
+    parser.add_argument("--runs", type=int, default=10, help="子进程运行次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        # 第一次运行预热文件系统缓存和 .pyc，不计入结果
+        run_once(work_dir)
+        runs = [run_once(work_dir) for _ in range(args.runs)]
+
+    print(f"{'phase':<20}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for phase in ("import_ms", "startup_ms", "first_request_ms"):
+        values = [run[phase] for run in runs]
+        print(f"{phase[:-3]:<20}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+    print()
+    print("导入 app.main 时:")
+    for flag in ("openai_imported", "database_created", "logs_dir_created"):
+        print(f"  {flag:<20}{any(run[flag] for run in runs)}")
+
+
+if __name__ == "__main__":
+    main()
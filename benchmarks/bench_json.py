@@ -0,0 +1,134 @@
+"""
+JSON 编解码基准测试：对比标准库 json 与 orjson
+
+用法（在项目根目录执行）:
+    python -m benchmarks.bench_json
+    python -m benchmarks.bench_json --tasks 50000 --output-mb 100
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from app.models.task_entity import Task, TaskStatus
+from app.utils.json_codec import StdlibJsonCodec, OrjsonCodec, orjson
+
+
+def best_of(func, repeat: int) -> float:
+    """多次运行取最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def build_task_payload(count: int) -> list:
+    """构造与 /api/task/get 响应结构一致的任务列表"""
+    tasks = []
+    for i in range(count):
+        task = Task(
+            id=str(uuid4()),
+            status=TaskStatus.COMPLETED.value,
+            content=f"请总结第 {i} 篇文章的主要观点。" * 5,
+            created_at=datetime.now(),
+            file_id=f"file-batch-{uuid4().hex}",
+            batch_id=f"batch_{uuid4()}",
+            output_file_path=f"results/file-batch_output-{uuid4().hex}",
+            system_prompt="You are a helpful assistant.",
+            result={"id": uuid4().hex, "custom_id": f"request-{uuid4()}", "response": {"status_code": 200}},
+        )
+        tasks.append(task.model_dump(mode="json"))
+    return tasks
+
+
+def write_output_file(path: str, size_mb: int) -> int:
+    """生成指定大小的批处理输出文件，返回行数"""
+    codec = StdlibJsonCodec()
+    target = size_mb * 1024 * 1024
+    written = 0
+    lines = 0
+    with open(path, 'wb') as f:
+        while written < target:
+            line = codec.dumps_bytes({
+                "id": uuid4().hex,
+                "custom_id": f"request-{uuid4()}",
+                "response": {
+                    "status_code": 200,
+                    "request_id": str(uuid4()),
+                    "body": {
+                        "created": 1735660800,
+                        "usage": {"completion_tokens": 256, "prompt_tokens": 42, "total_tokens": 298},
+                        "model": "qwen-turbo",
+                        "id": f"chatcmpl-{uuid4()}",
+                        "choices": [{
+                            "finish_reason": "stop",
+                            "index": 0,
+                            "message": {"content": "这是一段模型生成的回答。" * 40, "role": "assistant"},
+                        }],
+                        "object": "chat.completion",
+                    },
+                },
+                "error": None,
+            }) + b"\n"
+            f.write(line)
+            written += len(line)
+            lines += 1
+    return lines
+
+
+def parse_lines(codec, path: str) -> int:
+    count = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            codec.loads(line)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON codec benchmark")
+    parser.add_argument("--tasks", type=int, default=50000, help="任务列表长度")
+    parser.add_argument("--output-mb", type=int, default=100, help="输出文件大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数")
+    args = parser.parse_args()
+
+    codecs = [StdlibJsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    else:
+        print("orjson 未安装，仅测试标准库 json")
+
+    print(f"构造 {args.tasks} 个任务...")
+    payload = build_task_payload(args.tasks)
+
+    results = []
+    for codec in codecs:
+        elapsed = best_of(lambda: codec.dumps_bytes(payload), args.repeat)
+        results.append((f"task list dumps ({args.tasks})", codec.name, elapsed))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "output.jsonl")
+        print(f"生成 {args.output_mb} MB 输出文件...")
+        lines = write_output_file(path, args.output_mb)
+        for codec in codecs:
+            elapsed = best_of(lambda: parse_lines(codec, path), args.repeat)
+            results.append((f"output file loads ({lines} lines)", codec.name, elapsed))
+
+        with open(path, 'rb') as f:
+            requests = [codecs[0].loads(line) for line, _ in zip(f, range(50000))]
+        for codec in codecs:
+            elapsed = best_of(lambda: [codec.dumps(r) for r in requests], args.repeat)
+            results.append((f"jsonl line dumps ({len(requests)})", codec.name, elapsed))
+
+    print()
+    print(f"{'case':<40}{'backend':<10}{'seconds':>10}")
+    for case, backend, elapsed in results:
+        print(f"{case:<40}{backend:<10}{elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()